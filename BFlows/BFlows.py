@@ -22,6 +22,7 @@ from ryu.controller import ofp_event
 from ryu.controller.handler import MAIN_DISPATCHER, DEAD_DISPATCHER
 from ryu.controller.handler import set_ev_cls
 from ryu.ofproto import ofproto_v1_3
+from ryu.lib import hub
 from ryu.lib.packet import packet
 from ryu.lib.packet import ethernet
 from ryu.lib.packet import arp
@@ -29,6 +30,8 @@ from ryu.lib.packet import ipv4
 from ryu.lib.packet import tcp
 from ryu.lib.packet import udp
 
+import time
+
 import network_awareness
 import network_monitor
 import setting
@@ -58,6 +61,11 @@ class ShortestForwarding(app_manager.RyuApp):
 		self.awareness = kwargs["network_awareness"]
 		self.monitor = kwargs["network_monitor"]
 		self.datapaths = {}
+		self.installing = {}   # {(dpid, barrier_xid):install,}
+		self.install_latency = {}   # {(dpid1, dpid2, ...):latency of the latest installation,}
+		self.inflight_flows = {}   # {(src_dpid,)+flow_info:(expire_time, install),}
+		self.inflight_purge_time = 0
+		self.suppressed_packet_ins = 0
 		self.weight = self.WEIGHT_MODEL[CONF.weight]
 
 	@set_ev_cls(ofp_event.EventOFPStateChange, [MAIN_DISPATCHER, DEAD_DISPATCHER])
@@ -99,6 +107,14 @@ class ShortestForwarding(app_manager.RyuApp):
 		"""
 			Send a flow entry to datapath.
 		"""
+		mod = self._build_flow_mod(dp, priority, match, actions,
+								   idle_timeout=idle_timeout, hard_timeout=hard_timeout)
+		dp.send_msg(mod)
+
+	def _build_flow_mod(self, dp, priority, match, actions, idle_timeout=0, hard_timeout=0):
+		"""
+			Build flow mod object.
+		"""
 		ofproto = dp.ofproto
 		parser = dp.ofproto_parser
 		inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, actions)]
@@ -106,7 +122,21 @@ class ShortestForwarding(app_manager.RyuApp):
 								idle_timeout=idle_timeout,
 								hard_timeout=hard_timeout,
 								match=match, instructions=inst)
-		dp.send_msg(mod)
+		return mod
+
+	def send_msgs(self, datapath, msgs):
+		"""
+			Send messages to datapath in a single write, followed by a
+			barrier request. Return the xid of the barrier request.
+		"""
+		msgs = msgs + [datapath.ofproto_parser.OFPBarrierRequest(datapath)]
+		buf = bytearray()
+		for msg in msgs:
+			datapath.set_xid(msg)
+			msg.serialize()
+			buf += msg.buf
+		datapath.send(buf)
+		return msgs[-1].xid
 
 	def _build_packet_out(self, datapath, buffer_id, src_port, dst_port, data):
 		"""
@@ -140,13 +170,13 @@ class ShortestForwarding(app_manager.RyuApp):
 		"""
 			Get access port of dst host.
 			access_table = {(sw,port):(ip, mac),}
+			Use the IP address only, not the MAC address, and look it up
+			in the reverse index of access_table kept by network awareness.
 		"""
 		if access_table:
-			if isinstance(access_table.values()[0], tuple):
-				for key in access_table.keys():
-					if dst_ip == access_table[key][0]:   # Use the IP address only, not the MAC address. (hmc)
-						dst_port = key[1]
-						return dst_port
+			location = self.awareness.ip_to_location.get(dst_ip)
+			if location:
+				return location[1]
 		return None
 
 	def get_port_pair_from_link(self, link_to_port, src_dpid, dst_dpid):
@@ -172,7 +202,7 @@ class ShortestForwarding(app_manager.RyuApp):
 
 		for dpid in self.awareness.access_ports:
 			for port in self.awareness.access_ports[dpid]:
-				if (dpid, port) not in self.awareness.access_table.keys():
+				if (dpid, port) not in self.awareness.access_table:
 					datapath = self.datapaths[dpid]
 					out = self._build_packet_out(
 						datapath, ofproto.OFP_NO_BUFFER,
@@ -215,17 +245,9 @@ class ShortestForwarding(app_manager.RyuApp):
 		if weight == self.WEIGHT_MODEL['hop']:
 			return shortest_paths.get(src).get(dst)[0]
 		elif weight == self.WEIGHT_MODEL['fnum']:
-			# Because all paths will be calculated when we call self.monitor.get_best_path_by_fnum,
-			# so we just need to call it once in a period, and then, we can get path directly.
-			# If path is existed just return it, else calculate and return it.
-			try:
-				path = self.monitor.best_paths.get(src).get(dst)
-				return path
-			except:
-				result = self.monitor.get_best_path_by_fnum(graph, shortest_paths)
-				paths = result
-				best_path = paths.get(src).get(dst)
-				return best_path
+			# Best path of a pair is calculated only when it is needed, and
+			# network monitor memoizes it until the loads of its links change.
+			return self.monitor.get_best_path(graph, shortest_paths, src, dst)
 		else:
 			pass
 
@@ -252,6 +274,12 @@ class ShortestForwarding(app_manager.RyuApp):
 	def send_flow_mod(self, datapath, flow_info, src_port, dst_port):
 		"""
 			Build flow entry, and send it to datapath.
+		"""
+		datapath.send_msg(self._build_flow_entry(datapath, flow_info, src_port, dst_port))
+
+	def _build_flow_entry(self, datapath, flow_info, src_port, dst_port):
+		"""
+			Build flow mod object of a flow entry.
 			flow_info = (eth_type, src_ip, dst_ip, in_port)
 			or
 			flow_info = (eth_type, src_ip, dst_ip, in_port, ip_proto, Flag, L4_port)
@@ -293,12 +321,17 @@ class ShortestForwarding(app_manager.RyuApp):
 		else:
 			pass
 
-		self.add_flow(datapath, 30, match, actions,
-					  idle_timeout=5, hard_timeout=0)
+		return self._build_flow_mod(datapath, 30, match, actions,
+									idle_timeout=5, hard_timeout=0)
 
 	def install_flow(self, datapaths, link_to_port, path, flow_info, buffer_id, data=None):
 		'''
 			Install flow entries for datapaths.
+			Flow entries are sent in reverse path order, so the first datapath
+			gets its entry at last, and every datapath gets its entries and a
+			barrier request in a single write.
+			The packet is sent out after all the barrier replies arrive,
+			i.e. when the whole path is ready, or after setting.BARRIER_TIMEOUT.
 			path=[dpid1, dpid2, ...]
 			flow_info = (eth_type, src_ip, dst_ip, in_port)
 			or
@@ -310,25 +343,106 @@ class ShortestForwarding(app_manager.RyuApp):
 		in_port = flow_info[3]
 		first_dp = datapaths[path[0]]
 		out_port = first_dp.ofproto.OFPP_LOCAL
+		batches = []   # [(datapath, [flow_mod,]),]
+
+		#  Flow entry for the first datapath.
+		port_pair = self.get_port_pair_from_link(link_to_port, path[0], path[1])
+		if port_pair is None:
+			self.logger.info("Port not found in first hop.")
+			return
+		out_port = port_pair[0]
+		batches.append((first_dp, [self._build_flow_entry(first_dp, flow_info, in_port, out_port)]))
 
-		# Install flow entry for intermediate datapaths.
+		# Flow entries for intermediate datapaths.
 		for i in xrange(1, len(path) - 2):
 			port = self.get_port_pair_from_link(link_to_port, path[i-1], path[i])
 			port_next = self.get_port_pair_from_link(link_to_port, path[i], path[i+1])
 			if port and port_next:
 				src_port, dst_port = port[1], port_next[0]
 				datapath = datapaths[path[i]]
-				self.send_flow_mod(datapath, flow_info, src_port, dst_port)
+				batches.append((datapath, [self._build_flow_entry(datapath, flow_info, src_port, dst_port)]))
+
+		install = {'path': tuple(path), 'start': time.time(), 'barriers': set(),
+				   'first_dp': first_dp, 'out_port': out_port,
+				   'packet_outs': [(first_dp, buffer_id, in_port, out_port, data)]}
+		self.register_inflight((path[0],) + flow_info, install)
+		for datapath, flow_mods in reversed(batches):
+			xid = self.send_msgs(datapath, flow_mods)
+			install['barriers'].add((datapath.id, xid))
+			self.installing[(datapath.id, xid)] = install
+		hub.spawn_after(setting.BARRIER_TIMEOUT, self._install_timeout, install)
+
+	@set_ev_cls(ofp_event.EventOFPBarrierReply, MAIN_DISPATCHER)
+	def _barrier_reply_handler(self, ev):
+		"""
+			Finish the installation of a path when all of its barriers are replied.
+		"""
+		key = (ev.msg.datapath.id, ev.msg.xid)
+		install = self.installing.pop(key, None)
+		if install is None:
+			return
+		install['barriers'].discard(key)
+		if not install['barriers']:
+			self._finish_install(install)
 
-		#  Install flow entry for the first datapath.
-		port_pair = self.get_port_pair_from_link(link_to_port, path[0], path[1])
-		if port_pair is None:
-			self.logger.info("Port not found in first hop.")
+	def _install_timeout(self, install):
+		"""
+			Finish the installation of a path anyway if some barriers are lost.
+		"""
+		if not install['barriers']:
 			return
-		out_port = port_pair[0]
-		self.send_flow_mod(first_dp, flow_info, in_port, out_port)
-		# Send packet_out to the first datapath.
-		self.send_packet_out(first_dp, buffer_id, in_port, out_port, data)
+		self.logger.info("[INSTALL] Barrier timeout on path %s" % (install['path'],))
+		for key in install['barriers']:
+			self.installing.pop(key, None)
+		install['barriers'].clear()
+		self._finish_install(install)
+
+	def _finish_install(self, install):
+		"""
+			Record the install latency of the path, and send packet_out
+			to the first datapath.
+		"""
+		latency = time.time() - install['start']
+		self.install_latency[install['path']] = latency
+		self.logger.debug("[INSTALL] Path %s is ready in %.2f ms" % (install['path'], latency * 1000))
+		for packet_out in install['packet_outs']:
+			self.send_packet_out(*packet_out)
+		install['packet_outs'] = []
+
+	def register_inflight(self, key, install):
+		"""
+			Record the flow whose path is being installed for setting.FLOW_INSTALL_TTL.
+			Expired flows are purged at most once per TTL.
+		"""
+		now = time.time()
+		if now >= self.inflight_purge_time:
+			for _key in [_key for _key, entry in self.inflight_flows.items() if entry[0] < now]:
+				del self.inflight_flows[_key]
+			self.inflight_purge_time = now + setting.FLOW_INSTALL_TTL
+		self.inflight_flows[key] = (now + setting.FLOW_INSTALL_TTL, install)
+
+	def forward_duplicate(self, msg, src_sw, flow_info):
+		"""
+			Forward the packet of a flow whose path is being installed, or has
+			just been installed, by packet_out only, instead of installing the
+			path again. Packets of a path being installed wait for its barriers.
+			Return False if the flow isn't in flight.
+		"""
+		key = (src_sw,) + flow_info
+		entry = self.inflight_flows.get(key)
+		if entry is None:
+			return False
+		if entry[0] < time.time():
+			del self.inflight_flows[key]
+			return False
+		install = entry[1]
+		self.suppressed_packet_ins += 1
+		packet_out = (install['first_dp'], msg.buffer_id, flow_info[3], install['out_port'], msg.data)
+		if install['barriers']:
+			install['packet_outs'].append(packet_out)
+		else:
+			self.send_packet_out(*packet_out)
+		return True
 
 	def get_L4_info(self, tcp_pkt, udp_pkt):
 		"""
@@ -374,8 +488,6 @@ class ShortestForwarding(app_manager.RyuApp):
 		if result:
 			src_sw, dst_sw = result[0], result[1]
 			if dst_sw:
-				# Path has already been calculated, just get it.
-				path = self.get_path(src_sw, dst_sw, weight=self.weight)
 				if setting.enable_Flow_Entry_L4Port:
 					pkt = packet.Packet(msg.data)
 					tcp_pkt = pkt.get_protocol(tcp.tcp)
@@ -389,11 +501,18 @@ class ShortestForwarding(app_manager.RyuApp):
 							L4_Proto = 'UDP'
 						else:
 							pass
-						self.logger.info("[PATH]%s<-->%s(%s Port:%d): %s" % (ip_src, ip_dst, L4_Proto, L4_port, path))
 						flow_info = (eth_type, ip_src, ip_dst, in_port, ip_proto, Flag, L4_port)
 				else:
-					self.logger.info("[PATH]%s<-->%s: %s" % (ip_src, ip_dst, path))
 					flow_info = (eth_type, ip_src, ip_dst, in_port)
+				# The path of this flow is being installed.
+				if self.forward_duplicate(msg, src_sw, flow_info):
+					return
+				# Path has already been calculated, just get it.
+				path = self.get_path(src_sw, dst_sw, weight=self.weight)
+				if len(flow_info) == 7:
+					self.logger.info("[PATH]%s<-->%s(%s Port:%d): %s" % (ip_src, ip_dst, L4_Proto, L4_port, path))
+				else:
+					self.logger.info("[PATH]%s<-->%s: %s" % (ip_src, ip_dst, path))
 				# Install flow entries to datapaths along the path.
 				self.install_flow(self.datapaths,
 								  self.awareness.link_to_port,
@@ -17,8 +17,9 @@
 # limitations under the License.
 
 from __future__ import division
-import copy
 from operator import attrgetter
+import time
+import numpy as np
 
 from ryu import cfg
 from ryu.base import app_manager
@@ -30,6 +31,9 @@ from ryu.ofproto import ofproto_v1_3
 from ryu.lib import hub
 
 import setting
+from poll_scheduler import PollScheduler
+from stats_store import StatsStore
+from stats_collector import StatsCollector
 
 
 CONF = cfg.CONF
@@ -45,47 +49,72 @@ class NetworkMonitor(app_manager.RyuApp):
 		super(NetworkMonitor, self).__init__(*args, **kwargs)
 		self.name = 'monitor'
 		self.datapaths = {}
-		self.port_stats = {}
-		self.port_speed = {}
+		self.port_stats = StatsStore(('tx_bytes', 'rx_bytes', 'rx_errors'), 'tx_bytes')   # Port speeds are the rates of tx_bytes.
 		self.stats = {}
 		self.port_features = {}
 		self.flow_num = {}   # self.flow_num = {dpid:{port_no:fnum,},}
 		self.free_bandwidth = {}   # self.free_bandwidth = {dpid:{port_no:free_bw,},} unit:Kbit/s
 		self.awareness = lookup_service_brick('awareness')
 		self.graph = None
-		self.best_paths = None
+		self.best_paths = {}   # Memoized best paths of the current stats epoch, {src:{dst:path,},}
+		self.path_index = None   # Candidate paths encoded into arrays, see create_path_index.
+		self.link_values = None   # (fnum, bandwidth) arrays of links in the current stats epoch.
+		self.link_reference = None   # (fnum, bandwidth) arrays of links when their pairs were last invalidated.
+
+		self.scheduler = PollScheduler(time.time(), setting.MONITOR_PERIOD,
+									   setting.POLL_MIN_INTERVAL, setting.POLL_MAX_INTERVAL,
+									   setting.POLL_CHANGE_THRESHOLD, spread=setting.POLL_SPREAD,
+									   adaptive=True)
+
+		self.collector = StatsCollector(setting.STATS_TIMEOUT)
 
 		# Start to green thread to monitor traffic and calculating
-		# flow number of links respectively.
+		# flow number of links.
 		self.monitor_thread = hub.spawn(self._monitor)
-		self.save_fnum_thread = hub.spawn(self._save_fnum_graph)
 
 	def _monitor(self):
 		"""
 			Main entry method of monitoring traffic.
+			Switches are polled when the scheduler says they are due, and
+			their replies are collected by epochs of MONITOR_PERIOD.
+			Every epoch is handled once, after it has completed.
 		"""
+		epoch_time = self.scheduler.origin
 		while CONF.weight == 'fnum':
-			self.stats['port'] = {}
-			for dp in self.datapaths.values():
-				self.port_features.setdefault(dp.id, {})
-				self._request_stats(dp)
-			# Refresh data.
-			self.best_paths = None
-			hub.sleep(setting.MONITOR_PERIOD)
-			if self.stats['port']:
-				self.show_stat()
-				hub.sleep(1)
-
-	def _save_fnum_graph(self):
+			now = time.time()
+			if now >= epoch_time:
+				self.collector.start_epoch(now)
+				while epoch_time <= now:
+					epoch_time += setting.MONITOR_PERIOD
+			for dpid in self.scheduler.get_due(now):
+				if dpid in self.datapaths:
+					self._request_stats(self.datapaths[dpid], self.scheduler.pop_port_desc(dpid))
+			for epoch in self.collector.pop_completed(now):
+				self._handle_epoch(epoch)
+			hub.sleep(setting.POLL_TICK)
+
+	def _handle_epoch(self, epoch):
 		"""
-			Save flow number data into networkx graph object.
+			Save the stats replies of an epoch, then save flow number
+			and free bandwidth data into networkx graph object.
+			Port stats are saved before flow stats, whatever order the
+			replies arrived in.
 		"""
-		while CONF.weight == 'fnum':
-			self.graph = self.create_fnum_graph(self.flow_num)
-			self.logger.debug("save flow number")
-			self.create_bw_graph(self.graph, self.free_bandwidth)
-			self.logger.debug("save free bandwidth")
-			hub.sleep(setting.MONITOR_PERIOD)
+		if epoch.missing:
+			self.logger.info("Stats epoch %d timed out, missing replies: %s" % (epoch.number, epoch.missing))
+		self.stats = {'port': epoch.snapshot.get('port', {}), 'flow': epoch.snapshot.get('flow', {})}
+		for dpid, body in sorted(self.stats['port'].items()):
+			self._save_port_stats(dpid, body)
+		for dpid, body in sorted(self.stats['flow'].items()):
+			self._save_flow_stats(dpid, body)
+
+		self.graph = self.create_fnum_graph(self.flow_num)
+		self.logger.debug("save flow number")
+		self.create_bw_graph(self.graph, self.free_bandwidth)
+		self.logger.debug("save free bandwidth")
+		self.invalidate_best_paths(self.graph)
+		if self.stats['port']:
+			self.show_stat()
 
 	@set_ev_cls(ofp_event.EventOFPStateChange,
 				[MAIN_DISPATCHER, DEAD_DISPATCHER])
@@ -98,22 +127,43 @@ class NetworkMonitor(app_manager.RyuApp):
 			if not datapath.id in self.datapaths:
 				self.logger.debug('register datapath: %016x', datapath.id)
 				self.datapaths[datapath.id] = datapath
+				self.port_features.setdefault(datapath.id, {})
+				self.scheduler.add(datapath.id, time.time())
 		elif ev.state == DEAD_DISPATCHER:
 			if datapath.id in self.datapaths:
 				self.logger.debug('unregister datapath: %016x', datapath.id)
 				del self.datapaths[datapath.id]
+				self.scheduler.remove(datapath.id)
 		else:
 			pass
 
 	@set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
 	def _flow_stats_reply_handler(self, ev):
+		"""
+			Collect the flow stats reply into its epoch.
+		"""
+		msg = ev.msg
+		self.collector.add_reply(msg.datapath.id, msg.xid, msg.body,
+								 msg.flags & ofproto_v1_3.OFPMPF_REPLY_MORE)
+
+	@set_ev_cls(ofp_event.EventOFPPortStatsReply, MAIN_DISPATCHER)
+	def _port_stats_reply_handler(self, ev):
+		"""
+			Collect the port stats reply into its epoch.
+		"""
+		msg = ev.msg
+		self.collector.add_reply(msg.datapath.id, msg.xid, msg.body,
+								 msg.flags & ofproto_v1_3.OFPMPF_REPLY_MORE)
+
+	def _save_flow_stats(self, dpid, body):
 		"""
 			Calculate flow speed and Save it.
 			Note: table-miss, LLDP and ARP flow entries are not what we need, just filter them.
 		"""
-		body = ev.msg.body
-		dpid = ev.msg.datapath.id
-		self.flow_num.setdefault(dpid, {})
+		# Switches are polled at different intervals, so the flow numbers
+		# of a switch are replaced by every reply, instead of being zeroed
+		# every period.
+		self.flow_num[dpid] = {}
 		for stat in sorted([flow for flow in body if (flow.priority not in [0, 65535])]):
 			# Get flow's speed and record it.
 			duration = self._get_time(stat.duration_sec, stat.duration_nsec)
@@ -124,40 +174,30 @@ class NetworkMonitor(app_manager.RyuApp):
 			if _speed >= 0.05:
 				self._save_fnum(dpid, stat.instructions[0].actions[0].port)
 
-	@set_ev_cls(ofp_event.EventOFPPortStatsReply, MAIN_DISPATCHER)
-	def _port_stats_reply_handler(self, ev):
+	def _save_port_stats(self, dpid, body):
 		"""
 			Save port's stats information into self.port_stats.
 			Calculate port speed and Save it.
-			self.port_stats = {(dpid, port_no):[(tx_bytes, rx_bytes, rx_errors, duration_sec,  duration_nsec),],}
-			self.port_speed = {(dpid, port_no):[speed,],}
+			self.port_stats = StatsStore of (dpid, port_no), fields: (tx_bytes, rx_bytes, rx_errors),
+			whose rates are port speeds. The speeds of all the ports of a reply are calculated at once.
 			Note: The transmit performance and receive performance are independent of a port.
 			We calculate the load of a port only using tx_bytes.
 		"""
-		body = ev.msg.body
-		dpid = ev.msg.datapath.id
-		self.stats['port'][dpid] = body
 		self.free_bandwidth.setdefault(dpid, {})
 
-		for stat in sorted(body, key=attrgetter('port_no')):
-			port_no = stat.port_no
-			if port_no != ofproto_v1_3.OFPP_LOCAL:
-				key = (dpid, port_no)
-				value = (stat.tx_bytes, stat.rx_bytes, stat.rx_errors,
-						 stat.duration_sec, stat.duration_nsec)
-				self._save_stats(self.port_stats, key, value, 5)
-
-				# Get port speed and Save it.
-				pre = 0
-				period = setting.MONITOR_PERIOD
-				tmp = self.port_stats[key]
-				if len(tmp) > 1:
-					# Calculate only the tx_bytes, not the rx_bytes. (hmc)
-					pre = tmp[-2][0]
-					period = self._get_period(tmp[-1][3], tmp[-1][4], tmp[-2][3], tmp[-2][4])
-				speed = self._get_speed(self.port_stats[key][-1][0], pre, period)
-				self._save_stats(self.port_speed, key, speed, 5)
-				self._save_freebandwidth(dpid, port_no, speed)
+		stats = sorted([stat for stat in body if stat.port_no != ofproto_v1_3.OFPP_LOCAL],
+					   key=attrgetter('port_no'))
+		# Calculate only the tx_bytes, not the rx_bytes. (hmc)
+		speeds = self.port_stats.append(
+			[(dpid, stat.port_no) for stat in stats],
+			[(stat.tx_bytes, stat.rx_bytes, stat.rx_errors) for stat in stats],
+			[self._get_time(stat.duration_sec, stat.duration_nsec) for stat in stats],
+			setting.MONITOR_PERIOD)
+		for stat, speed in zip(stats, speeds):
+			self._save_freebandwidth(dpid, stat.port_no, speed)
+
+		# The load of a switch is the total sending rate of its ports. (Kbit/s)
+		self.scheduler.update_load(dpid, speeds.sum() * 8 / 1000.0)
 
 	@set_ev_cls(ofp_event.EventOFPPortDescStatsReply, MAIN_DISPATCHER)
 	def port_desc_stats_reply_handler(self, ev):
@@ -223,101 +263,177 @@ class NetworkMonitor(app_manager.RyuApp):
 		else:
 			print "switch%d: Illeagal port state %s %s" % (dpid, port_no, reason)
 
-	def _request_stats(self, datapath):
+		# Refresh the port descriptions of the switch with its next poll.
+		self.scheduler.request_port_desc(dpid)
+
+	def _request_stats(self, datapath, port_desc=True):
 		"""
-			Sending request msg to datapath
+			Sending request msg to datapath.
+			Port descriptions are requested only if port_desc is True,
+			they don't change unless a port status event arrives.
+			Port and flow stats requests are registered with their xids
+			in the current epoch, so that their replies can be matched.
 		"""
 		self.logger.debug('send stats request: %016x', datapath.id)
 		ofproto = datapath.ofproto
 		parser = datapath.ofproto_parser
-		req = parser.OFPPortDescStatsRequest(datapath, 0)
-		datapath.send_msg(req)
+		if port_desc:
+			req = parser.OFPPortDescStatsRequest(datapath, 0)
+			datapath.send_msg(req)
 		req = parser.OFPPortStatsRequest(datapath, 0, ofproto.OFPP_ANY)
+		datapath.set_xid(req)
+		self.collector.add_request(datapath.id, req.xid, 'port')
 		datapath.send_msg(req)
 		req = parser.OFPFlowStatsRequest(datapath)
+		datapath.set_xid(req)
+		self.collector.add_request(datapath.id, req.xid, 'flow')
 		datapath.send_msg(req)
 
-	def get_max_fnum_of_links(self, graph, path, max_fnum):
+	def create_path_index(self, paths):
 		"""
-			Get flow number of path.
+			Encode the candidate paths into arrays once for a set of paths.
+			links = [(src_dpid,dst_dpid),], the link of every column index.
+			hops = array(paths x max_hops) of link indexes, which is the
+			sparse form of the path-link incidence matrix. Short paths are
+			padded with len(links), a sentinel link which never limits a path.
+			pairs = [(src, dst),], candidate paths of a pair are contiguous
+			rows from offsets[i] to offsets[i+1].
 		"""
-		_len = len(path)
-		if _len > 1:
-			max_flownum = max_fnum
-			for i in xrange(_len-1):
-				pre, curr = path[i], path[i+1]
-				if 'fnum' in graph[pre][curr]:
-					_fnum = graph[pre][curr]['fnum']
-					max_flownum = max(_fnum, max_flownum)
-				else:
+		link_ids = {}
+		rows = []
+		path_list = []
+		pair_of_path = []
+		pairs = []
+		offsets = [0]
+		for src in paths:
+			for dst in paths[src]:
+				if src == dst or not paths[src][dst]:
 					continue
-			return max_flownum
-		else:
-			return max_fnum
-
-	def get_min_bw_of_links(self, graph, path, min_bw):
+				for path in paths[src][dst]:
+					rows.append([link_ids.setdefault((path[i], path[i+1]), len(link_ids))
+								 for i in xrange(len(path) - 1)])
+					path_list.append(path)
+					pair_of_path.append(len(pairs))
+				pairs.append((src, dst))
+				offsets.append(len(rows))
+
+		links = [None] * len(link_ids)
+		for link, i in link_ids.items():
+			links[i] = link
+		width = max([len(row) for row in rows] + [1])
+		hops = np.empty((len(rows), width), dtype=np.int32)
+		hops.fill(len(links))
+		for i, row in enumerate(rows):
+			hops[i, :len(row)] = row
+
+		return {'paths': paths, 'links': links, 'hops': hops,
+				'path_list': path_list, 'pairs': pairs,
+				'pair_ids': dict((pair, i) for i, pair in enumerate(pairs)),
+				'pair_of_path': np.array(pair_of_path, dtype=np.int32),
+				'offsets': np.array(offsets, dtype=np.int32)}
+
+	def get_path_index(self, paths):
 		"""
-			Getting bandwidth of path. Actually, the mininum bandwidth
-			of links is the path's bandwith, because it is the bottleneck of path.
+			Get the encoded candidate paths, and forget everything
+			memoized for the old ones if the paths have changed.
 		"""
-		_len = len(path)
-		if _len > 1:
-			minimal_band_width = min_bw
-			for i in xrange(_len-1):
-				pre, curr = path[i], path[i+1]
-				if 'bandwidth' in graph[pre][curr]:
-					bw = graph[pre][curr]['bandwidth']
-					minimal_band_width = min(bw, minimal_band_width)
-				else:
-					continue
-			return minimal_band_width
-		else:
-			return min_bw
-
-	def get_best_path_by_fnum(self, graph, paths):
+		if self.path_index is None or self.path_index['paths'] is not paths:
+			self.path_index = self.create_path_index(paths)
+			self.best_paths = {}
+			self.link_values = None
+			self.link_reference = None
+		return self.path_index
+
+	def get_link_values(self, graph, links):
 		"""
-			Get best path by comparing paths.
-			Note: This function is called in BFlows module.
+			Get flow number and free bandwidth of links as arrays.
+			The extra last element is the sentinel link for padding.
 		"""
-		best_paths = copy.deepcopy(paths)
-		fnum_of_paths = copy.deepcopy(paths)
+		fnum = np.zeros(len(links) + 1)
+		bandwidth = np.empty(len(links) + 1)
+		bandwidth.fill(setting.MAX_CAPACITY)
+		for i, (src, dst) in enumerate(links):
+			if graph.has_edge(src, dst):
+				attributes = graph[src][dst]
+				fnum[i] = attributes.get('fnum', 0)
+				if attributes.get('bandwidth') is not None:
+					bandwidth[i] = attributes['bandwidth']
+		return fnum, bandwidth
+
+	def get_values_of_paths(self, hops, fnum, bandwidth):
+		"""
+			Get the max flow number and the bottleneck free bandwidth of paths.
+		"""
+		fnum_of_paths = np.maximum(fnum[hops].max(axis=1), 0)
+		bw_of_paths = np.minimum(bandwidth[hops].min(axis=1), setting.MAX_CAPACITY)
+		return fnum_of_paths, bw_of_paths
 
-		# Reset the fnum_of_paths data structure.
-		for src in fnum_of_paths.keys():
-			for dst in fnum_of_paths[src].keys():
-				fnum_of_paths[src][dst] = {}
+	def get_best_path(self, graph, paths, src, dst):
+		"""
+			Get the best path of one pair lazily.
+			The path with the least max flow number of links is the best,
+			ties are broken by the largest bottleneck free bandwidth, and
+			then by the order of candidate paths.
+			The result is memoized in self.best_paths until invalidate_best_paths
+			finds that the links of its candidate paths have changed.
+		"""
+		if src == dst:
+			return [src]
+		index = self.get_path_index(paths)
+		best_path = self.best_paths.get(src, {}).get(dst)
+		if best_path:
+			return best_path
+		pair = index['pair_ids'].get((src, dst))
+		if pair is None:
+			self.logger.info("No candidate path between %s and %s" % (src, dst))
+			return None
+
+		if self.link_values is None:
+			self.link_values = self.get_link_values(graph, index['links'])
+			self.link_reference = (self.link_values[0].copy(), self.link_values[1].copy())
+		fnum, bandwidth = self.link_values
+		start, end = index['offsets'][pair], index['offsets'][pair+1]
+		fnum_of_paths, bw_of_paths = self.get_values_of_paths(index['hops'][start:end], fnum, bandwidth)
+		row = start + np.lexsort((np.arange(end - start), -bw_of_paths, fnum_of_paths))[0]
+
+		best_path = index['path_list'][row]
+		self.best_paths.setdefault(src, {})[dst] = best_path
+		return best_path
+
+	def invalidate_best_paths(self, graph):
+		"""
+			Start a new stats epoch for the memoized best paths.
+			Only the pairs whose candidate paths traverse a link whose flow
+			number or free bandwidth has changed beyond the thresholds since
+			it was last considered are forgotten. The reference values of
+			the other links are kept, so that slow drifts still add up.
+		"""
+		index = self.path_index
+		if index is None or graph is None:
+			return
+		fnum, bandwidth = self.get_link_values(graph, index['links'])
+		self.link_values = (fnum, bandwidth)
+		if self.link_reference is None:
+			self.best_paths = {}
+			self.link_reference = (fnum.copy(), bandwidth.copy())
+			return
 
-		# Calculate the flow number of each path and save it.
-		for src in paths:
-			for dst in paths[src]:
-				if src == dst:
-					best_paths[src][src] = [src]
-				else:
-					for path in paths[src][dst]:
-						max_fnum = 0
-						max_fnum = self.get_max_fnum_of_links(graph, path, max_fnum)
-						fnum_of_paths[src][dst].setdefault(max_fnum, [])
-						fnum_of_paths[src][dst][max_fnum].append(path)
-
-					# Get the least flow number paths and find the lightest-load one of them.
-					min_fnum = min(fnum_of_paths[src][dst].keys())
-					max_bw_of_paths = 0
-					best_path = fnum_of_paths[src][dst][min_fnum][0]
-					for path in fnum_of_paths[src][dst][min_fnum]:
-						min_bw = setting.MAX_CAPACITY
-						min_bw = self.get_min_bw_of_links(graph, path, min_bw)
-						if min_bw > max_bw_of_paths:
-							max_bw_of_paths = min_bw
-							best_path = path
-					best_paths[src][dst] = best_path
-
-		self.best_paths = best_paths
-		return best_paths
-
-	def zero_dictionary(self, fnum_dict):
-		for sw in fnum_dict.keys():
-			for port in fnum_dict[sw].keys():
-				fnum_dict[sw][port] = 0
+		ref_fnum, ref_bandwidth = self.link_reference
+		changed = ((np.abs(fnum - ref_fnum) >= setting.FNUM_CHANGE_THRESHOLD) |
+				   (np.abs(bandwidth - ref_bandwidth) > setting.BW_CHANGE_THRESHOLD))
+		if not changed.any():
+			return
+		ref_fnum[changed] = fnum[changed]
+		ref_bandwidth[changed] = bandwidth[changed]
+
+		dirty_rows = changed[index['hops']].any(axis=1)
+		dirty_pairs = np.unique(index['pair_of_path'][dirty_rows])
+		for pair in dirty_pairs:
+			(src, dst) = index['pairs'][pair]
+			if dst in self.best_paths.get(src, {}):
+				del self.best_paths[src][dst]
+		self.logger.debug("%d links changed, %d pairs invalidated" %
+						  (changed.sum(), len(dirty_pairs)))
 
 	def create_fnum_graph(self, fnum_dict):
 		"""
@@ -345,16 +461,12 @@ class NetworkMonitor(app_manager.RyuApp):
 						graph.add_edge(src_dpid, dst_dpid)
 						graph[src_dpid][dst_dpid]['fnum'] = 0
 			# print 'fnum_dict:', fnum_dict
-			# Zero the flow_num dictionary.
-			self.zero_dictionary(fnum_dict)
 			return graph
 		except:
 			self.logger.info("Create flow number graph exception")
 			if self.awareness is None:
 				self.awareness = lookup_service_brick('awareness')
 			# print 'fnum_dict:', fnum_dict
-			# Zero the flow_num dictionary.
-			self.zero_dictionary(fnum_dict)
 			return self.awareness.graph
 
 	def _save_fnum(self, dpid, port_no):
@@ -415,29 +527,13 @@ class NetworkMonitor(app_manager.RyuApp):
 		else:
 			self.logger.info("Port is Down")
 
-	def _save_stats(self, _dict, key, value, length=5):
-		if key not in _dict:
-			_dict[key] = []
-		_dict[key].append(value)
-		if len(_dict[key]) > length:
-			_dict[key].pop(0)
-
 	def _get_free_bw(self, capacity, speed):
 		# freebw: Kbit/s
 		return max(capacity - speed * 8 / 1000.0, 0)
 
-	def _get_speed(self, now, pre, period):
-		if period:
-			return (now - pre) / (period)
-		else:
-			return 0
-
 	def _get_time(self, sec, nsec):
 		return sec + nsec / 1000000000.0
 
-	def _get_period(self, n_sec, n_nsec, p_sec, p_nsec):
-		return self._get_time(n_sec, n_nsec) - self._get_time(p_sec, p_nsec)
-
 	def show_stat(self):
 		'''
 			Show statistics information.
@@ -463,7 +559,7 @@ class NetworkMonitor(app_manager.RyuApp):
 						stat.rx_packets, stat.rx_bytes,
 						stat.tx_packets, stat.tx_bytes,
 						setting.MAX_CAPACITY,
-						abs(self.port_speed[(dpid, stat.port_no)][-1] * 8),
+						abs(self.port_stats.get_rate((dpid, stat.port_no)) * 8),
 						self.free_bandwidth[dpid][stat.port_no],
 						self.port_features[dpid][stat.port_no][0],
 						self.port_features[dpid][stat.port_no][1]))
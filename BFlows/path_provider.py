@@ -0,0 +1,178 @@
+# Copyright (C) 2016 Huang MaChi at Chongqing University
+# of Posts and Telecommunications, Chongqing, China.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import networkx as nx
+import multiprocessing
+
+
+CORE = 1
+AGGREGATION = 2
+EDGE = 3
+
+_worker = {}   # State of a worker process, set by init_worker.
+
+
+def get_layer(dpid):
+	"""
+		Get the layer of a switch from the dpid scheme of fattree.py.
+		1xxx: core, 2xxx: aggregation, 3xxx: edge, otherwise None.
+	"""
+	name = str(dpid)
+	if len(name) == 4 and name[0] in '123':
+		return int(name[0])
+	return None
+
+
+def create_path_provider(name):
+	"""
+		Create the path provider according to setting.PATH_PROVIDER.
+	"""
+	if name == 'fattree':
+		return FattreePathProvider()
+	return KShortestPathProvider()
+
+
+def init_worker(graph, name, weight, k):
+	"""
+		Initialize a worker process of the pool with the graph, so that
+		the graph is shipped to every worker only once.
+	"""
+	provider = create_path_provider(name)
+	provider.prepare(graph)
+	_worker.update(graph=graph, provider=provider, weight=weight, k=k)
+
+
+def get_paths_from_source(src):
+	"""
+		Get the paths from src to all the other switches in a worker process.
+		result = (src, {dst:[[path],],})
+	"""
+	graph = _worker['graph']
+	provider = _worker['provider']
+	paths = {}
+	for dst in graph.nodes():
+		if dst == src:
+			continue
+		try:
+			paths[dst] = provider.get_paths(graph, src, dst,
+											weight=_worker['weight'], k=_worker['k'])
+		except:
+			paths[dst] = None
+	return (src, paths)
+
+
+def create_pool(graph, name, weight, k, processes):
+	"""
+		Create a process pool for computing paths from source switches.
+	"""
+	return multiprocessing.Pool(processes, init_worker, (graph, name, weight, k))
+
+
+class KShortestPathProvider(object):
+	"""
+		Provide K shortest paths of any graph by Yen's algorithm.
+	"""
+	def prepare(self, graph):
+		"""
+			Called once before the paths of a graph are created.
+		"""
+		pass
+
+	@property
+	def ecmp_only(self):
+		"""
+			Whether all the provided paths of a pair have equal cost.
+		"""
+		return False
+
+	def get_paths(self, graph, src, dst, weight='weight', k=5):
+		"""
+			Creat K shortest paths from src to dst.
+			generator produces lists of simple paths, in order from shortest to longest.
+		"""
+		generator = nx.shortest_simple_paths(graph, source=src, target=dst, weight=weight)
+		shortest_paths = []
+		for path in generator:
+			if k <= 0:
+				break
+			shortest_paths.append(path)
+			k -= 1
+		return shortest_paths
+
+
+class FattreePathProvider(KShortestPathProvider):
+	"""
+		Provide all equal-cost paths of the fat-tree built by fattree.py.
+		Paths between edge switches are enumerated directly from the
+		up-going links of every layer, which costs O(paths) only.
+		Other pairs get all of their shortest paths, and a graph which
+		doesn't follow the fat-tree scheme falls back to K shortest paths.
+	"""
+	def __init__(self):
+		self.is_fattree = False
+
+	def prepare(self, graph):
+		self.is_fattree = self.check_fattree(graph)
+
+	@property
+	def ecmp_only(self):
+		return self.is_fattree
+
+	def check_fattree(self, graph):
+		"""
+			Check that every switch has a fat-tree dpid, and every link
+			connects two adjacent layers.
+		"""
+		for node in graph.nodes():
+			if get_layer(node) is None:
+				return False
+		for (src, dst) in graph.edges():
+			if src != dst and abs(get_layer(src) - get_layer(dst)) != 1:
+				return False
+		return True
+
+	def get_paths(self, graph, src, dst, weight='weight', k=5):
+		if not self.is_fattree:
+			return KShortestPathProvider.get_paths(self, graph, src, dst, weight=weight, k=k)
+		paths = []
+		if get_layer(src) == EDGE and get_layer(dst) == EDGE:
+			paths = self.get_edge_paths(graph, src, dst)
+		if not paths:
+			# Pairs of other layers, or edge switches cut off by failures.
+			paths = [path for path in nx.all_shortest_paths(graph, src, dst)]
+		return paths
+
+	def get_edge_paths(self, graph, src, dst):
+		"""
+			Get the equal-cost paths between two edge switches.
+			In the same pod: [src, agg, dst];
+			in different pods: [src, agg, core, agg, dst].
+		"""
+		src_aggs = self._neighbors(graph, src, AGGREGATION)
+		dst_aggs = set(self._neighbors(graph, dst, AGGREGATION))
+		paths = [[src, agg, dst] for agg in src_aggs
+				 if agg in dst_aggs and graph.has_edge(agg, dst)]
+		if paths:
+			return paths
+		for agg in src_aggs:
+			for core in self._neighbors(graph, agg, CORE):
+				for _agg in self._neighbors(graph, core, AGGREGATION):
+					if _agg in dst_aggs and graph.has_edge(_agg, dst):
+						paths.append([src, agg, core, _agg, dst])
+		return paths
+
+	def _neighbors(self, graph, dpid, layer):
+		return sorted([node for node in graph.successors(dpid) if get_layer(node) == layer])
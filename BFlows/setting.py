@@ -31,3 +31,27 @@ enable_Flow_Entry_L4Port = False   # For including L4 port in the installing flo
 MAX_CAPACITY = 10000   # Max capacity of link. (kbit/s)
 
 get_topology_delay = 30
+
+PATH_PROVIDER = 'ksp'   # For creating candidate paths, 'ksp': K shortest paths, 'fattree': all equal-cost paths of fat-tree.
+
+KSP_PROCESSES = 0   # For computing candidate paths in a process pool, 0 or 1 means serially.
+
+FNUM_CHANGE_THRESHOLD = 1   # For invalidating best paths, change of flow number of a link.
+
+BW_CHANGE_THRESHOLD = 500   # For invalidating best paths, change of free bandwidth of a link. (kbit/s)
+
+BARRIER_TIMEOUT = 1   # For waiting the barrier replies of a path being installed. (s)
+
+FLOW_INSTALL_TTL = 1   # For suppressing duplicate packet_in of a flow whose path is being installed. (s)
+
+POLL_TICK = 0.1   # For checking which switches are due to be polled. (s)
+
+POLL_MIN_INTERVAL = 1   # For polling the switches whose load changes a lot. (s)
+
+POLL_MAX_INTERVAL = 8   # For polling the switches whose load hardly changes. (s)
+
+POLL_CHANGE_THRESHOLD = 500   # For adapting polling intervals, change of the total sending rate of a switch. (kbit/s)
+
+POLL_SPREAD = 1.0   # For staggering the polls of switches, the fraction of MONITOR_PERIOD they are spread over.
+
+STATS_TIMEOUT = 1   # For completing a stats epoch without the replies which are still missing after the next epoch starts. (s)
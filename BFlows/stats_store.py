@@ -0,0 +1,116 @@
+# Copyright (C) 2016 Huang MaChi at Chongqing University
+# of Posts and Telecommunications, Chongqing, China.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+
+
+class StatsStore(object):
+	"""
+		Preallocated ring buffers of the counters of keys, like (dpid, port_no).
+		Every key owns a slot, and every sample of the key is written into
+		the next of its 'depth' positions, overwriting the oldest one.
+		values = array(slots x depth x fields), the counters of samples;
+		times = array(slots x depth), the durations of samples; (s)
+		rates = array(slots x depth), the rate of the rate field at samples;
+		count = array(slots), the number of samples ever saved in slots.
+	"""
+	def __init__(self, fields, rate_field, depth=5, capacity=64):
+		self.fields = list(fields)
+		self.rate_field = self.fields.index(rate_field)
+		self.depth = depth
+		self.slots = {}   # {key:slot,}
+		self.keys = []   # [key,], the key of every slot.
+		self.values = np.zeros((capacity, depth, len(self.fields)))
+		self.times = np.zeros((capacity, depth))
+		self.rates = np.zeros((capacity, depth))
+		self.count = np.zeros(capacity, dtype=np.int64)
+
+	def __contains__(self, key):
+		return key in self.slots
+
+	def _grow(self, capacity):
+		"""
+			Double the buffers until they have room for 'capacity' slots.
+		"""
+		size = len(self.count)
+		while size < capacity:
+			size *= 2
+		if size == len(self.count):
+			return
+		for name in ('values', 'times', 'rates', 'count'):
+			old = getattr(self, name)
+			new = np.zeros((size,) + old.shape[1:], dtype=old.dtype)
+			new[:len(old)] = old
+			setattr(self, name, new)
+
+	def get_slots(self, keys):
+		"""
+			Get the slots of keys, new keys get new slots.
+		"""
+		slots = []
+		for key in keys:
+			slot = self.slots.get(key)
+			if slot is None:
+				slot = self.slots[key] = len(self.keys)
+				self.keys.append(key)
+			slots.append(slot)
+		self._grow(len(self.keys))
+		return np.array(slots, dtype=np.int64)
+
+	def append(self, keys, values, times, default_period):
+		"""
+			Save a sample of every key, and calculate the rates of the
+			rate field since the previous samples, all at once.
+			The rate of the first sample of a key is its counter divided
+			by default_period, and a zero period gives a zero rate.
+			Return the array of rates.
+		"""
+		slots = self.get_slots(keys)
+		if not len(slots):
+			return np.zeros(0)
+		values = np.asarray(values, dtype=np.float64).reshape(len(slots), len(self.fields))
+		times = np.asarray(times, dtype=np.float64)
+		last = self.count[slots] % self.depth
+		prev = (self.count[slots] - 1) % self.depth
+		self.values[slots, last] = values
+		self.times[slots, last] = times
+
+		has_prev = self.count[slots] > 0
+		pre = np.where(has_prev, self.values[slots, prev, self.rate_field], 0)
+		period = np.where(has_prev, times - self.times[slots, prev], default_period)
+		safe_period = np.where(period != 0, period, 1)
+		rates = np.where(period != 0, (values[:, self.rate_field] - pre) / safe_period, 0)
+
+		self.rates[slots, last] = rates
+		self.count[slots] += 1
+		return rates
+
+	def get_rate(self, key):
+		"""
+			Get the latest rate of key.
+		"""
+		slot = self.slots[key]
+		return self.rates[slot, (self.count[slot] - 1) % self.depth]
+
+	def get_history(self, key):
+		"""
+			Get the samples of key, from the oldest to the latest.
+			history = (array(samples x fields), array(samples) of times, array(samples) of rates)
+		"""
+		slot = self.slots[key]
+		count = self.count[slot]
+		order = np.arange(max(count - self.depth, 0), count) % self.depth
+		return (self.values[slot, order], self.times[slot, order], self.rates[slot, order])
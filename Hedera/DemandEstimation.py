@@ -14,89 +14,88 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import numpy as np
 
-def demand_estimation(flows, hostsList):
+
+def demand_estimation(flows, hostsList, tolerance=0, max_iterations=100, printing=True):
 	"""
 		Main function of demand estimation.
+		Flows are encoded into arrays of host indexes, and every step
+		estimates all the sources or all the destinations at once.
+		The estimation stops when no demand changes by more than tolerance,
+		or after max_iterations.
+		The estimated 'demand', 'converged' and 'receiver_limited' are
+		written back into flows.
 	"""
-	M = {}
-	for i in hostsList:
-		M[i] = {}
-		for j in hostsList:
-			M[i][j] = {'demand': 0, 'pre_demand': 0, 'converged': False, 'FlowNumber': 0}
-
-	for flow in flows:
-		M[flow['src']][flow['dst']]['FlowNumber'] += 1
-
-	demandChange = True
-	while demandChange:
-		demandChange = False
-		for src in hostsList:
-			estimate_src(M, flows, src)
-
-		for dst in hostsList:
-			estimate_dst(M, flows, dst)
-
-		for i in hostsList:
-			for j in hostsList:
-				if M[i][j]['pre_demand'] != M[i][j]['demand']:
-					demandChange = True
-					M[i][j]['pre_demand'] = M[i][j]['demand']
-
-	demandsPrinting(M, hostsList)
+	hosts = dict((host, i) for i, host in enumerate(hostsList))
+	hosts_num = len(hostsList)
+	src = np.array([hosts[flow['src']] for flow in flows], dtype=np.int64)
+	dst = np.array([hosts[flow['dst']] for flow in flows], dtype=np.int64)
+	demand = np.array([flow['demand'] for flow in flows], dtype=np.float64)
+	converged = np.array([flow['converged'] for flow in flows], dtype=bool)
+	receiver_limited = np.array([flow['receiver_limited'] for flow in flows], dtype=bool)
+
+	if len(flows):
+		for iteration in xrange(max_iterations):
+			pre_demand = demand.copy()
+			estimate_src(src, demand, converged, hosts_num)
+			estimate_dst(dst, demand, converged, receiver_limited, hosts_num)
+			if np.abs(demand - pre_demand).max() <= tolerance:
+				break
+
+	for i, flow in enumerate(flows):
+		flow['demand'] = float(demand[i])
+		flow['converged'] = bool(converged[i])
+		flow['receiver_limited'] = bool(receiver_limited[i])
+
+	if printing:
+		M = np.zeros((hosts_num, hosts_num))
+		M[src, dst] = demand
+		demandsPrinting(M, hostsList)
 	return flows
 
-def estimate_src(M, flows, src):
-	converged_demand = 0
-	unconverged_num = 0
-	for flow in flows:
-		if flow['src'] == src:
-			if flow['converged']:
-				converged_demand += flow['demand']
-			else:
-				unconverged_num += 1
-
-	if unconverged_num != 0:
-		equal_share = (1.0 - converged_demand) / unconverged_num
-		for flow in flows:
-			if flow['src'] == src and not flow['converged']:
-				M[flow['src']][flow['dst']]['demand'] = equal_share
-				flow['demand'] = equal_share
-
-def estimate_dst(M, flows, dst):
-	total_demand = 0
-	sender_limited_demand = 0
-	receiver_limited_num = 0
-	for flow in flows:
-		if flow['dst'] == dst:
-			flow['receiver_limited'] = True
-			total_demand += flow['demand']
-			receiver_limited_num += 1
-
-	if total_demand <= 1.0:
+def estimate_src(src, demand, converged, hosts_num):
+	"""
+		Share the capacity left by the converged flows of every source
+		equally among its unconverged flows.
+	"""
+	converged_demand = np.bincount(src, weights=demand * converged, minlength=hosts_num)
+	unconverged_num = np.bincount(src, weights=~converged, minlength=hosts_num)
+	unconverged = ~converged
+	owners = src[unconverged]
+	demand[unconverged] = (1.0 - converged_demand[owners]) / unconverged_num[owners]
+
+def estimate_dst(dst, demand, converged, receiver_limited, hosts_num):
+	"""
+		Limit the flows of every oversubscribed destination. Flows below
+		the equal share are sender-limited, and the rest share what they
+		leave equally. All the destinations are iterated together, until
+		no flow of any destination becomes sender-limited.
+	"""
+	receiver_limited[:] = True
+	total_demand = np.bincount(dst, weights=demand, minlength=hosts_num)
+	oversubscribed = total_demand > 1.0
+	if not oversubscribed.any():
 		return
-	else:
-		equal_share = 1.0 / receiver_limited_num
-		flagFlip=True
-		while flagFlip:
-			flagFlip = False
-			receiver_limited_num = 0
-			for flow in flows:
-				if flow['dst'] == dst and flow['receiver_limited']:
-					if flow['demand'] < equal_share:
-						sender_limited_demand += flow['demand']
-						flow['receiver_limited'] = False
-						flagFlip = True
-					else:
-						receiver_limited_num += 1
-			equal_share = (1.0 - sender_limited_demand) / receiver_limited_num
-
-		for flow in flows:
-			if flow['dst'] == dst and flow['receiver_limited']:
-				M[flow['src']][flow['dst']]['demand'] = equal_share
-				M[flow['src']][flow['dst']]['converged'] = True
-				flow['converged'] = True
-				flow['demand'] = equal_share
+	limited = oversubscribed[dst]
+	receiver_limited_num = np.bincount(dst, weights=limited, minlength=hosts_num)
+	sender_limited_demand = np.zeros(hosts_num)
+	equal_share = np.zeros(hosts_num)
+	equal_share[oversubscribed] = 1.0 / receiver_limited_num[oversubscribed]
+	while True:
+		flip = limited & receiver_limited & (demand < equal_share[dst])
+		if not flip.any():
+			break
+		sender_limited_demand += np.bincount(dst, weights=demand * flip, minlength=hosts_num)
+		receiver_limited &= ~flip
+		receiver_limited_num = np.bincount(dst, weights=limited & receiver_limited, minlength=hosts_num)
+		# A destination whose flows have all become sender-limited has no share left to update.
+		active = oversubscribed & (receiver_limited_num > 0)
+		equal_share[active] = (1.0 - sender_limited_demand[active]) / receiver_limited_num[active]
+
+	limited &= receiver_limited
+	demand[limited] = equal_share[dst[limited]]
+	converged[limited] = True
 
 def demandsPrinting(M, hostsList):
 	"""
@@ -108,9 +107,91 @@ def demandsPrinting(M, hostsList):
 		print host,
 	print
 	print  '_' * 140
-	for row in hostsList:
+	for i, row in enumerate(hostsList):
 		print row,'|',
-		for col in hostsList:
-			print '%.2f' % M[row][col]['demand'],
+		for j in xrange(len(hostsList)):
+			print '%.2f' % M[i][j],
 		print
 	print
+
+def get_components(src, dst, hosts_num):
+	"""
+		Label the flows by the connected components of the bipartite graph
+		of their sources and destinations. The demands of the flows of a
+		component never depend on the flows of other components.
+	"""
+	parent = range(2 * hosts_num)
+	def find(x):
+		while parent[x] != x:
+			parent[x] = parent[parent[x]]
+			x = parent[x]
+		return x
+	for s, d in zip(src, dst):
+		a, b = find(s), find(hosts_num + d)
+		if a != b:
+			parent[a] = b
+	return [find(s) for s in src]
+
+
+class DemandEstimator(object):
+	"""
+		Demand estimation warm-started from the last period.
+		The estimated demands depend only on which flows there are, so the
+		results of every connected component of the last period are kept,
+		keyed by its (src, dst) flows. Only the components whose flows
+		have changed are estimated again.
+	"""
+	def __init__(self, tolerance=0, max_iterations=100, printing=True):
+		self.tolerance = tolerance
+		self.max_iterations = max_iterations
+		self.printing = printing
+		self.results = {}   # {((src, dst),):[(demand, converged, receiver_limited),],}
+		self.recomputed = (0, 0)   # (hosts estimated again, hosts of all flows) of the last period.
+
+	def estimate(self, flows, hostsList):
+		"""
+			Estimate the demands of flows, like demand_estimation.
+		"""
+		hosts = dict((host, i) for i, host in enumerate(hostsList))
+		labels = get_components([hosts[flow['src']] for flow in flows],
+								[hosts[flow['dst']] for flow in flows], len(hostsList))
+		members = {}   # {label:[flow index,],}
+		for i, label in enumerate(labels):
+			members.setdefault(label, []).append(i)
+
+		components = {}   # {((src, dst),):[flow index,],}
+		changed = []
+		for indexes in members.values():
+			indexes.sort(key=lambda i: (flows[i]['src'], flows[i]['dst']))
+			key = tuple([(flows[i]['src'], flows[i]['dst']) for i in indexes])
+			components[key] = indexes
+			if key not in self.results:
+				changed.extend(indexes)
+
+		# The changed components are estimated together, they are disjoint anyway.
+		changed_flows = [flows[i] for i in changed]
+		changed_hosts = sorted(set([flow['src'] for flow in changed_flows] +
+								   [flow['dst'] for flow in changed_flows]))
+		if changed_flows:
+			demand_estimation(changed_flows, changed_hosts, tolerance=self.tolerance,
+							  max_iterations=self.max_iterations, printing=False)
+
+		results = {}
+		for key, indexes in components.items():
+			if key in self.results:
+				for i, (demand, converged, receiver_limited) in zip(indexes, self.results[key]):
+					flows[i]['demand'] = demand
+					flows[i]['converged'] = converged
+					flows[i]['receiver_limited'] = receiver_limited
+			results[key] = [(flows[i]['demand'], flows[i]['converged'], flows[i]['receiver_limited'])
+							for i in indexes]
+		self.results = results
+		self.recomputed = (len(changed_hosts),
+						   len(set([flow['src'] for flow in flows] + [flow['dst'] for flow in flows])))
+
+		if self.printing:
+			M = np.zeros((len(hostsList), len(hostsList)))
+			for flow in flows:
+				M[hosts[flow['src']]][hosts[flow['dst']]] = flow['demand']
+			demandsPrinting(M, hostsList)
+		return flows
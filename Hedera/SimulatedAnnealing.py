@@ -0,0 +1,154 @@
+# Copyright (C) 2016 Huang MaChi at Chongqing University
+# of Posts and Telecommunications, Chongqing, China.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+import random
+import time
+
+
+class SimulatedAnnealing(object):
+	"""
+		Hedera Simulated Annealing.
+		Every destination host is assigned a core switch, and all the flows
+		to the host take their paths through that core. The energy of an
+		assignment is the total demand exceeding the capacity of links.
+		A neighbour assignment moves one host to another core switch.
+		The search stops after max_iterations, after time_budget seconds or
+		when no demand exceeds the capacity, and the next period starts from
+		the assignment of the last one. With a time_budget or max_iterations
+		of 0, the starting assignment is taken without any search.
+		The temperature falls linearly from initial_temperature to 0 over
+		the budget, whichever of the iterations and the time runs out first,
+		so that a short budget is not spent at a high temperature only.
+	"""
+	def __init__(self, time_budget=0.1, max_iterations=10000, initial_temperature=0.5, seed=None):
+		self.time_budget = time_budget
+		self.max_iterations = max_iterations
+		self.initial_temperature = initial_temperature
+		self.random = random.Random(seed)
+		self.assignment = {}   # {dst host:core,} of the last period.
+		self.energy = 0.0   # Energy of the last assignment.
+		self.iterations = 0   # Iterations of the last period.
+
+	def schedule(self, flows, options, capacity):
+		"""
+			Assign core switches to the destination hosts of flows.
+			flows = [(dst, demand),]
+			options = [{core:[link,],},], the links of the path of every flow through every core.
+			capacity = {link:free capacity,}, links not in it have no capacity.
+			Only the cores which all the flows of a host can go through are
+			allowed for the host, hosts without any allowed core are left out.
+			Return the assignment {dst host:core,}.
+		"""
+		start = time.time()
+		self.flows = flows
+		self.options = options
+		self.capacity = capacity
+		self.flows_of = {}   # {dst host:[flow index,],}
+		for i, (dst, demand) in enumerate(flows):
+			self.flows_of.setdefault(dst, []).append(i)
+		allowed = {}   # {dst host:[core,],}
+		for dst, indexes in self.flows_of.items():
+			cores = set(options[indexes[0]].keys())
+			for i in indexes[1:]:
+				cores &= set(options[i].keys())
+			if cores:
+				allowed[dst] = sorted(cores)
+
+		# Start from the assignment of the last period. New hosts are
+		# assigned greedily, the largest demand first, to the core which
+		# adds the least excess demand.
+		assignment = {}
+		self.loads = {}
+		new_hosts = []
+		for dst in sorted(allowed.keys()):
+			if self.assignment.get(dst) in allowed[dst]:
+				self._assign(assignment, dst, self.assignment[dst])
+			else:
+				new_hosts.append(dst)
+		new_hosts.sort(key=lambda dst: -sum([flows[i][1] for i in self.flows_of[dst]]))
+		for dst in new_hosts:
+			cores = self.random.sample(allowed[dst], len(allowed[dst]))
+			self._assign(assignment, dst, min(cores, key=lambda core: self._get_delta(
+				self._get_changes(dst, None, core))))
+		energy = sum([self._get_excess(link, load) for link, load in self.loads.items()])
+
+		best, best_energy = dict(assignment), energy
+		movable = [dst for dst in sorted(allowed.keys()) if len(allowed[dst]) > 1]
+		iterations = 0
+		if self.time_budget <= 0 or self.max_iterations <= 0:
+			movable = []
+		while movable and best_energy > 1e-9:
+			progress = max(iterations / float(self.max_iterations), (time.time() - start) / self.time_budget)
+			if progress >= 1:
+				break
+			temperature = self.initial_temperature * (1 - progress)
+			iterations += 1
+			dst = self.random.choice(movable)
+			core = self.random.choice([core for core in allowed[dst] if core != assignment[dst]])
+			changes = self._get_changes(dst, assignment[dst], core)
+			delta = self._get_delta(changes)
+			# At the temperature 0 only the moves which do not raise the energy are taken.
+			if delta <= 0 or (temperature > 0 and self.random.random() < math.exp(-delta / temperature)):
+				self._assign(assignment, dst, core, changes)
+				energy += delta
+				if energy < best_energy - 1e-9:
+					best, best_energy = dict(assignment), energy
+
+		# Recalculate the loads of the best assignment, the last one may be worse.
+		self.loads = {}
+		for dst, core in best.items():
+			self._assign({}, dst, core)
+		self.assignment = best
+		self.energy = sum([self._get_excess(link, load) for link, load in self.loads.items()])
+		self.iterations = iterations
+		return best
+
+	def _get_changes(self, dst, old_core, new_core):
+		"""
+			Get the changes of link loads when the flows to dst move from
+			old_core to new_core. changes = {link:demand,}
+		"""
+		changes = {}
+		for i in self.flows_of[dst]:
+			demand = self.flows[i][1]
+			if old_core is not None:
+				for link in self.options[i][old_core]:
+					changes[link] = changes.get(link, 0) - demand
+			for link in self.options[i][new_core]:
+				changes[link] = changes.get(link, 0) + demand
+		return changes
+
+	def _assign(self, assignment, dst, core, changes=None):
+		"""
+			Assign core to dst, and update the link loads.
+		"""
+		if changes is None:
+			changes = self._get_changes(dst, assignment.get(dst), core)
+		assignment[dst] = core
+		for link, change in changes.items():
+			self.loads[link] = self.loads.get(link, 0) + change
+
+	def _get_delta(self, changes):
+		"""
+			Get the change of energy if the link loads change.
+		"""
+		return sum([self._get_excess(link, self.loads.get(link, 0) + change) -
+					self._get_excess(link, self.loads.get(link, 0))
+					for link, change in changes.items()])
+
+	def _get_excess(self, link, load):
+		return max(load - self.capacity.get(link, 0), 0)
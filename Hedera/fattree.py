@@ -28,13 +28,16 @@ import logging
 import argparse
 import time
 import signal
-from subprocess import Popen
+from subprocess import Popen, PIPE, STDOUT
 from multiprocessing import Process
 
 import sys
 parentdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, parentdir)
 import iperf_peers
+import ovs_utils
+import readiness
+import net_sampler
 
 
 parser = argparse.ArgumentParser(description="Parameters importation")
@@ -42,6 +45,12 @@ parser.add_argument('--k', dest='k', type=int, default=4, choices=[4, 8], help="
 parser.add_argument('--duration', dest='duration', type=int, default=60, help="Duration (sec) for each iperf traffic generation")
 parser.add_argument('--dir', dest='output_dir', help="Directory to store outputs")
 parser.add_argument('--cpu', dest='cpu', type=float, default=1.0, help='Total CPU to allocate to hosts')
+parser.add_argument('--rules_dir', dest='rules_dir', default=None, help="Directory to keep the generated proactive rules for inspection")
+parser.add_argument('--ip', dest='ip', default="192.168.56.101", help="IP address of the controller")
+parser.add_argument('--port', dest='port', type=int, default=6653, help="OpenFlow port of the controller")
+parser.add_argument('--peers', dest='peers', default=None, help="File of iperf peers created by create_peers.py, iperf_peers.py by default")
+parser.add_argument('--monitor', dest='monitor', default='sampler', choices=['sampler', 'bwm-ng'], help="Tool to monitor the throughput of switches")
+parser.add_argument('--interval', dest='interval', type=float, default=1.0, help="Interval (sec) of monitoring throughput")
 args = parser.parse_args()
 
 
@@ -137,14 +146,10 @@ class Fattree(Topo):
 		"""
 			Set the OpenFlow version for switches.
 		"""
-		self._set_ovs_protocol_13(self.CoreSwitchList)
-		self._set_ovs_protocol_13(self.AggSwitchList)
-		self._set_ovs_protocol_13(self.EdgeSwitchList)
+		self._set_ovs_protocol_13(self.CoreSwitchList + self.AggSwitchList + self.EdgeSwitchList)
 
 	def _set_ovs_protocol_13(self, sw_list):
-		for sw in sw_list:
-			cmd = "sudo ovs-vsctl set bridge %s protocols=OpenFlow13" % sw
-			os.system(cmd)
+		ovs_utils.set_bridges_protocol(sw_list, 'OpenFlow13')
 
 
 def set_host_ip(net, topo):
@@ -192,47 +197,33 @@ def install_proactive(net, topo):
 	"""
 		Install proactive flow entries for switches.
 	"""
+	rules = ovs_utils.RuleSet()
 	# Edge Switch
 	for sw in topo.EdgeSwitchList:
 		num = int(sw[-2:])
 
 		# Downstream
 		for i in xrange(1, topo.density+1):
-			cmd = "ovs-ofctl add-flow %s -O OpenFlow13 \
-				'table=0,idle_timeout=0,hard_timeout=0,priority=10,arp, \
-				nw_dst=10.%d.0.%d,actions=output:%d'" % (sw, num, i, topo.pod/2+i)
-			os.system(cmd)
-			cmd = "ovs-ofctl add-flow %s -O OpenFlow13 \
-				'table=0,idle_timeout=0,hard_timeout=0,priority=10,ip, \
-				nw_dst=10.%d.0.%d,actions=output:%d'" % (sw, num, i, topo.pod/2+i)
-			os.system(cmd)
+			rules.add_flow(sw, "table=0,idle_timeout=0,hard_timeout=0,priority=10,arp,nw_dst=10.%d.0.%d,actions=output:%d" % (num, i, topo.pod/2+i))
+			rules.add_flow(sw, "table=0,idle_timeout=0,hard_timeout=0,priority=10,ip,nw_dst=10.%d.0.%d,actions=output:%d" % (num, i, topo.pod/2+i))
 
 		# Upstream
 		# Install group entries.
 		if topo.pod == 4:
-			cmd = "ovs-ofctl add-group %s -O OpenFlow13 \
-			'group_id=1,type=select,bucket=output:1,bucket=output:2'" % sw
+			group = "group_id=1,type=select,bucket=output:1,bucket=output:2"
 		elif topo.pod == 8:
-			cmd = "ovs-ofctl add-group %s -O OpenFlow13 \
-			'group_id=1,type=select,bucket=output:1,bucket=output:2,\
-			bucket=output:3,bucket=output:4'" % sw
+			group = "group_id=1,type=select,bucket=output:1,bucket=output:2,bucket=output:3,bucket=output:4"
 		else:
 			pass
-		os.system(cmd)
+		rules.add_group(sw, group)
 		# Install flow entries.
 		Edge_List = [i for i in xrange(1, 1 + topo.pod ** 2 / 2)]
 		for i in Edge_List:
 			if i != num:
 				for j in xrange(1, topo.pod / 2 + 1):
 					for k in xrange(1, topo.pod / 2 + 1):
-						cmd = "ovs-ofctl add-flow %s -O OpenFlow13 \
-						'table=0,idle_timeout=0,hard_timeout=0,priority=10,arp,\
-						nw_src=10.%d.0.%d,nw_dst=10.%d.0.%d,actions=group:1'" % (sw, num, j, i, k)
-						os.system(cmd)
-						cmd = "ovs-ofctl add-flow %s -O OpenFlow13 \
-						'table=0,idle_timeout=0,hard_timeout=0,priority=10,ip,\
-						nw_src=10.%d.0.%d,nw_dst=10.%d.0.%d,actions=group:1'" % (sw, num, j, i, k)
-						os.system(cmd)
+						rules.add_flow(sw, "table=0,idle_timeout=0,hard_timeout=0,priority=10,arp,nw_src=10.%d.0.%d,nw_dst=10.%d.0.%d,actions=group:1" % (num, j, i, k))
+						rules.add_flow(sw, "table=0,idle_timeout=0,hard_timeout=0,priority=10,ip,nw_src=10.%d.0.%d,nw_dst=10.%d.0.%d,actions=group:1" % (num, j, i, k))
 
 	# Aggregate Switch
 	for sw in topo.AggSwitchList:
@@ -242,52 +233,35 @@ def install_proactive(net, topo):
 		# Downstream
 		k = 1
 		for i in subnetList:
-			cmd = "ovs-ofctl add-flow %s -O OpenFlow13 \
-				'table=0,idle_timeout=0,hard_timeout=0,priority=10,arp, \
-				nw_dst=10.%d.0.0/16, actions=output:%d'" % (sw, i, topo.pod/2+k)
-			os.system(cmd)
-			cmd = "ovs-ofctl add-flow %s -O OpenFlow13 \
-				'table=0,idle_timeout=0,hard_timeout=0,priority=10,ip, \
-				nw_dst=10.%d.0.0/16, actions=output:%d'" % (sw, i, topo.pod/2+k)
-			os.system(cmd)
+			rules.add_flow(sw, "table=0,idle_timeout=0,hard_timeout=0,priority=10,arp,nw_dst=10.%d.0.0/16,actions=output:%d" % (i, topo.pod/2+k))
+			rules.add_flow(sw, "table=0,idle_timeout=0,hard_timeout=0,priority=10,ip,nw_dst=10.%d.0.0/16,actions=output:%d" % (i, topo.pod/2+k))
 			k += 1
 
 		# Upstream
 		if topo.pod == 4:
-			cmd = "ovs-ofctl add-group %s -O OpenFlow13 \
-			'group_id=1,type=select,bucket=output:1,bucket=output:2'" % sw
+			group = "group_id=1,type=select,bucket=output:1,bucket=output:2"
 		elif topo.pod == 8:
-			cmd = "ovs-ofctl add-group %s -O OpenFlow13 \
-			'group_id=1,type=select,bucket=output:1,bucket=output:2,\
-			bucket=output:3,bucket=output:4'" % sw
+			group = "group_id=1,type=select,bucket=output:1,bucket=output:2,bucket=output:3,bucket=output:4"
 		else:
 			pass
-		os.system(cmd)
-		cmd = "ovs-ofctl add-flow %s -O OpenFlow13 \
-		'table=0,priority=10,arp,actions=group:1'" % sw
-		os.system(cmd)
-		cmd = "ovs-ofctl add-flow %s -O OpenFlow13 \
-		'table=0,priority=10,ip,actions=group:1'" % sw
-		os.system(cmd)
+		rules.add_group(sw, group)
+		rules.add_flow(sw, "table=0,priority=10,arp,actions=group:1")
+		rules.add_flow(sw, "table=0,priority=10,ip,actions=group:1")
 
 	# Core Switch
 	for sw in topo.CoreSwitchList:
 		j = 1
 		k = 1
 		for i in xrange(1, len(topo.EdgeSwitchList)+1):
-			cmd = "ovs-ofctl add-flow %s -O OpenFlow13 \
-				'table=0,idle_timeout=0,hard_timeout=0,priority=10,arp, \
-				nw_dst=10.%d.0.0/16, actions=output:%d'" % (sw, i, j)
-			os.system(cmd)
-			cmd = "ovs-ofctl add-flow %s -O OpenFlow13 \
-				'table=0,idle_timeout=0,hard_timeout=0,priority=10,ip, \
-				nw_dst=10.%d.0.0/16, actions=output:%d'" % (sw, i, j)
-			os.system(cmd)
+			rules.add_flow(sw, "table=0,idle_timeout=0,hard_timeout=0,priority=10,arp,nw_dst=10.%d.0.0/16,actions=output:%d" % (i, j))
+			rules.add_flow(sw, "table=0,idle_timeout=0,hard_timeout=0,priority=10,ip,nw_dst=10.%d.0.0/16,actions=output:%d" % (i, j))
 			k += 1
 			if k == topo.pod/2 + 1:
 				j += 1
 				k = 1
 
+	rules.load(args.rules_dir)
+
 def monitor_devs_ng(fname="./txrate.txt", interval_sec=0.1):
 	"""
 		Use bwm-ng tool to collect interface transmit rate statistics.
@@ -297,6 +271,25 @@ def monitor_devs_ng(fname="./txrate.txt", interval_sec=0.1):
 	cmd = "sleep 1; bwm-ng -t %s -o csv -u bits -T rate -C ',' > %s" %  (interval_sec * 1000, fname)
 	Popen(cmd, shell=True).wait()
 
+def monitor_devs(fname="./txrate.txt", interval_sec=1.0):
+	"""
+		Sample the counters of switches' interfaces from /proc/net/dev.
+		The output is a reduced bwm-ng csv, which plot_results.py reads as well.
+	"""
+	time.sleep(1)
+	net_sampler.sample(fname, interval_sec)
+
+def get_peers():
+	"""
+		Get the iperf peers from the file given by --peers,
+		or from iperf_peers.py in the top directory by default.
+	"""
+	if args.peers:
+		namespace = {}
+		execfile(args.peers, namespace)
+		return namespace['iperf_peers']
+	return iperf_peers.iperf_peers
+
 def traffic_generation(net, topo, flows_peers):
 	"""
 		Generate traffics and test the performance of the network.
@@ -310,22 +303,29 @@ def traffic_generation(net, topo, flows_peers):
 		# server.cmd("iperf -s > %s/%s &" % (args.output_dir, 'server'+filename+'.txt'))
 		server.cmd("iperf -s > /dev/null &" )   # Its statistics is useless, just throw away.
 
-	time.sleep(3)
+	# Wait until the servers are listening, 3 seconds at most.
+	readiness.wait_servers([net.get(server) for server in serversList], timeout=3)
 
 	# Start the clients.
+	connections = {}   # {(src, dest):number of flows,}
 	for src, dest in flows_peers:
 		server = net.get(dest)
 		client = net.get(src)
 		# filename = src[1:]
 		# client.cmd("iperf -c %s -t %d > %s/%s &" % (server.IP(), args.duration, args.output_dir, 'client'+filename+'.txt'))
 		client.cmd("iperf -c %s -t %d > /dev/null &" % (server.IP(), 1990))   # Its statistics is useless, just throw away. 1990 just means a great number.
-		time.sleep(2)
+		# Wait until the flow has been set up, 2 seconds at most.
+		connections[(src, dest)] = connections.get((src, dest), 0) + 1
+		readiness.wait_connected(client, server.IP(), connections[(src, dest)], timeout=2)
 
-	# Wait for the traffic to become stable.
-	time.sleep(10)
+	# Wait for the traffic to become stable, 10 seconds at most.
+	readiness.wait_rates_stable(timeout=10)
 
-	# 2. Start bwm-ng to monitor throughput.
-	monitor = Process(target = monitor_devs_ng, args = ('%s/bwmng.txt' % args.output_dir, 1.0))
+	# 2. Start bwm-ng or the sampler to monitor throughput.
+	if args.monitor == 'bwm-ng':
+		monitor = Process(target = monitor_devs_ng, args = ('%s/bwmng.txt' % args.output_dir, args.interval))
+	else:
+		monitor = Process(target = monitor_devs, args = ('%s/bwmng.txt' % args.output_dir, args.interval))
 	monitor.start()
 
 	# 3. The experiment is going on.
@@ -367,13 +367,15 @@ def run_experiment(pod, density, ip="192.168.56.101", port=6653, bw_c2a=10, bw_a
 	# k_paths = args.k ** 2 / 8   # We should utilize more paths.
 	k_paths = args.k ** 2 * 3 / 4
 	fanout = args.k
-	Controller_Ryu = Popen("ryu-manager --observe-links ./Hedera/Hedera.py --k_paths=%d --weight=hop --fanout=%d" % (k_paths, fanout), shell=True, preexec_fn=os.setsid)
+	Controller_Ryu = Popen("ryu-manager --observe-links ./Hedera/Hedera.py --k_paths=%d --weight=hop --fanout=%d --ofp-tcp-listen-port=%d" % (k_paths, fanout, port), shell=True, stdout=PIPE, stderr=STDOUT, preexec_fn=os.setsid)
+	controller = readiness.ControllerWatcher(Controller_Ryu)
 
-	# Wait until the controller has discovered network topology.
-	time.sleep(60)
+	# Wait until the controller has discovered network topology, 60 seconds at most.
+	switches = topo.CoreSwitchList + topo.AggSwitchList + topo.EdgeSwitchList
+	controller.wait_topology(len(switches), readiness.get_switch_links(topo), timeout=60)
 
 	# 3. Generate traffics and test the performance of the network.
-	traffic_generation(net, topo, iperf_peers.iperf_peers)
+	traffic_generation(net, topo, get_peers())
 
 	# Stop the controller.
 	os.killpg(Controller_Ryu.pid, signal.SIGKILL)
@@ -387,4 +389,4 @@ if __name__ == '__main__':
 		logging.warning("You are NOT root!")
 	elif os.getuid() == 0:
 		# run_experiment(4, 2) or run_experiment(8, 4)
-		run_experiment(args.k, args.k/2)
+		run_experiment(args.k, args.k/2, ip=args.ip, port=args.port)
@@ -36,6 +36,7 @@ from ryu.topology import event
 from ryu.topology.api import get_switch, get_link
 
 import setting
+import path_provider
 
 
 CONF = cfg.CONF
@@ -68,7 +69,13 @@ class NetworkAwareness(app_manager.RyuApp):
 		self.shortest_paths = {}        # {dpid:{dpid:[[path],],},}
 		self.pre_link_to_port = {}
 		self.pre_access_table = {}
+		self.path_cache_key = None          # ((k, ecmp_only), frozenset(dpid,), frozenset((src_dpid,dst_dpid),))
+		self.link_to_pairs = {}               # {(src_dpid,dst_dpid):set((src,dst),),}
+		self.path_provider = path_provider.create_path_provider(setting.PATH_PROVIDER)
+		self.ip_to_location = {}             # {ip:(sw,port),}
 		self.access_table = self.create_access_table(CONF.fanout)   # {(sw,port):(ip, mac),}
+		for location, host in self.access_table.items():
+			self.update_host_index(location, None, host)
 
 		# Directed graph can record the loading condition of links more accurately.
 		# self.graph = nx.Graph()
@@ -160,19 +167,36 @@ class NetworkAwareness(app_manager.RyuApp):
 		self.create_interior_links(links)
 		self.create_access_ports()
 		self.graph = self.get_graph(self.link_to_port.keys())
-		self.shortest_paths = self.all_k_shortest_paths(
+		self.shortest_paths = self.update_k_shortest_paths(
 			self.graph, weight='weight', k=CONF.k_paths)
+		# fattree.py waits for this report before generating traffics.
+		pairs = sum([len([dst for dst, paths in dsts.items() if dst != src and paths])
+					 for src, dsts in self.shortest_paths.items()])
+		self.logger.info("[TOPOLOGY READY] switches=%d links=%d pairs=%d" % (
+			len(self.switches), len([link for link in self.link_to_port if link[0] != link[1]]), pairs))
 
 	def get_host_location(self, host_ip):
 		"""
 			Get host location info ((datapath, port)) according to the host ip.
-			self.access_table = {(sw,port):(ip, mac),}
+			self.ip_to_location = {ip:(sw,port),}
+		"""
+		location = self.ip_to_location.get(host_ip)
+		if location is None:
+			self.logger.info("%s location is not found." % host_ip)
+		return location
+
+	def update_host_index(self, location, old_host, new_host):
 		"""
-		for key in self.access_table.keys():
-			if self.access_table[key][0] == host_ip:
-				return key
-		self.logger.info("%s location is not found." % host_ip)
-		return None
+			Keep the reverse index of access_table consistent with it.
+			old_host and new_host are the (ip, mac) of location, or None.
+		"""
+		if old_host:
+			(ip, mac) = old_host
+			if self.ip_to_location.get(ip) == location:
+				del self.ip_to_location[ip]
+		if new_host:
+			(ip, mac) = new_host
+			self.ip_to_location[ip] = location
 
 	def get_graph(self, link_list):
 		"""
@@ -248,18 +272,12 @@ class NetworkAwareness(app_manager.RyuApp):
 
 	def k_shortest_paths(self, graph, src, dst, weight='weight', k=5):
 		"""
-			Creat K shortest paths from src to dst.
-			generator produces lists of simple paths, in order from shortest to longest.
+			Creat K shortest paths from src to dst by the path provider.
+			KShortestPathProvider produces lists of simple paths, in order from shortest to longest,
+			FattreePathProvider produces all the equal-cost paths of fat-tree.
 		"""
-		generator = nx.shortest_simple_paths(graph, source=src, target=dst, weight=weight)
-		shortest_paths = []
 		try:
-			for path in generator:
-				if k <= 0:
-					break
-				shortest_paths.append(path)
-				k -= 1
-			return shortest_paths
+			return self.path_provider.get_paths(graph, src, dst, weight=weight, k=k)
 		except:
 			self.logger.debug("No path between %s and %s" % (src, dst))
 
@@ -269,7 +287,14 @@ class NetworkAwareness(app_manager.RyuApp):
 			Note: We get shortest paths for bandwidth-sensitive
 			traffic from bandwidth-sensitive switches.
 		"""
+		if setting.KSP_PROCESSES > 1:
+			try:
+				return self.parallel_k_shortest_paths(graph, weight=weight, k=k)
+			except Exception:
+				self.logger.info("Parallel KSP exception, computing serially")
+		start = time.time()
 		_graph = graph.copy()
+		self.path_provider.prepare(_graph)
 		paths = {}
 		# Find k shortest paths in graph.
 		for src in _graph.nodes():
@@ -279,6 +304,175 @@ class NetworkAwareness(app_manager.RyuApp):
 					continue
 				paths[src].setdefault(dst, [])
 				paths[src][dst] = self.k_shortest_paths(_graph, src, dst, weight=weight, k=k)
+		self.logger.info("[KSP] %d switches computed serially in %.3fs" %
+						 (len(paths), time.time() - start))
+		return paths
+
+	def parallel_k_shortest_paths(self, graph, weight='weight', k=5):
+		"""
+			Creat all K shortest paths between datapaths in a process pool.
+			Source switches are sharded across the processes, and the green
+			thread keeps yielding while the processes are computing.
+		"""
+		start = time.time()
+		_graph = graph.copy()
+		self.path_provider.prepare(_graph)
+		pool = path_provider.create_pool(_graph, setting.PATH_PROVIDER, weight, k,
+										 setting.KSP_PROCESSES)
+		try:
+			result = pool.map_async(path_provider.get_paths_from_source, _graph.nodes())
+			while not result.ready():
+				hub.sleep(0.1)
+			paths = {}
+			for src, paths_of_src in result.get():
+				paths[src] = paths_of_src
+				paths[src][src] = [[src] for i in xrange(k)]
+		finally:
+			pool.close()
+			pool.join()
+		self.logger.info("[KSP] %d switches computed in %d processes in %.3fs" %
+						 (len(paths), setting.KSP_PROCESSES, time.time() - start))
+		return paths
+
+	def get_topology_fingerprint(self, graph, k):
+		"""
+			Get the fingerprint of the topology which K shortest paths depend on.
+			fingerprint = ((k, ecmp_only), frozenset(dpid,), frozenset((src_dpid,dst_dpid),))
+		"""
+		nodes = frozenset(graph.nodes())
+		links = frozenset([(src, dst) for (src, dst) in graph.edges() if src != dst])
+		return ((k, self.path_provider.ecmp_only), nodes, links)
+
+	def get_path_weight(self, graph, path, weight='weight'):
+		"""
+			Get the total weight of path, infinity if any link of it has gone.
+		"""
+		total = 0
+		for i in xrange(len(path) - 1):
+			if not graph.has_edge(path[i], path[i+1]):
+				return float('inf')
+			total += graph[path[i]][path[i+1]].get(weight, 1)
+		return total
+
+	def index_paths(self, src, dst, paths):
+		"""
+			Record the links traversed by the candidate paths of (src, dst).
+			self.link_to_pairs = {(src_dpid,dst_dpid):set((src,dst),),}
+		"""
+		for path in paths or []:
+			for i in xrange(len(path) - 1):
+				self.link_to_pairs.setdefault((path[i], path[i+1]), set()).add((src, dst))
+
+	def unindex_paths(self, src, dst, paths):
+		"""
+			Forget the links traversed by the candidate paths of (src, dst).
+		"""
+		for path in paths or []:
+			for i in xrange(len(path) - 1):
+				pairs = self.link_to_pairs.get((path[i], path[i+1]))
+				if pairs:
+					pairs.discard((src, dst))
+
+	def get_pairs_affected_by_link(self, graph, paths, link, weight='weight', k=5):
+		"""
+			Get the pairs whose K shortest paths may change because of a new link.
+			A path through link (u, v) weighs at least dist(src, u) + w(u, v) + dist(v, dst),
+			so only the pairs whose bound does not exceed the weight of their K-th
+			candidate path, or which have less than K candidates, are affected.
+			Equal-cost providers never miss a path, so the count doesn't matter for them.
+		"""
+		(u, v) = link
+		to_u = nx.single_source_dijkstra_path_length(graph.reverse(copy=False), u, weight=weight)
+		from_v = nx.single_source_dijkstra_path_length(graph, v, weight=weight)
+		cost = graph[u][v].get(weight, 1)
+		pairs = []
+		for src, dist_src in to_u.items():
+			for dst, dist_dst in from_v.items():
+				if src == dst:
+					continue
+				candidates = paths.get(src, {}).get(dst)
+				if not candidates or (len(candidates) < k and not self.path_provider.ecmp_only):
+					pairs.append((src, dst))
+				elif dist_src + cost + dist_dst <= self.get_path_weight(graph, candidates[-1], weight):
+					pairs.append((src, dst))
+		return pairs
+
+	def update_k_shortest_paths(self, graph, weight='weight', k=5):
+		"""
+			Update all K shortest paths between datapaths incrementally.
+			Paths are cached under the fingerprint of the topology, so that
+			an unchanged topology costs nothing, and only the pairs whose
+			candidate paths traverse an added or removed link are recomputed.
+		"""
+		# The fingerprint and the affected pairs depend on whether the graph is a fat tree.
+		self.path_provider.prepare(graph)
+		fingerprint = self.get_topology_fingerprint(graph, k)
+		if fingerprint == self.path_cache_key:
+			return self.shortest_paths
+
+		if self.path_cache_key is None or self.path_cache_key[0] != fingerprint[0]:
+			return self.rebuild_k_shortest_paths(graph, fingerprint, weight=weight, k=k)
+
+		(_, pre_nodes, pre_links) = self.path_cache_key
+		(_, nodes, links) = fingerprint
+		_graph = graph.copy()
+		dirty = set()
+
+		# Copy the cache, so that consumers can tell the paths have changed by identity.
+		paths = {}
+		for src in self.shortest_paths:
+			if src in nodes:
+				paths[src] = dict(self.shortest_paths[src])
+		for src in paths:
+			for dst in paths[src].keys():
+				if dst not in nodes:
+					self.unindex_paths(src, dst, paths[src].pop(dst))
+		for src in pre_nodes - nodes:
+			for dst in self.shortest_paths.get(src, {}):
+				self.unindex_paths(src, dst, self.shortest_paths[src][dst])
+
+		# Pairs of new switches.
+		for node in nodes - pre_nodes:
+			paths[node] = {node: [[node] for i in xrange(k)]}
+			for other in nodes:
+				if other != node:
+					dirty.add((node, other))
+					dirty.add((other, node))
+
+		# Pairs whose candidate paths traverse a removed link.
+		for link in pre_links - links:
+			dirty.update(self.link_to_pairs.pop(link, set()))
+
+		# Pairs which may find a better path through an added link.
+		for link in links - pre_links:
+			dirty.update(self.get_pairs_affected_by_link(_graph, paths, link, weight=weight, k=k))
+
+		dirty = [(src, dst) for (src, dst) in dirty if src in nodes and dst in nodes and src != dst]
+		total = len(nodes) * (len(nodes) - 1)
+		if len(dirty) * 2 > total:
+			# Most pairs have changed, rebuilding is cheaper.
+			return self.rebuild_k_shortest_paths(graph, fingerprint, weight=weight, k=k)
+
+		for (src, dst) in dirty:
+			self.unindex_paths(src, dst, paths[src].get(dst))
+			paths[src][dst] = self.k_shortest_paths(_graph, src, dst, weight=weight, k=k)
+			self.index_paths(src, dst, paths[src][dst])
+
+		self.path_cache_key = fingerprint
+		self.logger.info("[PATH CACHE] %d of %d switch pairs recomputed" % (len(dirty), total))
+		return paths
+
+	def rebuild_k_shortest_paths(self, graph, fingerprint, weight='weight', k=5):
+		"""
+			Compute all K shortest paths from scratch and re-index them.
+		"""
+		paths = self.all_k_shortest_paths(graph, weight=weight, k=k)
+		self.link_to_pairs = {}
+		for src in paths:
+			for dst in paths[src]:
+				if src != dst:
+					self.index_paths(src, dst, paths[src][dst])
+		self.path_cache_key = fingerprint
 		return paths
 
 	def register_access_info(self, dpid, in_port, ip, mac):
@@ -292,11 +486,13 @@ class NetworkAwareness(app_manager.RyuApp):
 				if self.access_table[(dpid, in_port)] == (ip, mac):
 					return
 				else:
+					self.update_host_index((dpid, in_port), self.access_table[(dpid, in_port)], (ip, mac))
 					self.access_table[(dpid, in_port)] = (ip, mac)
 					return
 			else:
 				self.access_table.setdefault((dpid, in_port), None)
 				self.access_table[(dpid, in_port)] = (ip, mac)
+				self.update_host_index((dpid, in_port), None, (ip, mac))
 				return
 
 	def show_topology(self):
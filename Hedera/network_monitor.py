@@ -19,6 +19,7 @@
 from __future__ import division
 import copy
 from operator import attrgetter
+import time
 
 from ryu import cfg
 from ryu.base import app_manager
@@ -30,7 +31,11 @@ from ryu.ofproto import ofproto_v1_3
 from ryu.lib import hub
 
 import setting
-from DemandEstimation import demand_estimation
+from poll_scheduler import PollScheduler
+from stats_store import StatsStore
+from stats_collector import StatsCollector
+from DemandEstimation import DemandEstimator
+from SimulatedAnnealing import SimulatedAnnealing
 
 
 CONF = cfg.CONF
@@ -47,10 +52,8 @@ class NetworkMonitor(app_manager.RyuApp):
 		self.name = 'monitor'
 		self.awareness = lookup_service_brick('awareness')
 		self.datapaths = {}
-		self.port_stats = {}
-		self.port_speed = {}
-		self.flow_stats = {}
-		self.flow_speed = {}
+		self.port_stats = StatsStore(('tx_bytes', 'rx_bytes', 'rx_errors'), 'tx_bytes')   # Port speeds are the rates of tx_bytes.
+		self.flow_stats = StatsStore(('packet_count', 'byte_count'), 'byte_count')   # Flow speeds are the rates of byte_count.
 		self.stats = {}
 		self.port_features = {}
 		self.free_bandwidth = {}   # {dpid:{port_no:free_bw,},} Unit:Kbit/s
@@ -60,43 +63,85 @@ class NetworkMonitor(app_manager.RyuApp):
 		# Create four data structures for Hedera specially.
 		self.hostsList = []
 		self.flows = []   # Record flows that need to be rescheduled. (hmc)
-		self.statRecord = []
-		self.pre_GFF_path = {}   # Record the last GFF path of flows
+		self.pre_GFF_path = {}   # Record the last GFF (or SA) path of flows
+		self.placement_stats = {}   # Statistics of the last placement, see _GlobalFirstFit and _SimulatedAnnealing.
+		self.installing = {}   # {(dpid, barrier_xid):install,}
+		self.install_latency = {}   # {(dpid1, dpid2, ...):latency of the latest installation,}
+		self.demand_estimator = DemandEstimator(tolerance=setting.DEMAND_TOLERANCE,
+												max_iterations=setting.DEMAND_MAX_ITERATIONS,
+												printing=setting.TOSHOW_DEMANDS)
+		self.annealer = SimulatedAnnealing(time_budget=setting.SA_TIME_BUDGET,
+										   max_iterations=setting.SA_MAX_ITERATIONS,
+										   initial_temperature=setting.SA_INITIAL_TEMPERATURE)
+
+		# Estimating demands needs the stats of all switches in every period,
+		# so the polling intervals are not adaptive.
+		self.scheduler = PollScheduler(time.time(), setting.MONITOR_PERIOD,
+									   setting.POLL_MIN_INTERVAL, setting.POLL_MAX_INTERVAL,
+									   setting.POLL_CHANGE_THRESHOLD, spread=setting.POLL_SPREAD,
+									   adaptive=False)
+		self.collector = StatsCollector(setting.STATS_TIMEOUT)
 
 		# Start to green thread to monitor traffic and calculating
-		# free bandwidth of links respectively.
+		# free bandwidth of links.
 		self.monitor_thread = hub.spawn(self._monitor)
-		self.save_freebandwidth_thread = hub.spawn(self._save_bw_graph)
 
 	def _monitor(self):
 		"""
 			Main entry method of monitoring traffic.
+			Every MONITOR_PERIOD is an epoch, in which every switch is polled
+			once at its own offset by the scheduler. The epochs are aligned
+			with the scheduler, so that the polls of an epoch never cross it.
+			An epoch is complete as soon as all the switches have replied,
+			and is handled once.
 		"""
+		epoch_time = self.scheduler.origin
 		while CONF.weight == 'bw' or CONF.weight == 'hop':
-			# Refresh data.
-			self.stats['flow'] = {}
-			self.stats['port'] = {}
-			self.capabilities = None
-			self.best_paths = None
-			self.statRecord = []
-			self.flows = []
-			for dp in self.datapaths.values():
-				self.port_features.setdefault(dp.id, {})
-				self._request_stats(dp)
-			hub.sleep(setting.MONITOR_PERIOD)
-			if self.stats['flow'] or self.stats['port']:
-				self.show_stat('flow')
-				self.show_stat('port')
-				hub.sleep(1)
-
-	def _save_bw_graph(self):
+			now = time.time()
+			if now >= epoch_time:
+				self.collector.start_epoch(now, expected=set(self.datapaths.keys()))
+				while epoch_time <= now:
+					epoch_time += setting.MONITOR_PERIOD
+			for dpid in self.scheduler.get_due(now):
+				if dpid in self.datapaths:
+					self._request_stats(self.datapaths[dpid], self.scheduler.pop_port_desc(dpid))
+			for epoch in self.collector.pop_completed(now):
+				self._handle_epoch(epoch)
+			hub.sleep(setting.POLL_TICK)
+
+	def _handle_epoch(self, epoch):
 		"""
-			Save bandwidth data into networkx graph object.
+			Save the stats replies of an epoch, save bandwidth data into
+			networkx graph object, and estimate flows' demands.
+			Port stats are saved before flow stats, whatever order the
+			replies arrived in, so that GFF sees the free bandwidth of
+			the same epoch.
 		"""
-		while CONF.weight == 'bw' or CONF.weight == 'hop':
-			self.graph = self.create_bw_graph(self.free_bandwidth)
-			self.logger.debug("save free bandwidth")
-			hub.sleep(setting.MONITOR_PERIOD)
+		# Refresh data.
+		self.capabilities = None
+		self.best_paths = None
+		self.flows = []
+		if epoch.missing:
+			self.logger.info("Stats epoch %d timed out, missing replies: %s" % (epoch.number, epoch.missing))
+		self.stats = {'port': epoch.snapshot.get('port', {}), 'flow': epoch.snapshot.get('flow', {})}
+		for dpid, body in sorted(self.stats['port'].items()):
+			self._save_port_stats(dpid, body)
+		for dpid, body in sorted(self.stats['flow'].items()):
+			self._save_flow_stats(dpid, body)
+
+		self.graph = self.create_bw_graph(self.free_bandwidth)
+		self.logger.debug("save free bandwidth")
+		if self.stats['flow'] or self.stats['port']:
+			self.show_stat('flow')
+			self.show_stat('port')
+
+		# Estimate flows' demands only if the flow stats of all the edge switches are received.
+		if [dpid for dpid, _type in epoch.missing if _type == 'flow' and str(dpid).startswith('3')]:
+			self.logger.info("Stats epoch %d lacks flow stats of edge switches, skip demand estimation" % epoch.number)
+		elif self.flows:
+			flows = sorted([flow for flow in self.flows], key=lambda flow: (flow['src'], flow['dst']))
+			hostsList = sorted(self.hostsList)
+			self._demandEstimator(flows, hostsList)
 
 	@set_ev_cls(ofp_event.EventOFPStateChange,
 				[MAIN_DISPATCHER, DEAD_DISPATCHER])
@@ -109,48 +154,41 @@ class NetworkMonitor(app_manager.RyuApp):
 			if not datapath.id in self.datapaths:
 				self.logger.debug('register datapath: %016x', datapath.id)
 				self.datapaths[datapath.id] = datapath
+				self.port_features.setdefault(datapath.id, {})
+				self.scheduler.add(datapath.id, time.time())
 		elif ev.state == DEAD_DISPATCHER:
 			if datapath.id in self.datapaths:
 				self.logger.debug('unregister datapath: %016x', datapath.id)
 				del self.datapaths[datapath.id]
+				self.scheduler.remove(datapath.id)
 		else:
 			pass
 
 
-	@set_ev_cls(ofp_event.EventOFPPortStatsReply, MAIN_DISPATCHER)
-	def _port_stats_reply_handler(self, ev):
+	def _save_port_stats(self, dpid, body):
 		"""
 			Save port's stats information into self.port_stats.
 			Calculate port speed and Save it.
-			self.port_stats = {(dpid, port_no):[(tx_bytes, rx_bytes, rx_errors, duration_sec,  duration_nsec),],}
-			self.port_speed = {(dpid, port_no):[speed,],}
+			self.port_stats = StatsStore of (dpid, port_no), fields: (tx_bytes, rx_bytes, rx_errors),
+			whose rates are port speeds. The speeds of all the ports of a reply are calculated at once.
 			Note: Since the transmit performance and receive performance are
 			 independent of a port, we calculate the current load of a port only
 			 using tx_bytes while finding routing path.
 		"""
-		body = ev.msg.body
-		dpid = ev.msg.datapath.id
-		self.stats['port'][dpid] = body
 		self.free_bandwidth.setdefault(dpid, {})
-		for stat in sorted(body, key=attrgetter('port_no')):
-			port_no = stat.port_no
-			if port_no != ofproto_v1_3.OFPP_LOCAL:
-				key = (dpid, port_no)
-				value = (stat.tx_bytes, stat.rx_bytes, stat.rx_errors,
-						 stat.duration_sec, stat.duration_nsec)
-				self._save_stats(self.port_stats, key, value, 5)
-
-				# Get port speed and Save it.
-				pre = 0
-				period = setting.MONITOR_PERIOD
-				tmp = self.port_stats[key]
-				if len(tmp) > 1:
-					# Calculate only the tx_bytes, not the rx_bytes. (hmc)
-					pre = tmp[-2][0]
-					period = self._get_period(tmp[-1][3], tmp[-1][4], tmp[-2][3], tmp[-2][4])
-				speed = self._get_speed(self.port_stats[key][-1][0], pre, period)
-				self._save_stats(self.port_speed, key, speed, 5)
-				self._save_freebandwidth(dpid, port_no, speed)
+		stats = sorted([stat for stat in body if stat.port_no != ofproto_v1_3.OFPP_LOCAL],
+					   key=attrgetter('port_no'))
+		# Calculate only the tx_bytes, not the rx_bytes. (hmc)
+		speeds = self.port_stats.append(
+			[(dpid, stat.port_no) for stat in stats],
+			[(stat.tx_bytes, stat.rx_bytes, stat.rx_errors) for stat in stats],
+			[self._get_time(stat.duration_sec, stat.duration_nsec) for stat in stats],
+			setting.MONITOR_PERIOD)
+		for stat, speed in zip(stats, speeds):
+			self._save_freebandwidth(dpid, stat.port_no, speed)
+
+		# The load of a switch is the total sending rate of its ports. (Kbit/s)
+		self.scheduler.update_load(dpid, speeds.sum() * 8 / 1000.0)
 
 	@set_ev_cls(ofp_event.EventOFPPortDescStatsReply, MAIN_DISPATCHER)
 	def port_desc_stats_reply_handler(self, ev):
@@ -216,41 +254,46 @@ class NetworkMonitor(app_manager.RyuApp):
 		else:
 			print "switch%d: Illeagal port state %s %s" % (dpid, port_no, reason)
 
+		# Refresh the port descriptions of the switch with its next poll.
+		self.scheduler.request_port_desc(dpid)
+
 	@set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
 	def _flow_stats_reply_handler(self, ev):
+		"""
+			Collect the flow stats reply into its epoch.
+		"""
+		msg = ev.msg
+		self.collector.add_reply(msg.datapath.id, msg.xid, msg.body,
+								 msg.flags & ofproto_v1_3.OFPMPF_REPLY_MORE)
+
+	@set_ev_cls(ofp_event.EventOFPPortStatsReply, MAIN_DISPATCHER)
+	def _port_stats_reply_handler(self, ev):
+		"""
+			Collect the port stats reply into its epoch.
+		"""
+		msg = ev.msg
+		self.collector.add_reply(msg.datapath.id, msg.xid, msg.body,
+								 msg.flags & ofproto_v1_3.OFPMPF_REPLY_MORE)
+
+	def _save_flow_stats(self, dpid, body):
 		"""
 			Save flow stats reply information into self.flow_stats.
 			Calculate flow speed and Save it.
 			(old) self.flow_stats = {dpid:{(in_port, ipv4_dst, out-port):[(packet_count, byte_count, duration_sec,  duration_nsec),],},}
 			(old) self.flow_speed = {dpid:{(in_port, ipv4_dst, out-port):[speed,],},}
-			(new) self.flow_stats = {dpid:{(priority, ipv4_src, ipv4_dst):[(packet_count, byte_count, duration_sec,  duration_nsec),],},}
-			(new) self.flow_speed = {dpid:{(priority, ipv4_src, ipv4_dst):[speed,],},}
+			(new) self.flow_stats = StatsStore of (dpid, (priority, ipv4_src, ipv4_dst)),
+			fields: (packet_count, byte_count), whose rates are flow speeds.
 			Because the proactive flow entrys don't have 'in_port' and 'out-port' field.
 			Note: table-miss, LLDP and ARP flow entries are not what we need, just filter them.
 		"""
-		body = ev.msg.body
-		dpid = ev.msg.datapath.id
-		self.statRecord.append(dpid)
-		self.stats['flow'][dpid] = body
-		self.flow_stats.setdefault(dpid, {})
-		self.flow_speed.setdefault(dpid, {})
-		for stat in sorted([flow for flow in body if ((flow.priority not in [0, 65535]) and (flow.match.get('ipv4_src')) and (flow.match.get('ipv4_dst')))],
-						   key=lambda flow: (flow.priority, flow.match.get('ipv4_src'), flow.match.get('ipv4_dst'))):
-			key = (stat.priority, stat.match.get('ipv4_src'), stat.match.get('ipv4_dst'))
-			value = (stat.packet_count, stat.byte_count,
-					 stat.duration_sec, stat.duration_nsec)
-			self._save_stats(self.flow_stats[dpid], key, value, 5)
-
-			# Get flow's speed and Save it.
-			pre = 0
-			period = setting.MONITOR_PERIOD
-			tmp = self.flow_stats[dpid][key]
-			if len(tmp) > 1:
-				pre = tmp[-2][1]
-				period = self._get_period(tmp[-1][2], tmp[-1][3], tmp[-2][2], tmp[-2][3])
-			speed = self._get_speed(self.flow_stats[dpid][key][-1][1], pre, period)
-			self._save_stats(self.flow_speed[dpid], key, speed, 5)
-
+		stats = sorted([flow for flow in body if ((flow.priority not in [0, 65535]) and (flow.match.get('ipv4_src')) and (flow.match.get('ipv4_dst')))],
+					   key=lambda flow: (flow.priority, flow.match.get('ipv4_src'), flow.match.get('ipv4_dst')))
+		speeds = self.flow_stats.append(
+			[(dpid, (stat.priority, stat.match.get('ipv4_src'), stat.match.get('ipv4_dst'))) for stat in stats],
+			[(stat.packet_count, stat.byte_count) for stat in stats],
+			[self._get_time(stat.duration_sec, stat.duration_nsec) for stat in stats],
+			setting.MONITOR_PERIOD)
+		for stat, speed in zip(stats, speeds):
 			# Record flows that need to be rescheduled. (hmc)
 			if str(dpid).startswith('3'):
 				flowDemand = speed * 8.0 / (setting.MAX_CAPACITY * 1000)
@@ -263,59 +306,183 @@ class NetworkMonitor(app_manager.RyuApp):
 						self.hostsList.append(dst)
 					self.flows.append({'src': src, 'dst': dst, 'demand': flowDemand,
 						'converged':False, 'receiver_limited': False,
-						'match': stat.match, 'priority': stat.priority})
+						'match': stat.match, 'priority': stat.priority,
+						'rate': flowDemand})
 					if not self.pre_GFF_path.has_key((src, dst)):
 						self.pre_GFF_path[(src, dst)] = None
 			else:
 				pass
 
-		# Estimate flows' demands if all the flow_stat replies are received.
-		if len(self.statRecord) == 1.25 * (CONF.fanout ** 2) and self.flows:
-			flows = sorted([flow for flow in self.flows], key=lambda flow: (flow['src'], flow['dst']))
-			hostsList = sorted(self.hostsList)
-			self._demandEstimator(flows, hostsList)
-		else:
-			pass
-
 	def _demandEstimator(self, flows, hostsList):
 		'''
 			Estimate flows' demands.
 		'''
-		estimated_flows = demand_estimation(flows, hostsList)
-		for flow in estimated_flows:
-			if flow['demand'] > 0.1:
-				self._GlobalFirstFit(flow)
+		estimated_flows = self.demand_estimator.estimate(flows, hostsList)
+		self.logger.info("[DEMAND ESTIMATION] %d of %d hosts recomputed" % self.demand_estimator.recomputed)
+		elephants = [flow for flow in estimated_flows if flow['demand'] > 0.1]
+		if setting.SCHEDULER == 'SA':
+			self._SimulatedAnnealing(elephants)
+		else:
+			self._GlobalFirstFit(elephants)
 
-	def _GlobalFirstFit(self, flow):
+	def _get_elephants(self, flows):
+		'''
+			Get the flows to be placed, the largest demand first.
+			A flow is reported by both of its edge switches, it is placed once.
+			Flows between hosts of the same edge switch have no path to choose.
+			elephants = [(flow, src_dpid, dst_dpid),]
+		'''
+		elephants = []
+		pairs = set()
+		for flow in sorted(flows, key=lambda flow: (-flow['demand'], flow['src'], flow['dst'])):
+			src_location = self.awareness.get_host_location(flow['src'])
+			dst_location = self.awareness.get_host_location(flow['dst'])
+			if (flow['src'], flow['dst']) in pairs or src_location is None or dst_location is None:
+				continue
+			pairs.add((flow['src'], flow['dst']))
+			if src_location[0] != dst_location[0]:
+				elephants.append((flow, src_location[0], dst_location[0]))
+		return elephants
+
+	def _place_flow(self, flow, route, ledger, stats):
+		'''
+			Reserve the demand of flow on the links of route, and install it.
+		'''
+		key = (flow['src'], flow['dst'])
+		for link in zip(route[:-1], route[1:]):
+			ledger[link] = ledger.get(link, 0) - flow['demand']
+		stats['placed'] += 1
+		stats['placed_demand'] += flow['demand']
+		if self.pre_GFF_path.get(key) != route:
+			stats['rerouted'] += 1
+		self.pre_GFF_path[key] = route
+		self._install_GFF_path(route, flow['match'], flow['priority'])
+
+	def _show_placement(self, name, stats, ledger, start):
+		'''
+			Save and log the placement statistics.
+		'''
+		stats['max_link_load'] = 1.0 - min(ledger.values() + [1.0])
+		stats['time'] = time.time() - start
+		self.placement_stats = stats
+		self.logger.info("[%s] %d of %d flows placed, %d rerouted, demand %.2f of %.2f placed, "
+						 "max link load %.2f, %.1f ms" % (name, stats['placed'], stats['flows'], stats['rerouted'],
+						 stats['placed_demand'], stats['demand'], stats['max_link_load'], stats['time'] * 1000))
+
+	def _create_link_ledger(self, elephants):
+		'''
+			Create the link capacity ledger of an epoch.
+			ledger = {(src_dpid,dst_dpid):free capacity,} (fraction of MAX_CAPACITY)
+			The free capacity of a link starts from its measured free bandwidth,
+			plus the measured rates of the flows placed on it by the last GFF,
+			because these flows are going to be placed again.
+			elephants are those of _get_elephants, so that a flow reported by
+			both of its edge switches is credited once.
+		'''
+		ledger = {}
+		for link, (src_port, dst_port) in self.awareness.link_to_port.items():
+			free_bw = self.free_bandwidth.get(link[0], {}).get(src_port)
+			if free_bw is None:
+				ledger[link] = 1.0
+			else:
+				ledger[link] = free_bw / setting.MAX_CAPACITY
+		for flow, src_dp, dst_dp in elephants:
+			path = self.pre_GFF_path.get((flow['src'], flow['dst']))
+			if path:
+				for link in zip(path[:-1], path[1:]):
+					if link in ledger:
+						ledger[link] = min(ledger[link] + flow['rate'], 1.0)
+		return ledger
+
+	def _GlobalFirstFit(self, flows):
 		'''
 			Do the Hedera Global First Fit here.
+			Flows are placed one by one, the largest demand first, each on the
+			first path whose links can all accommodate its demand. The demand
+			is reserved on the links of the path in the ledger at once, so that
+			the following flows only see the capacity left.
 			self.awareness.link_to_port = {(src_dpid,dst_dpid):(src_port,dst_port),}
 			self.free_bandwidth = {dpid:{port_no:free_bw,},} Unit:Kbit/s
 		'''
-		src_dp = self.awareness.get_host_location(flow['src'])[0]
-		dst_dp = self.awareness.get_host_location(flow['dst'])[0]
-		paths = self.awareness.shortest_paths.get(src_dp).get(dst_dp)
-		GFF_route = None
-		for path in paths:
-			fitCheck = True
-			for i in xrange(len(path) - 1):
-				fitCheck = False
-				if self.awareness.link_to_port.has_key((path[i], path[i+1])):
-					src_port = self.awareness.link_to_port[(path[i], path[i+1])][0]
-					if self.free_bandwidth.has_key(path[i]) and self.free_bandwidth[path[i]].has_key(src_port):
-						if (self.free_bandwidth[path[i]][src_port] / setting.MAX_CAPACITY) < flow['demand']:
-							break
-						else:
-							fitCheck = True
-
-			if fitCheck == True:
-				GFF_route = path
-				self.logger.info("[GFF PATH]%s<-->%s: %s" % (flow['src'], flow['dst'], path))
-				break
-		if GFF_route:
+		start = time.time()
+		elephants = self._get_elephants(flows)
+		ledger = self._create_link_ledger(elephants)
+		stats = {'flows': len(elephants), 'placed': 0, 'rerouted': 0, 'unplaced': 0,
+				 'demand': sum([flow['demand'] for flow, src_dp, dst_dp in elephants]), 'placed_demand': 0.0}
+		for flow, src_dp, dst_dp in elephants:
+			paths = self.awareness.shortest_paths.get(src_dp).get(dst_dp)
+			GFF_route = None
+			for path in paths:
+				if min([ledger.get(link, 0) for link in zip(path[:-1], path[1:])]) >= flow['demand']:
+					GFF_route = path
+					self.logger.info("[GFF PATH]%s<-->%s: %s" % (flow['src'], flow['dst'], path))
+					break
+			if GFF_route is None:
+				stats['unplaced'] += 1
+				self.logger.info("[GFF UNPLACED]%s<-->%s: demand %.2f" % (flow['src'], flow['dst'], flow['demand']))
+				continue
+
 			# Install new GFF_path flow entries.
-			self.logger.info("[GFF INSTALLING]%s<-->%s: %s" % (flow['src'], flow['dst'], path))
-			self. _install_GFF_path(GFF_route, flow['match'], flow['priority'])
+			self.logger.info("[GFF INSTALLING]%s<-->%s: %s" % (flow['src'], flow['dst'], GFF_route))
+			self._place_flow(flow, GFF_route, ledger, stats)
+
+		self._show_placement('GFF', stats, ledger, start)
+
+	def _get_core_options(self, paths, cores):
+		'''
+			Get the path through every core switch among the candidate paths.
+			A path which doesn't cross the core layer, i.e. inside a pod, goes
+			through the core switches linked to its aggregation switch.
+			options = {core:path,}
+		'''
+		link_to_port = self.awareness.link_to_port
+		options = {}
+		for path in paths:
+			crossed = [dpid for dpid in path if dpid in cores]
+			for core in cores:
+				if core in options:
+					continue
+				if core in crossed or (not crossed and
+						[dpid for dpid in path if (dpid, core) in link_to_port]):
+					options[core] = path
+		return options
+
+	def _SimulatedAnnealing(self, flows):
+		'''
+			Do the Hedera Simulated Annealing here.
+			Every destination host is assigned a core switch by the annealer,
+			within SA_TIME_BUDGET, and its flows are placed on their paths
+			through that core. The capacity of links is the ledger of GFF.
+			Flows whose hosts get no core are left unplaced.
+		'''
+		start = time.time()
+		elephants = self._get_elephants(flows)
+		ledger = self._create_link_ledger(elephants)
+		stats = {'flows': len(elephants), 'placed': 0, 'rerouted': 0, 'unplaced': 0,
+				 'demand': sum([flow['demand'] for flow, src_dp, dst_dp in elephants]), 'placed_demand': 0.0}
+		cores = set([dpid for dpid in self.awareness.graph.nodes() if str(dpid).startswith('1')])
+		options = []
+		for flow, src_dp, dst_dp in elephants:
+			paths = self.awareness.shortest_paths.get(src_dp).get(dst_dp)
+			options.append(self._get_core_options(paths, cores))
+		assignment = self.annealer.schedule(
+			[(flow['dst'], flow['demand']) for flow, src_dp, dst_dp in elephants],
+			[dict((core, zip(path[:-1], path[1:])) for core, path in option.items()) for option in options],
+			dict(ledger))
+
+		for (flow, src_dp, dst_dp), option in zip(elephants, options):
+			core = assignment.get(flow['dst'])
+			if core is None:
+				stats['unplaced'] += 1
+				self.logger.info("[SA UNPLACED]%s<-->%s: demand %.2f" % (flow['src'], flow['dst'], flow['demand']))
+				continue
+			self.logger.info("[SA INSTALLING]%s<-->%s: %s" % (flow['src'], flow['dst'], option[core]))
+			self._place_flow(flow, option[core], ledger, stats)
+
+		stats['energy'] = self.annealer.energy
+		stats['iterations'] = self.annealer.iterations
+		self._show_placement('SA', stats, ledger, start)
+		self.logger.info("[SA] energy %.2f after %d iterations" % (stats['energy'], stats['iterations']))
 
 	def _install_GFF_path(self, GFF_route, match, priority):
 		'''
@@ -331,35 +498,96 @@ class NetworkMonitor(app_manager.RyuApp):
 	def install_flow(self, datapaths, link_to_port, path, flow_info):
 		'''
 			Install flow entries for datapaths.
+			Flow entries are sent in reverse path order, so the first datapath
+			gets its entry at last, and every datapath gets its entries and a
+			barrier request in a single write, like ShortestForwarding does.
+			The installation finishes when all the barrier replies arrive.
 			path=[dpid1, dpid2, ...]
 			flow_info = (eth_type, src_ip, dst_ip, priority)
-			self.awareness.access_table = {(sw,port):(ip, mac),}
+			self.awareness.ip_to_location = {ip:(sw,port),}
 		'''
 		if path is None or len(path) == 0:
 			self.logger.info("Path error!")
 			return
 		in_port = None
-		for key in self.awareness.access_table.keys():
-			if self.awareness.access_table[key][0] == flow_info[1]:
-				in_port = key[1]
+		location = self.awareness.get_host_location(flow_info[1])
+		if location:
+			in_port = location[1]
 		first_dp = datapaths[path[0]]
 		out_port = first_dp.ofproto.OFPP_LOCAL
-		# Install flow entry for intermediate datapaths.
+		batches = []   # [(datapath, [flow_mod,]),]
+
+		# Flow entry for the first datapath.
+		port_pair = self.get_port_pair_from_link(link_to_port, path[0], path[1])
+		if port_pair is None:
+			self.logger.info("Port not found in first hop.")
+			return
+		out_port = port_pair[0]
+		batches.append((first_dp, [self._build_flow_entry(first_dp, flow_info, in_port, out_port)]))
+
+		# Flow entries for intermediate datapaths.
 		for i in xrange(1, len(path) - 2):
 			port = self.get_port_pair_from_link(link_to_port, path[i-1], path[i])
 			port_next = self.get_port_pair_from_link(link_to_port, path[i], path[i+1])
 			if port and port_next:
 				src_port, dst_port = port[1], port_next[0]
 				datapath = datapaths[path[i]]
-				self.send_flow_mod(datapath, flow_info, src_port, dst_port)
+				batches.append((datapath, [self._build_flow_entry(datapath, flow_info, src_port, dst_port)]))
 
-		# Install flow entry for the first datapath.
-		port_pair = self.get_port_pair_from_link(link_to_port, path[0], path[1])
-		if port_pair is None:
-			self.logger.info("Port not found in first hop.")
+		install = {'path': tuple(path), 'start': time.time(), 'barriers': set()}
+		for datapath, flow_mods in reversed(batches):
+			xid = self.send_msgs(datapath, flow_mods)
+			install['barriers'].add((datapath.id, xid))
+			self.installing[(datapath.id, xid)] = install
+		hub.spawn_after(setting.BARRIER_TIMEOUT, self._install_timeout, install)
+
+	def send_msgs(self, datapath, msgs):
+		"""
+			Send messages to datapath in a single write, followed by a
+			barrier request. Return the xid of the barrier request.
+		"""
+		msgs = msgs + [datapath.ofproto_parser.OFPBarrierRequest(datapath)]
+		buf = bytearray()
+		for msg in msgs:
+			datapath.set_xid(msg)
+			msg.serialize()
+			buf += msg.buf
+		datapath.send(buf)
+		return msgs[-1].xid
+
+	@set_ev_cls(ofp_event.EventOFPBarrierReply, MAIN_DISPATCHER)
+	def _barrier_reply_handler(self, ev):
+		"""
+			Finish the installation of a path when all of its barriers are replied.
+			Barrier replies of ShortestForwarding are not in self.installing.
+		"""
+		key = (ev.msg.datapath.id, ev.msg.xid)
+		install = self.installing.pop(key, None)
+		if install is None:
 			return
-		out_port = port_pair[0]
-		self.send_flow_mod(first_dp, flow_info, in_port, out_port)
+		install['barriers'].discard(key)
+		if not install['barriers']:
+			self._finish_install(install)
+
+	def _install_timeout(self, install):
+		"""
+			Finish the installation of a path anyway if some barriers are lost.
+		"""
+		if not install['barriers']:
+			return
+		self.logger.info("[INSTALL] Barrier timeout on path %s" % (install['path'],))
+		for key in install['barriers']:
+			self.installing.pop(key, None)
+		install['barriers'].clear()
+		self._finish_install(install)
+
+	def _finish_install(self, install):
+		"""
+			Record the install latency of the path.
+		"""
+		latency = time.time() - install['start']
+		self.install_latency[install['path']] = latency
+		self.logger.debug("[INSTALL] Path %s is ready in %.2f ms" % (install['path'], latency * 1000))
 
 	def get_port_pair_from_link(self, link_to_port, src_dpid, dst_dpid):
 		"""
@@ -373,9 +601,9 @@ class NetworkMonitor(app_manager.RyuApp):
 			 (src_dpid, dst_dpid))
 			return None
 
-	def send_flow_mod(self, datapath, flow_info, src_port, dst_port):
+	def _build_flow_entry(self, datapath, flow_info, src_port, dst_port):
 		"""
-			Build flow entry, and send it to datapath.
+			Build flow mod object of a flow entry.
 			flow_info = (eth_type, src_ip, dst_ip, priority)
 		"""
 		parser = datapath.ofproto_parser
@@ -416,12 +644,12 @@ class NetworkMonitor(app_manager.RyuApp):
 			pass
 		priority = flow_info[3] + 1
 
-		self.add_flow(datapath, priority, match, actions,
-					  idle_timeout=5, hard_timeout=0)
+		return self._build_flow_mod(datapath, priority, match, actions,
+									idle_timeout=5, hard_timeout=0)
 
-	def add_flow(self, dp, priority, match, actions, idle_timeout=0, hard_timeout=0):
+	def _build_flow_mod(self, dp, priority, match, actions, idle_timeout=0, hard_timeout=0):
 		"""
-			Send a flow entry to datapath.
+			Build flow mod object.
 		"""
 		ofproto = dp.ofproto
 		parser = dp.ofproto_parser
@@ -430,20 +658,29 @@ class NetworkMonitor(app_manager.RyuApp):
 								idle_timeout=idle_timeout,
 								hard_timeout=hard_timeout,
 								match=match, instructions=inst)
-		dp.send_msg(mod)
+		return mod
 
-	def _request_stats(self, datapath):
+	def _request_stats(self, datapath, port_desc=True):
 		"""
-			Sending request msg to datapath
+			Sending request msg to datapath.
+			Port descriptions are requested only if port_desc is True,
+			they don't change unless a port status event arrives.
+			Port and flow stats requests are registered with their xids
+			in the current epoch, so that their replies can be matched.
 		"""
 		self.logger.debug('send stats request: %016x', datapath.id)
 		ofproto = datapath.ofproto
 		parser = datapath.ofproto_parser
-		req = parser.OFPPortDescStatsRequest(datapath, 0)
-		datapath.send_msg(req)
+		if port_desc:
+			req = parser.OFPPortDescStatsRequest(datapath, 0)
+			datapath.send_msg(req)
 		req = parser.OFPPortStatsRequest(datapath, 0, ofproto.OFPP_ANY)
+		datapath.set_xid(req)
+		self.collector.add_request(datapath.id, req.xid, 'port')
 		datapath.send_msg(req)
 		req = parser.OFPFlowStatsRequest(datapath)
+		datapath.set_xid(req)
+		self.collector.add_request(datapath.id, req.xid, 'flow')
 		datapath.send_msg(req)
 
 	def get_min_bw_of_links(self, graph, path, min_bw):
@@ -544,19 +781,6 @@ class NetworkMonitor(app_manager.RyuApp):
 		else:
 			self.logger.info("Port is Down")
 
-	def _save_stats(self, _dict, key, value, length=5):
-		if key not in _dict:
-			_dict[key] = []
-		_dict[key].append(value)
-		if len(_dict[key]) > length:
-			_dict[key].pop(0)
-
-	def _get_speed(self, now, pre, period):
-		if period:
-			return (now - pre) / (period)
-		else:
-			return 0
-
 	def _get_free_bw(self, capacity, speed):
 		# freebw: Kbit/s
 		return max(capacity - speed * 8 / 1000.0, 0)
@@ -564,9 +788,6 @@ class NetworkMonitor(app_manager.RyuApp):
 	def _get_time(self, sec, nsec):
 		return sec + nsec / 1000000000.0
 
-	def _get_period(self, n_sec, n_nsec, p_sec, p_nsec):
-		return self._get_time(n_sec, n_nsec) - self._get_time(p_sec, p_nsec)
-
 	def show_stat(self, _type):
 		'''
 			Show statistics information according to data type.
@@ -591,7 +812,7 @@ class NetworkMonitor(app_manager.RyuApp):
 						dpid,
 						stat.priority, stat.match.get('ipv4_src'), stat.match.get('ipv4_dst'),
 						stat.packet_count, stat.byte_count,
-						abs(self.flow_speed[dpid][(stat.priority, stat.match.get('ipv4_src'), stat.match.get('ipv4_dst'))][-1])*8/1000.0))
+						abs(self.flow_stats.get_rate((dpid, (stat.priority, stat.match.get('ipv4_src'), stat.match.get('ipv4_dst')))))*8/1000.0))
 			print
 
 		if _type == 'port':
@@ -612,7 +833,7 @@ class NetworkMonitor(app_manager.RyuApp):
 							stat.rx_packets, stat.rx_bytes,
 							stat.tx_packets, stat.tx_bytes,
 							setting.MAX_CAPACITY,
-							abs(self.port_speed[(dpid, stat.port_no)][-1] * 8),
+							abs(self.port_stats.get_rate((dpid, stat.port_no)) * 8),
 							self.free_bandwidth[dpid][stat.port_no],
 							self.port_features[dpid][stat.port_no][0],
 							self.port_features[dpid][stat.port_no][1]))
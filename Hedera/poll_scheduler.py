@@ -0,0 +1,112 @@
+# Copyright (C) 2016 Huang MaChi at Chongqing University
+# of Posts and Telecommunications, Chongqing, China.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+
+
+GOLDEN_RATIO = (math.sqrt(5) - 1) / 2
+
+
+class PollScheduler(object):
+	"""
+		Schedule the stats requests of switches.
+		Switches are staggered across the first 'spread' of every period,
+		so that their replies don't arrive at the controller at once.
+		If 'adaptive', the polling interval of a switch is halved when its
+		load has changed by more than 'threshold' since its last poll, and
+		doubled otherwise, within [min_interval, max_interval].
+		Otherwise every switch is polled once per period.
+	"""
+	def __init__(self, now, period, min_interval, max_interval,
+				 threshold, spread=1.0, adaptive=True):
+		self.origin = now
+		self.period = period
+		self.min_interval = min_interval
+		self.max_interval = max_interval
+		self.threshold = threshold
+		self.spread = spread
+		self.adaptive = adaptive
+		self.offsets = {}   # {dpid:offset in the period,}
+		self.intervals = {}   # {dpid:polling interval,}
+		self.next_time = {}   # {dpid:time of the next poll,}
+		self.loads = {}   # {dpid:load reported by the last poll,}
+		self.port_desc = set()   # Switches whose port descriptions should be requested.
+		self.added = 0
+
+	def add(self, dpid, now):
+		"""
+			Start to poll a switch. The offsets of the successive switches
+			follow the golden ratio, which spreads them evenly however many
+			switches there are.
+		"""
+		fraction = (self.added * GOLDEN_RATIO) % 1
+		self.added += 1
+		self.offsets[dpid] = fraction * self.spread * self.period
+		self.intervals[dpid] = self.period
+		periods = math.ceil((now - self.origin - self.offsets[dpid]) / self.period)
+		self.next_time[dpid] = self.origin + self.offsets[dpid] + max(periods, 0) * self.period
+		self.port_desc.add(dpid)
+
+	def remove(self, dpid):
+		for _dict in (self.offsets, self.intervals, self.next_time, self.loads):
+			_dict.pop(dpid, None)
+		self.port_desc.discard(dpid)
+
+	def get_due(self, now):
+		"""
+			Get the switches which should be polled now, and schedule their next polls.
+			A poll missed by a long pause is not made up for.
+		"""
+		due = sorted([dpid for dpid, next_time in self.next_time.items() if next_time <= now])
+		for dpid in due:
+			next_time = self.next_time[dpid] + self.intervals[dpid]
+			while next_time <= now:
+				next_time += self.intervals[dpid]
+			self.next_time[dpid] = next_time
+		return due
+
+	def request_port_desc(self, dpid):
+		"""
+			Request the port descriptions of the switch with its next poll,
+			e.g. after a port status event.
+		"""
+		self.port_desc.add(dpid)
+
+	def pop_port_desc(self, dpid):
+		if dpid in self.port_desc:
+			self.port_desc.discard(dpid)
+			return True
+		return False
+
+	def update_load(self, dpid, load):
+		"""
+			Adapt the polling interval of the switch to the change of its load.
+		"""
+		if not self.adaptive or dpid not in self.intervals:
+			return
+		last = self.loads.get(dpid)
+		self.loads[dpid] = load
+		if last is None:
+			return
+		interval = self.intervals[dpid]
+		if abs(load - last) > self.threshold:
+			interval = max(interval / 2.0, self.min_interval)
+		else:
+			interval = min(interval * 2.0, self.max_interval)
+		if interval != self.intervals[dpid]:
+			# Keep the next poll on the new interval from the last one.
+			self.next_time[dpid] += interval - self.intervals[dpid]
+			self.intervals[dpid] = interval
@@ -29,3 +29,37 @@ TOSHOW = False	   # For showing information in terminal
 MAX_CAPACITY = 10000   # Max capacity of link, Kbit/s
 
 get_topology_delay = 30
+
+PATH_PROVIDER = 'ksp'   # For creating candidate paths, 'ksp': K shortest paths, 'fattree': all equal-cost paths of fat-tree.
+
+KSP_PROCESSES = 0   # For computing candidate paths in a process pool, 0 or 1 means serially.
+
+BARRIER_TIMEOUT = 1   # For waiting the barrier replies of a path being installed. (s)
+
+FLOW_INSTALL_TTL = 1   # For suppressing duplicate packet_in of a flow whose path is being installed. (s)
+
+POLL_TICK = 0.1   # For checking which switches are due to be polled. (s)
+
+POLL_MIN_INTERVAL = 1   # For polling the switches whose load changes a lot. (s)
+
+POLL_MAX_INTERVAL = 8   # For polling the switches whose load hardly changes. (s)
+
+POLL_CHANGE_THRESHOLD = 500   # For adapting polling intervals, change of the total sending rate of a switch. (kbit/s)
+
+POLL_SPREAD = 0.5   # For staggering the polls of switches, the fraction of MONITOR_PERIOD they are spread over.
+
+DEMAND_TOLERANCE = 0.0001   # For stopping demand estimation, the largest change of a demand in an iteration. (fraction of MAX_CAPACITY)
+
+DEMAND_MAX_ITERATIONS = 100   # For bounding the iterations of demand estimation.
+
+TOSHOW_DEMANDS = False   # For showing the estimated demand matrix in terminal.
+
+STATS_TIMEOUT = 1   # For completing a stats epoch without the replies which are still missing after the next epoch starts. (s)
+
+SCHEDULER = 'GFF'   # For placing elephant flows, 'GFF': Global First Fit, 'SA': Simulated Annealing.
+
+SA_TIME_BUDGET = 0.1   # For bounding the search of Simulated Annealing in every period. (s)
+
+SA_MAX_ITERATIONS = 10000   # For bounding the iterations of Simulated Annealing in every period.
+
+SA_INITIAL_TEMPERATURE = 0.5   # For accepting worse assignments in Simulated Annealing, falling to 0 over the budget. (fraction of MAX_CAPACITY)
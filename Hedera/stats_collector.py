@@ -0,0 +1,107 @@
+# Copyright (C) 2016 Huang MaChi at Chongqing University
+# of Posts and Telecommunications, Chongqing, China.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+class Epoch(object):
+	"""
+		The stats requests sent in a monitoring period, and their replies.
+		snapshot = {_type:{dpid:[stat,],},}
+	"""
+	def __init__(self, number, start_time, expected=None):
+		self.number = number
+		self.start_time = start_time
+		self.expected = expected   # Switches which should all be polled, or None.
+		self.deadline = None   # Set when the epoch is sealed.
+		self.requested = set()   # Switches polled in the epoch.
+		self.pending = {}   # {(dpid, xid):_type,}
+		self.parts = {}   # {(dpid, xid):[stat,],}, parts of replies with more to come.
+		self.snapshot = {}
+		self.missing = []   # [(dpid, _type),], replies not arrived before the timeout.
+
+	@property
+	def sealed(self):
+		return self.deadline is not None
+
+	def is_complete(self, now):
+		if self.pending:
+			if self.sealed and now >= self.deadline:
+				self.missing = sorted([(dpid, _type) for (dpid, xid), _type in self.pending.items()])
+				return True
+			return False
+		if self.sealed:
+			return True
+		return self.expected is not None and self.expected <= self.requested
+
+
+class StatsCollector(object):
+	"""
+		Collect stats replies by epochs.
+		Every request is registered with its xid in the current epoch, and
+		replies, which may be split into several parts, are gathered by
+		(dpid, xid). Late replies of completed epochs and duplicated ones
+		are dropped. An epoch is sealed when the next one starts; it is
+		complete when all its requests are replied, or 'timeout' seconds
+		after it was sealed. An epoch with 'expected' switches is complete
+		as soon as they are all polled and replied.
+		Completed epochs are handed out exactly once, in order.
+	"""
+	def __init__(self, timeout):
+		self.timeout = timeout
+		self.epochs = []   # Epochs not handed out yet, the oldest first.
+		self.requests = {}   # {(dpid, xid):epoch,}
+		self.number = 0
+
+	def start_epoch(self, now, expected=None):
+		if self.epochs and not self.epochs[-1].sealed:
+			self.epochs[-1].deadline = now + self.timeout
+		self.number += 1
+		self.epochs.append(Epoch(self.number, now, expected))
+
+	def add_request(self, dpid, xid, _type):
+		if not self.epochs:
+			return
+		epoch = self.epochs[-1]
+		epoch.requested.add(dpid)
+		epoch.pending[(dpid, xid)] = _type
+		self.requests[(dpid, xid)] = epoch
+
+	def add_reply(self, dpid, xid, body, more=False):
+		"""
+			Save a reply part. Return True if it belongs to an open epoch.
+		"""
+		key = (dpid, xid)
+		epoch = self.requests.get(key)
+		if epoch is None or key not in epoch.pending:
+			return False
+		epoch.parts.setdefault(key, []).extend(body)
+		if not more:
+			_type = epoch.pending.pop(key)
+			epoch.snapshot.setdefault(_type, {})[dpid] = epoch.parts.pop(key)
+			del self.requests[key]
+		return True
+
+	def pop_completed(self, now):
+		"""
+			Get the completed epochs, which are forgotten then.
+			An epoch is not handed out before the older ones.
+		"""
+		completed = []
+		while self.epochs and self.epochs[0].is_complete(now):
+			epoch = self.epochs.pop(0)
+			for key in epoch.pending:
+				del self.requests[key]
+			completed.append(epoch)
+		return completed
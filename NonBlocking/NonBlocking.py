@@ -35,6 +35,9 @@ import sys
 parentdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, parentdir)
 import iperf_peers
+import ovs_utils
+import readiness
+import net_sampler
 
 
 parser = argparse.ArgumentParser(description="NonBlocking application")
@@ -42,6 +45,12 @@ parser.add_argument('--k', dest='k', type=int, default=4, choices=[4, 8], help="
 parser.add_argument('--duration', dest='duration', type=int, default=60, help="Duration (sec) for each iperf traffic generation")
 parser.add_argument('--dir', dest='output_dir', help="Directory to store outputs")
 parser.add_argument('--cpu', dest='cpu', type=float, default=1.0, help='Total CPU to allocate to hosts')
+parser.add_argument('--rules_dir', dest='rules_dir', default=None, help="Directory to keep the generated proactive rules for inspection")
+parser.add_argument('--ip', dest='ip', default="192.168.56.101", help="IP address of the controller")
+parser.add_argument('--port', dest='port', type=int, default=6653, help="OpenFlow port of the controller")
+parser.add_argument('--peers', dest='peers', default=None, help="File of iperf peers created by create_peers.py, iperf_peers.py by default")
+parser.add_argument('--monitor', dest='monitor', default='sampler', choices=['sampler', 'bwm-ng'], help="Tool to monitor the throughput of switches")
+parser.add_argument('--interval', dest='interval', type=float, default=1.0, help="Interval (sec) of monitoring throughput")
 args = parser.parse_args()
 
 
@@ -105,9 +114,7 @@ class NonBlocking(Topo):
 		self._set_ovs_protocol_13(self.CoreSwitchList)
 
 	def _set_ovs_protocol_13(self, sw_list):
-		for sw in sw_list:
-			cmd = "sudo ovs-vsctl set bridge %s protocols=OpenFlow13" % sw
-			os.system(cmd)
+		ovs_utils.set_bridges_protocol(sw_list, 'OpenFlow13')
 
 
 def set_host_ip(net, topo):
@@ -123,16 +130,13 @@ def install_proactive(net, topo):
 	"""
 		Install proactive flow entries for the switch.
 	"""
+	rules = ovs_utils.RuleSet()
 	for sw in topo.CoreSwitchList:
 		for i in xrange(1, topo.iHost + 1):
-			cmd = "ovs-ofctl add-flow %s -O OpenFlow13 \
-				'table=0,idle_timeout=0,hard_timeout=0,priority=40,arp, \
-				nw_dst=10.0.0.%d,actions=output:%d'" % (sw, i, i)
-			os.system(cmd)
-			cmd = "ovs-ofctl add-flow %s -O OpenFlow13 \
-				'table=0,idle_timeout=0,hard_timeout=0,priority=40,ip, \
-				nw_dst=10.0.0.%d,actions=output:%d'" % (sw, i, i)
-			os.system(cmd)
+			rules.add_flow(sw, "table=0,idle_timeout=0,hard_timeout=0,priority=40,arp,nw_dst=10.0.0.%d,actions=output:%d" % (i, i))
+			rules.add_flow(sw, "table=0,idle_timeout=0,hard_timeout=0,priority=40,ip,nw_dst=10.0.0.%d,actions=output:%d" % (i, i))
+
+	rules.load(args.rules_dir)
 
 def monitor_devs_ng(fname="./txrate.txt", interval_sec=0.1):
 	"""
@@ -143,6 +147,25 @@ def monitor_devs_ng(fname="./txrate.txt", interval_sec=0.1):
 	cmd = "sleep 1; bwm-ng -t %s -o csv -u bits -T rate -C ',' > %s" %  (interval_sec * 1000, fname)
 	Popen(cmd, shell=True).wait()
 
+def monitor_devs(fname="./txrate.txt", interval_sec=1.0):
+	"""
+		Sample the counters of switches' interfaces from /proc/net/dev.
+		The output is a reduced bwm-ng csv, which plot_results.py reads as well.
+	"""
+	time.sleep(1)
+	net_sampler.sample(fname, interval_sec)
+
+def get_peers():
+	"""
+		Get the iperf peers from the file given by --peers,
+		or from iperf_peers.py in the top directory by default.
+	"""
+	if args.peers:
+		namespace = {}
+		execfile(args.peers, namespace)
+		return namespace['iperf_peers']
+	return iperf_peers.iperf_peers
+
 def traffic_generation(net, topo, flows_peers):
 	"""
 		Generate traffics and test the performance of the network.
@@ -156,22 +179,29 @@ def traffic_generation(net, topo, flows_peers):
 		# server.cmd("iperf -s > %s/%s &" % (args.output_dir, 'server'+filename+'.txt'))
 		server.cmd("iperf -s > /dev/null &" )   # Its statistics is useless, just throw away.
 
-	time.sleep(3)
+	# Wait until the servers are listening, 3 seconds at most.
+	readiness.wait_servers([net.get(server) for server in serversList], timeout=3)
 
 	# Start the clients.
+	connections = {}   # {(src, dest):number of flows,}
 	for src, dest in flows_peers:
 		server = net.get(dest)
 		client = net.get(src)
 		# filename = src[1:]
 		# client.cmd("iperf -c %s -t %d > %s/%s &" % (server.IP(), args.duration, args.output_dir, 'client'+filename+'.txt'))
 		client.cmd("iperf -c %s -t %d > /dev/null &" % (server.IP(), 1990))   # Its statistics is useless, just throw away. 1990 just means a great number.
-		time.sleep(2)
-
-	# Wait for the traffic to become stable.
-	time.sleep(10)
-
-	# 2. Start bwm-ng to monitor throughput.
-	monitor = Process(target = monitor_devs_ng, args = ('%s/bwmng.txt' % args.output_dir, 1.0))
+		# Wait until the flow has been set up, 2 seconds at most.
+		connections[(src, dest)] = connections.get((src, dest), 0) + 1
+		readiness.wait_connected(client, server.IP(), connections[(src, dest)], timeout=2)
+
+	# Wait for the traffic to become stable, 10 seconds at most.
+	readiness.wait_rates_stable(timeout=10)
+
+	# 2. Start bwm-ng or the sampler to monitor throughput.
+	if args.monitor == 'bwm-ng':
+		monitor = Process(target = monitor_devs_ng, args = ('%s/bwmng.txt' % args.output_dir, args.interval))
+	else:
+		monitor = Process(target = monitor_devs, args = ('%s/bwmng.txt' % args.output_dir, args.interval))
 	monitor.start()
 
 	# 3. The experiment is going on.
@@ -211,7 +241,7 @@ def run_experiment(pod, ip="192.168.56.101", port=6653, bw_h2c=10):
 	time.sleep(5)
 
 	# 2. Generate traffics and test the performance of the network.
-	traffic_generation(net, topo, iperf_peers.iperf_peers)
+	traffic_generation(net, topo, get_peers())
 
 	# CLI(net)
 	net.stop()
@@ -221,4 +251,4 @@ if __name__ == '__main__':
 	if os.getuid() != 0:
 		logging.warning("You are NOT root!")
 	elif os.getuid() == 0:
-		run_experiment(args.k)   # run_experiment(4) or run_experiment(8)
+		run_experiment(args.k, ip=args.ip, port=args.port)   # run_experiment(4) or run_experiment(8)
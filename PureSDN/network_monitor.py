@@ -19,6 +19,7 @@
 from __future__ import division
 import copy
 from operator import attrgetter
+import time
 
 from ryu import cfg
 from ryu.base import app_manager
@@ -30,6 +31,9 @@ from ryu.ofproto import ofproto_v1_3
 from ryu.lib import hub
 
 import setting
+from poll_scheduler import PollScheduler
+from stats_store import StatsStore
+from stats_collector import StatsCollector
 
 
 CONF = cfg.CONF
@@ -45,10 +49,8 @@ class NetworkMonitor(app_manager.RyuApp):
 		super(NetworkMonitor, self).__init__(*args, **kwargs)
 		self.name = 'monitor'
 		self.datapaths = {}
-		self.port_stats = {}
-		self.port_speed = {}
-		self.flow_stats = {}
-		self.flow_speed = {}
+		self.port_stats = StatsStore(('tx_bytes', 'rx_bytes', 'rx_errors'), 'tx_bytes')   # Port speeds are the rates of tx_bytes.
+		self.flow_stats = StatsStore(('packet_count', 'byte_count'), 'byte_count')   # Flow speeds are the rates of byte_count.
 		self.stats = {}
 		self.port_features = {}
 		self.free_bandwidth = {}   # self.free_bandwidth = {dpid:{port_no:free_bw,},} unit:Kbit/s
@@ -57,38 +59,60 @@ class NetworkMonitor(app_manager.RyuApp):
 		self.capabilities = None
 		self.best_paths = None
 
+		self.scheduler = PollScheduler(time.time(), setting.MONITOR_PERIOD,
+									   setting.POLL_MIN_INTERVAL, setting.POLL_MAX_INTERVAL,
+									   setting.POLL_CHANGE_THRESHOLD, spread=setting.POLL_SPREAD,
+									   adaptive=True)
+		self.collector = StatsCollector(setting.STATS_TIMEOUT)
+
 		# Start to green thread to monitor traffic and calculating
-		# free bandwidth of links respectively.
+		# free bandwidth of links.
 		self.monitor_thread = hub.spawn(self._monitor)
-		self.save_freebandwidth_thread = hub.spawn(self._save_bw_graph)
 
 	def _monitor(self):
 		"""
 			Main entry method of monitoring traffic.
+			Switches are polled when the scheduler says they are due, and
+			their replies are collected by epochs of MONITOR_PERIOD.
+			Every epoch is handled once, after it has completed.
 		"""
+		epoch_time = self.scheduler.origin
 		while CONF.weight == 'bw':
-			self.stats['flow'] = {}
-			self.stats['port'] = {}
-			for dp in self.datapaths.values():
-				self.port_features.setdefault(dp.id, {})
-				self._request_stats(dp)
-			# Refresh data.
-			self.capabilities = None
-			self.best_paths = None
-			hub.sleep(setting.MONITOR_PERIOD)
-			if self.stats['flow'] or self.stats['port']:
-				self.show_stat('flow')
-				self.show_stat('port')
-				hub.sleep(1)
-
-	def _save_bw_graph(self):
+			now = time.time()
+			if now >= epoch_time:
+				self.collector.start_epoch(now)
+				while epoch_time <= now:
+					epoch_time += setting.MONITOR_PERIOD
+			for dpid in self.scheduler.get_due(now):
+				if dpid in self.datapaths:
+					self._request_stats(self.datapaths[dpid], self.scheduler.pop_port_desc(dpid))
+			for epoch in self.collector.pop_completed(now):
+				self._handle_epoch(epoch)
+			hub.sleep(setting.POLL_TICK)
+
+	def _handle_epoch(self, epoch):
 		"""
-			Save bandwidth data into networkx graph object.
+			Save the stats replies of an epoch, then save bandwidth data
+			into networkx graph object.
+			Port stats are saved before flow stats, whatever order the
+			replies arrived in.
 		"""
-		while CONF.weight == 'bw':
-			self.graph = self.create_bw_graph(self.free_bandwidth)
-			self.logger.debug("save free bandwidth")
-			hub.sleep(setting.MONITOR_PERIOD)
+		if epoch.missing:
+			self.logger.info("Stats epoch %d timed out, missing replies: %s" % (epoch.number, epoch.missing))
+		self.stats = {'port': epoch.snapshot.get('port', {}), 'flow': epoch.snapshot.get('flow', {})}
+		for dpid, body in sorted(self.stats['port'].items()):
+			self._save_port_stats(dpid, body)
+		for dpid, body in sorted(self.stats['flow'].items()):
+			self._save_flow_stats(dpid, body)
+
+		self.graph = self.create_bw_graph(self.free_bandwidth)
+		self.logger.debug("save free bandwidth")
+		# Refresh data.
+		self.capabilities = None
+		self.best_paths = None
+		if self.stats['flow'] or self.stats['port']:
+			self.show_stat('flow')
+			self.show_stat('port')
 
 	@set_ev_cls(ofp_event.EventOFPStateChange,
 				[MAIN_DISPATCHER, DEAD_DISPATCHER])
@@ -101,82 +125,76 @@ class NetworkMonitor(app_manager.RyuApp):
 			if not datapath.id in self.datapaths:
 				self.logger.debug('register datapath: %016x', datapath.id)
 				self.datapaths[datapath.id] = datapath
+				self.port_features.setdefault(datapath.id, {})
+				self.scheduler.add(datapath.id, time.time())
 		elif ev.state == DEAD_DISPATCHER:
 			if datapath.id in self.datapaths:
 				self.logger.debug('unregister datapath: %016x', datapath.id)
 				del self.datapaths[datapath.id]
+				self.scheduler.remove(datapath.id)
 		else:
 			pass
 
 	@set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
 	def _flow_stats_reply_handler(self, ev):
+		"""
+			Collect the flow stats reply into its epoch.
+		"""
+		msg = ev.msg
+		self.collector.add_reply(msg.datapath.id, msg.xid, msg.body,
+								 msg.flags & ofproto_v1_3.OFPMPF_REPLY_MORE)
+
+	@set_ev_cls(ofp_event.EventOFPPortStatsReply, MAIN_DISPATCHER)
+	def _port_stats_reply_handler(self, ev):
+		"""
+			Collect the port stats reply into its epoch.
+		"""
+		msg = ev.msg
+		self.collector.add_reply(msg.datapath.id, msg.xid, msg.body,
+								 msg.flags & ofproto_v1_3.OFPMPF_REPLY_MORE)
+
+	def _save_flow_stats(self, dpid, body):
 		"""
 			Save flow stats reply information into self.flow_stats.
 			Calculate flow speed and Save it.
 			(old) self.flow_stats = {dpid:{(in_port, ipv4_dst, out-port):[(packet_count, byte_count, duration_sec,  duration_nsec),],},}
 			(old) self.flow_speed = {dpid:{(in_port, ipv4_dst, out-port):[speed,],},}
-			(new) self.flow_stats = {dpid:{(priority, ipv4_src, ipv4_dst):[(packet_count, byte_count, duration_sec,  duration_nsec),],},}
-			(new) self.flow_speed = {dpid:{(priority, ipv4_src, ipv4_dst):[speed,],},}
+			(new) self.flow_stats = StatsStore of (dpid, (priority, ipv4_src, ipv4_dst)),
+			fields: (packet_count, byte_count), whose rates are flow speeds.
 			Because the proactive flow entrys don't have 'in_port' and 'out-port' field.
 			Note: table-miss, LLDP and ARP flow entries are not what we need, just filter them.
 		"""
-		body = ev.msg.body
-		dpid = ev.msg.datapath.id
-		self.stats['flow'][dpid] = body
-		self.flow_stats.setdefault(dpid, {})
-		self.flow_speed.setdefault(dpid, {})
-		for stat in sorted([flow for flow in body if ((flow.priority not in [0, 65535]) and (flow.match.get('ipv4_src')) and (flow.match.get('ipv4_dst')))],
-						   key=lambda flow: (flow.priority, flow.match.get('ipv4_src'), flow.match.get('ipv4_dst'))):
-			key = (stat.priority, stat.match.get('ipv4_src'), stat.match.get('ipv4_dst'))
-			value = (stat.packet_count, stat.byte_count,
-					 stat.duration_sec, stat.duration_nsec)
-			self._save_stats(self.flow_stats[dpid], key, value, 5)
-
-			# Get flow's speed and Save it.
-			pre = 0
-			period = setting.MONITOR_PERIOD
-			tmp = self.flow_stats[dpid][key]
-			if len(tmp) > 1:
-				pre = tmp[-2][1]
-				period = self._get_period(tmp[-1][2], tmp[-1][3],
-										  tmp[-2][2], tmp[-2][3])
-			speed = self._get_speed(self.flow_stats[dpid][key][-1][1],
-									pre, period)
-			self._save_stats(self.flow_speed[dpid], key, speed, 5)
-
-	@set_ev_cls(ofp_event.EventOFPPortStatsReply, MAIN_DISPATCHER)
-	def _port_stats_reply_handler(self, ev):
+		stats = sorted([flow for flow in body if ((flow.priority not in [0, 65535]) and (flow.match.get('ipv4_src')) and (flow.match.get('ipv4_dst')))],
+					   key=lambda flow: (flow.priority, flow.match.get('ipv4_src'), flow.match.get('ipv4_dst')))
+		self.flow_stats.append(
+			[(dpid, (stat.priority, stat.match.get('ipv4_src'), stat.match.get('ipv4_dst'))) for stat in stats],
+			[(stat.packet_count, stat.byte_count) for stat in stats],
+			[self._get_time(stat.duration_sec, stat.duration_nsec) for stat in stats],
+			setting.MONITOR_PERIOD)
+
+	def _save_port_stats(self, dpid, body):
 		"""
 			Save port's stats information into self.port_stats.
 			Calculate port speed and Save it.
-			self.port_stats = {(dpid, port_no):[(tx_bytes, rx_bytes, rx_errors, duration_sec,  duration_nsec),],}
-			self.port_speed = {(dpid, port_no):[speed,],}
+			self.port_stats = StatsStore of (dpid, port_no), fields: (tx_bytes, rx_bytes, rx_errors),
+			whose rates are port speeds. The speeds of all the ports of a reply are calculated at once.
 			Note: The transmit performance and receive performance are independent of a port.
 			We calculate the load of a port only using tx_bytes.
 		"""
-		body = ev.msg.body
-		dpid = ev.msg.datapath.id
-		self.stats['port'][dpid] = body
 		self.free_bandwidth.setdefault(dpid, {})
-		for stat in sorted(body, key=attrgetter('port_no')):
-			port_no = stat.port_no
-			if port_no != ofproto_v1_3.OFPP_LOCAL:
-				key = (dpid, port_no)
-				value = (stat.tx_bytes, stat.rx_bytes, stat.rx_errors,
-						 stat.duration_sec, stat.duration_nsec)
-				self._save_stats(self.port_stats, key, value, 5)
-
-				# Get port speed and Save it.
-				pre = 0
-				period = setting.MONITOR_PERIOD
-				tmp = self.port_stats[key]
-				if len(tmp) > 1:
-					# Calculate only the tx_bytes, not the rx_bytes. (hmc)
-					pre = tmp[-2][0]
-					period = self._get_period(tmp[-1][3], tmp[-1][4], tmp[-2][3], tmp[-2][4])
-				speed = self._get_speed(self.port_stats[key][-1][0], pre, period)
-				self._save_stats(self.port_speed, key, speed, 5)
-				self._save_freebandwidth(dpid, port_no, speed)
+		stats = sorted([stat for stat in body if stat.port_no != ofproto_v1_3.OFPP_LOCAL],
+					   key=attrgetter('port_no'))
+		# Calculate only the tx_bytes, not the rx_bytes. (hmc)
+		speeds = self.port_stats.append(
+			[(dpid, stat.port_no) for stat in stats],
+			[(stat.tx_bytes, stat.rx_bytes, stat.rx_errors) for stat in stats],
+			[self._get_time(stat.duration_sec, stat.duration_nsec) for stat in stats],
+			setting.MONITOR_PERIOD)
+		for stat, speed in zip(stats, speeds):
+			self._save_freebandwidth(dpid, stat.port_no, speed)
+
+		# The load of a switch is the total sending rate of its ports. (Kbit/s)
+		self.scheduler.update_load(dpid, speeds.sum() * 8 / 1000.0)
 
 	@set_ev_cls(ofp_event.EventOFPPortDescStatsReply, MAIN_DISPATCHER)
 	def port_desc_stats_reply_handler(self, ev):
@@ -242,18 +260,30 @@ class NetworkMonitor(app_manager.RyuApp):
 		else:
 			print "switch%d: Illeagal port state %s %s" % (dpid, port_no, reason)
 
-	def _request_stats(self, datapath):
+		# Refresh the port descriptions of the switch with its next poll.
+		self.scheduler.request_port_desc(dpid)
+
+	def _request_stats(self, datapath, port_desc=True):
 		"""
-			Sending request msg to datapath
+			Sending request msg to datapath.
+			Port descriptions are requested only if port_desc is True,
+			they don't change unless a port status event arrives.
+			Port and flow stats requests are registered with their xids
+			in the current epoch, so that their replies can be matched.
 		"""
 		self.logger.debug('send stats request: %016x', datapath.id)
 		ofproto = datapath.ofproto
 		parser = datapath.ofproto_parser
-		req = parser.OFPPortDescStatsRequest(datapath, 0)
-		datapath.send_msg(req)
+		if port_desc:
+			req = parser.OFPPortDescStatsRequest(datapath, 0)
+			datapath.send_msg(req)
 		req = parser.OFPPortStatsRequest(datapath, 0, ofproto.OFPP_ANY)
+		datapath.set_xid(req)
+		self.collector.add_request(datapath.id, req.xid, 'port')
 		datapath.send_msg(req)
 		req = parser.OFPFlowStatsRequest(datapath)
+		datapath.set_xid(req)
+		self.collector.add_request(datapath.id, req.xid, 'flow')
 		datapath.send_msg(req)
 
 	def get_min_bw_of_links(self, graph, path, min_bw):
@@ -354,19 +384,6 @@ class NetworkMonitor(app_manager.RyuApp):
 		else:
 			self.logger.info("Port is Down")
 
-	def _save_stats(self, _dict, key, value, length=5):
-		if key not in _dict:
-			_dict[key] = []
-		_dict[key].append(value)
-		if len(_dict[key]) > length:
-			_dict[key].pop(0)
-
-	def _get_speed(self, now, pre, period):
-		if period:
-			return (now - pre) / (period)
-		else:
-			return 0
-
 	def _get_free_bw(self, capacity, speed):
 		# freebw: Kbit/s
 		return max(capacity - speed * 8 / 1000.0, 0)
@@ -374,9 +391,6 @@ class NetworkMonitor(app_manager.RyuApp):
 	def _get_time(self, sec, nsec):
 		return sec + nsec / 1000000000.0
 
-	def _get_period(self, n_sec, n_nsec, p_sec, p_nsec):
-		return self._get_time(n_sec, n_nsec) - self._get_time(p_sec, p_nsec)
-
 	def show_stat(self, _type):
 		'''
 			Show statistics information according to data type.
@@ -401,7 +415,7 @@ class NetworkMonitor(app_manager.RyuApp):
 						dpid,
 						stat.priority, stat.match.get('ipv4_src'), stat.match.get('ipv4_dst'),
 						stat.packet_count, stat.byte_count,
-						abs(self.flow_speed[dpid][(stat.priority, stat.match.get('ipv4_src'), stat.match.get('ipv4_dst'))][-1])*8/1000.0))
+						abs(self.flow_stats.get_rate((dpid, (stat.priority, stat.match.get('ipv4_src'), stat.match.get('ipv4_dst')))))*8/1000.0))
 			print
 
 		if _type == 'port':
@@ -422,7 +436,7 @@ class NetworkMonitor(app_manager.RyuApp):
 							stat.rx_packets, stat.rx_bytes,
 							stat.tx_packets, stat.tx_bytes,
 							10000,
-							abs(self.port_speed[(dpid, stat.port_no)][-1] * 8),
+							abs(self.port_stats.get_rate((dpid, stat.port_no)) * 8),
 							self.free_bandwidth[dpid][stat.port_no],
 							self.port_features[dpid][stat.port_no][0],
 							self.port_features[dpid][stat.port_no][1]))
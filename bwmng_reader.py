@@ -0,0 +1,144 @@
+# Copyright (C) 2016 Huang MaChi at Chongqing University
+# of Posts and Telecommunications, Chongqing, China.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+import numpy as np
+
+
+# Columns of the bwm-ng csv output in 'rate' mode:
+# unix_timestamp;iface_name;bytes_out/s;bytes_in/s;bytes_total/s;bytes_in;bytes_out;
+# packets_out/s;packets_in/s;packets_total/s;packets_in;packets_out;errors_out/s;errors_in/s;errors_in;errors_out
+COLUMNS = [('time', 0, np.float64),
+		   ('iface', 1, 'S64'),
+		   ('bytes_out_rate', 2, np.float64),
+		   ('bytes_in', 5, np.float64),
+		   ('bytes_out', 6, np.float64),
+		   ('packets_in', 10, np.float64),
+		   ('packets_out', 11, np.float64)]
+FIELDS = 16
+
+# Columns of the reduced csv output of net_sampler.py:
+# unix_timestamp,iface_name,bytes_out/s,bytes_in,bytes_out,packets_in,packets_out
+SAMPLER_COLUMNS = [('time', 0, np.float64),
+				   ('iface', 1, 'S64'),
+				   ('bytes_out_rate', 2, np.float64),
+				   ('bytes_in', 3, np.float64),
+				   ('bytes_out', 4, np.float64),
+				   ('packets_in', 5, np.float64),
+				   ('packets_out', 6, np.float64)]
+SAMPLER_FIELDS = 7
+
+CACHE_VERSION = 2   # Bump it when the layout of a parsed run changes.
+
+
+def read_bwmng(file_name, delim=','):
+	"""
+		Read the bwmng.txt file into typed columns in a single pass.
+		The file is either written by bwm-ng, or by net_sampler.py which may
+		sample several times per second. In the latter case, the rates are
+		divided by the number of samples of the interface in the same second,
+		so that the rates of a second add up to its average rate, as they do
+		in bwm-ng's output.
+		The statistics of the last second are removed, because they are mostly not intact.
+		run = {
+				'time': seconds of rows, floored,
+				'timestamp': unix timestamps of rows, with sub-second resolution,
+				'iface': ids of interfaces of rows, index of 'ifaces',
+				'ifaces': sorted interface names,
+				'bytes_out_rate': ..., 'bytes_in': ..., 'bytes_out': ...,
+				'packets_in': ..., 'packets_out': ...
+			}
+	"""
+	with open(file_name, 'r') as f:
+		lines = f.read().splitlines()
+	last_second = None
+	column_list, fields_num = COLUMNS, FIELDS
+	if lines:
+		last_second = int(float(lines[-1].split(delim)[0]))
+		if lines[0].count(delim) == SAMPLER_FIELDS - 1:
+			column_list, fields_num = SAMPLER_COLUMNS, SAMPLER_FIELDS
+	# Lines broken off when bwm-ng was killed are skipped.
+	rows = [line.split(delim) for line in lines if line.count(delim) == fields_num - 1]
+	# Columns are converted by NumPy from the split fields,
+	# which is much faster than np.loadtxt converting every value.
+	fields = zip(*rows) if rows else [()] * fields_num
+	columns = {}
+	for name, column, _type in column_list:
+		columns[name] = np.array(fields[column], dtype=_type)
+
+	time = np.floor(columns['time']).astype(np.int64)
+	keep = time != last_second
+	ifaces, iface_ids = np.unique(columns['iface'][keep], return_inverse=True)
+
+	run = {'time': time[keep], 'timestamp': columns['time'][keep],
+		   'iface': iface_ids.astype(np.int32), 'ifaces': ifaces}
+	for name, column, _type in column_list[2:]:
+		run[name] = columns[name][keep]
+	if column_list is SAMPLER_COLUMNS and len(run['time']):
+		# Number of samples of every (second, interface).
+		slot = (run['time'] - run['time'][0]) * len(ifaces) + run['iface']
+		run['bytes_out_rate'] = run['bytes_out_rate'] / np.bincount(slot)[slot]
+	return run
+
+
+def get_iface_mask(run, predicate):
+	"""
+		Get the mask of rows whose interface name satisfies predicate.
+		The predicate is evaluated once per interface, not once per row.
+	"""
+	selected = np.array([bool(predicate(name)) for name in run['ifaces']], dtype=bool)
+	if not len(selected):
+		return np.zeros(len(run['iface']), dtype=bool)
+	return selected[run['iface']]
+
+
+def get_cache_file(file_name):
+	"""
+		The cache of bwmng.txt is bwmng.npz in the same directory.
+	"""
+	return os.path.splitext(file_name)[0] + '.npz'
+
+
+def load_run(file_name, use_cache=True):
+	"""
+		Get the parsed run of a bwmng.txt file.
+		The run is cached in a .npz file next to the source, which is reused
+		as long as the size and mtime of the source are unchanged.
+	"""
+	if not use_cache:
+		return read_bwmng(file_name)
+	stat = os.stat(file_name)
+	key = np.array([CACHE_VERSION, stat.st_size, stat.st_mtime], dtype=np.float64)
+	cache_file = get_cache_file(file_name)
+	if os.path.exists(cache_file):
+		try:
+			cache = np.load(cache_file)
+			if np.array_equal(cache['_key'], key):
+				return dict((name, cache[name]) for name in cache.files if name != '_key')
+		except Exception:
+			pass   # A broken cache is just rebuilt.
+
+	run = read_bwmng(file_name)
+	try:
+		# Write to a temporary file first, so that readers never see half a cache.
+		tmp_file = '%s.%d.tmp' % (cache_file, os.getpid())
+		with open(tmp_file, 'wb') as f:
+			np.savez_compressed(f, _key=key, **run)
+		os.rename(tmp_file, cache_file)
+	except (IOError, OSError):
+		pass   # The results directory may be read-only.
+	return run
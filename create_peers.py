@@ -22,6 +22,7 @@ parser = argparse.ArgumentParser(description="BFlows experiments")
 parser.add_argument('--k', dest='k', type=int, default=4, choices=[4, 8], help="Switch fanout number")
 parser.add_argument('--traffic', dest='traffic', default="stag_0.2_0.3", help="Traffic pattern to simulate")
 parser.add_argument('--fnum', dest='flows_num_per_host', type=int, default=1, help="Number of iperf flows per host")
+parser.add_argument('--out', dest='out_file', default='iperf_peers.py', help="File to write the iperf peers into")
 args = parser.parse_args()
 
 
@@ -162,7 +163,7 @@ def create_peers():
 	random.shuffle(flows_peers)
 
 	# Write flows_peers into a file for reuse.
-	file_save = open('iperf_peers.py', 'w')
+	file_save = open(args.out_file, 'w')
 	file_save.write('iperf_peers=%s' % flows_peers)
 	file_save.close()
 
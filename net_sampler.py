@@ -0,0 +1,75 @@
+# Copyright (C) 2016 Huang MaChi at Chongqing University
+# of Posts and Telecommunications, Chongqing, China.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+import time
+
+
+PROC_NET_DEV = '/proc/net/dev'
+# Interfaces of switches created by fattree.py and NonBlocking.py, like '3001-eth1'.
+SWITCH_IFACE_PATTERN = re.compile(r'^\d{4}-eth\d+$')
+
+# Columns of the sampler output, the same as the first columns of bwm-ng csv
+# output in 'rate' mode, followed by the counters used by plot_results.py:
+# unix_timestamp,iface_name,bytes_out/s,bytes_in,bytes_out,packets_in,packets_out
+FIELDS = 7
+
+
+def read_counters(pattern=SWITCH_IFACE_PATTERN):
+	"""
+		Read the counters of the interfaces matching pattern from /proc/net/dev.
+		counters = {iface_name:(bytes_in, bytes_out, packets_in, packets_out),}
+	"""
+	counters = {}
+	with open(PROC_NET_DEV, 'r') as f:
+		for line in f.readlines()[2:]:
+			name, data = line.split(':', 1)
+			name = name.strip()
+			if pattern.match(name):
+				data = data.split()
+				counters[name] = (int(data[0]), int(data[8]), int(data[1]), int(data[9]))
+	return counters
+
+
+def sample(file_name, interval=1.0, pattern=SWITCH_IFACE_PATTERN, count=None):
+	"""
+		Sample the counters of interfaces matching pattern every interval seconds,
+		'count' times or until the process is terminated.
+		Every sample writes one line per interface, with the increments of
+		counters since the last sample, and is flushed at once.
+	"""
+	with open(file_name, 'w') as f:
+		last_time, last = time.time(), read_counters(pattern)
+		next_time = last_time + interval
+		while count is None or count > 0:
+			time.sleep(max(0, next_time - time.time()))
+			now, counters = time.time(), read_counters(pattern)
+			lines = []
+			for name in sorted(counters.keys()):
+				if name not in last:
+					continue
+				# Counters of a recreated interface start from 0 again.
+				bytes_in, bytes_out, packets_in, packets_out = [
+					max(0, new - old) for new, old in zip(counters[name], last[name])]
+				lines.append("%.3f,%s,%.2f,%d,%d,%d,%d\n" % (
+					now, name, bytes_out / (now - last_time), bytes_in, bytes_out, packets_in, packets_out))
+			f.write(''.join(lines))
+			f.flush()
+			last_time, last = now, counters
+			# Skip the samples missed by a long pause, instead of catching up.
+			next_time = max(next_time + interval, now + interval / 2)
+			if count is not None:
+				count -= 1
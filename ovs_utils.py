@@ -0,0 +1,129 @@
+# Copyright (C) 2016 Huang MaChi at Chongqing University
+# of Posts and Telecommunications, Chongqing, China.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import time
+from subprocess import Popen
+
+
+class RuleSet(object):
+	"""
+		Proactive flow entries and group entries of switches.
+		Rules are rendered into one flow file and one group file per switch,
+		and loaded by a single 'ovs-ofctl add-groups/add-flows' per switch.
+	"""
+	def __init__(self):
+		self.rules = {}   # {sw:{'groups':[group,], 'flows':[flow,]},}
+
+	def _get_rules(self, sw):
+		if sw not in self.rules:
+			self.rules[sw] = {'groups': [], 'flows': []}
+		return self.rules[sw]
+
+	def add_flow(self, sw, flow):
+		"""
+			Add a flow entry in the syntax of 'ovs-ofctl add-flow'.
+		"""
+		self._get_rules(sw)['flows'].append(flow)
+
+	def add_group(self, sw, group):
+		"""
+			Add a group entry in the syntax of 'ovs-ofctl add-group'.
+		"""
+		self._get_rules(sw)['groups'].append(group)
+
+	def dump(self, rules_dir):
+		"""
+			Write the rules of every switch into rules_dir.
+			Return {sw:(group_file or None, flow_file),}.
+		"""
+		if not os.path.exists(rules_dir):
+			os.makedirs(rules_dir)
+		files = {}
+		for sw in sorted(self.rules.keys()):
+			group_file = None
+			if self.rules[sw]['groups']:
+				group_file = os.path.join(rules_dir, '%s.groups' % sw)
+				with open(group_file, 'w') as f:
+					f.write('\n'.join(self.rules[sw]['groups']) + '\n')
+			flow_file = os.path.join(rules_dir, '%s.flows' % sw)
+			with open(flow_file, 'w') as f:
+				f.write('\n'.join(self.rules[sw]['flows']) + '\n')
+			files[sw] = (group_file, flow_file)
+		return files
+
+	def load(self, rules_dir=None, processes=16):
+		"""
+			Load the rules into switches, at most 'processes' switches in parallel.
+			Groups are loaded before flows, because flows refer to them.
+			The rule files are kept in rules_dir if it is given.
+		"""
+		start = time.time()
+		tmp_dir = None
+		if rules_dir is None:
+			tmp_dir = rules_dir = tempfile.mkdtemp(prefix='rules_')
+		try:
+			files = self.dump(rules_dir)
+			cmds = []
+			for sw, (group_file, flow_file) in sorted(files.items()):
+				cmd = "ovs-ofctl add-flows %s -O OpenFlow13 %s" % (sw, flow_file)
+				if group_file:
+					cmd = "ovs-ofctl add-groups %s -O OpenFlow13 %s && %s" % (sw, group_file, cmd)
+				cmds.append(cmd)
+			run_parallel(cmds, processes)
+		finally:
+			if tmp_dir:
+				shutil.rmtree(tmp_dir, ignore_errors=True)
+		print "Loaded %d flows and %d groups into %d switches in %.2fs." % (
+			sum([len(rules['flows']) for rules in self.rules.values()]),
+			sum([len(rules['groups']) for rules in self.rules.values()]),
+			len(self.rules), time.time() - start)
+
+
+def run_parallel(cmds, processes=16):
+	"""
+		Run shell commands, at most 'processes' of them at the same time.
+		Return the list of return codes.
+	"""
+	running = []   # [(index, Popen),]
+	codes = [None] * len(cmds)
+	for i, cmd in enumerate(cmds):
+		if len(running) >= processes:
+			index, proc = running.pop(0)
+			codes[index] = proc.wait()
+		running.append((i, Popen(cmd, shell=True)))
+	for index, proc in running:
+		codes[index] = proc.wait()
+	for cmd, code in zip(cmds, codes):
+		if code:
+			print "Failed (%d): %s" % (code, cmd)
+	return codes
+
+
+def set_bridges_protocol(bridges, protocols='OpenFlow13'):
+	"""
+		Set the OpenFlow version of all the bridges in a single
+		'ovs-vsctl' transaction.
+	"""
+	if not bridges:
+		return
+	start = time.time()
+	cmd = "sudo ovs-vsctl " + " -- ".join(
+		["set bridge %s protocols=%s" % (bridge, protocols) for bridge in bridges])
+	os.system(cmd)
+	print "Set %s for %d bridges in %.2fs." % (protocols, len(bridges), time.time() - start)
@@ -16,8 +16,11 @@
 # limitations under the License.
 
 import argparse
+import multiprocessing
 import re
 import numpy as np
+
+import bwmng_reader
 import matplotlib.pyplot as plt
 from matplotlib.font_manager import FontProperties
 chinese_font = FontProperties(fname='/usr/share/matplotlib/mpl-data/fonts/ttf/simhei.ttf')
@@ -28,30 +31,11 @@ parser.add_argument('--k', dest='k', type=int, default=4, choices=[4, 8], help="
 parser.add_argument('--duration', dest='duration', type=int, default=60, help="Duration (sec) for each iperf traffic generation")
 parser.add_argument('--dir', dest='out_dir', help="Directory to store outputs")
 parser.add_argument('--fnum', dest='flows_num_per_host', type=int, default=1, help="Number of iperf flows per host")
+parser.add_argument('--no_cache', dest='no_cache', action='store_true', default=False, help="Parse bwmng.txt files without the .npz cache")
+parser.add_argument('--processes', dest='processes', type=int, default=multiprocessing.cpu_count(), help="Number of worker processes, 1 means serially")
 args = parser.parse_args()
 
 
-def read_file_1(file_name, delim=','):
-	"""
-		Read the bwmng.txt file.
-	"""
-	read_file = open(file_name, 'r')
-	lines = read_file.xreadlines()
-	lines_list = []
-	for line in lines:
-		line_list = line.strip().split(delim)
-		lines_list.append(line_list)
-	read_file.close()
-
-	# Remove the last second's statistics, because they are mostly not intact.
-	last_second = lines_list[-1][0]
-	_lines_list = lines_list[:]
-	for line in _lines_list:
-		if line[0] == last_second:
-			lines_list.remove(line)
-
-	return lines_list
-
 def read_file_2(file_name):
 	"""
 		Read the first_packets.txt and successive_packets.txt file.
@@ -69,7 +53,7 @@ def calculate_average(value_list):
 	average_value = sum(map(float, value_list)) / len(value_list)
 	return average_value
 
-def get_throughput(throughput, traffic, app, input_file):
+def get_throughput(throughput, traffic, app, run):
 	"""
 		csv output format:
 		(Type rate)
@@ -77,30 +61,28 @@ def get_throughput(throughput, traffic, app, input_file):
 		(Type svg, sum, max)
 		unix timestamp;iface_name;bytes_out;bytes_in;bytes_total;packets_out;packets_in;packets_total;errors_out;errors_in\n
 		The bwm-ng mode used is 'rate'.
+		run is the result of bwmng_reader.read_bwmng.
 
 		throughput = {
 						'stag_0.5_0.3':
 						{
-							'realtime_bisection_bw': {'BFlows':{0:x, 1:x, ..}, 'ECMP':{0:x, 1:x, ..}, ...},
-							'realtime_throughput': {'BFlows':{0:x, 1:x, ..}, 'ECMP':{0:x, 1:x, ..}, ...},
-							'accumulated_throughput': {'BFlows':{0:x, 1:x, ..}, 'ECMP':{0:x, 1:x, ..}, ...},
+							'realtime_bisection_bw': {'BFlows':array([x, x, ..]), 'ECMP':array([x, x, ..]), ...},
+							'realtime_throughput': {'BFlows':array([x, x, ..]), 'ECMP':array([x, x, ..]), ...},
+							'accumulated_throughput': {'BFlows':array([x, x, ..]), 'ECMP':array([x, x, ..]), ...},
 							'normalized_total_throughput': {'BFlows':x%, 'ECMP':x%, ...}
 						},
 						'stag_0.6_0.2':
 						{
-							'realtime_bisection_bw': {'BFlows':{0:x, 1:x, ..}, 'ECMP':{0:x, 1:x, ..}, ...},
-							'realtime_throughput': {'BFlows':{0:x, 1:x, ..}, 'ECMP':{0:x, 1:x, ..}, ...},
-							'accumulated_throughput': {'BFlows':{0:x, 1:x, ..}, 'ECMP':{0:x, 1:x, ..}, ...},
+							'realtime_bisection_bw': {'BFlows':array([x, x, ..]), 'ECMP':array([x, x, ..]), ...},
+							'realtime_throughput': {'BFlows':array([x, x, ..]), 'ECMP':array([x, x, ..]), ...},
+							'accumulated_throughput': {'BFlows':array([x, x, ..]), 'ECMP':array([x, x, ..]), ...},
 							'normalized_total_throughput': {'BFlows':x%, 'ECMP':x%, ...}
 						},
 						...
 					}
 	"""
 	full_bisection_bw = 10.0 * (args.k ** 3 / 4)   # (unit: Mbit/s)
-	lines_list = read_file_1(input_file)
-	first_second = int(lines_list[0][0])
-	column_bytes_out_rate = 2   # bytes_out/s
-	column_bytes_out = 6   # bytes_out
+	second = run['time'] - run['time'][0]
 
 	if app == 'NonBlocking':
 		switch = '1001'
@@ -122,43 +104,19 @@ def get_throughput(throughput, traffic, app, input_file):
 	if not throughput[traffic].has_key('normalized_total_throughput'):
 		throughput[traffic]['normalized_total_throughput'] = {}
 
-	if not throughput[traffic]['realtime_bisection_bw'].has_key(app):
-		throughput[traffic]['realtime_bisection_bw'][app] = {}
-	if not throughput[traffic]['realtime_throughput'].has_key(app):
-		throughput[traffic]['realtime_throughput'][app] = {}
-	if not throughput[traffic]['accumulated_throughput'].has_key(app):
-		throughput[traffic]['accumulated_throughput'][app] = {}
-	if not throughput[traffic]['normalized_total_throughput'].has_key(app):
-		throughput[traffic]['normalized_total_throughput'][app] = 0
-
-	for i in xrange(args.duration + 1):
-		if not throughput[traffic]['realtime_bisection_bw'][app].has_key(i):
-			throughput[traffic]['realtime_bisection_bw'][app][i] = 0
-		if not throughput[traffic]['realtime_throughput'][app].has_key(i):
-			throughput[traffic]['realtime_throughput'][app][i] = 0
-		if not throughput[traffic]['accumulated_throughput'][app].has_key(i):
-			throughput[traffic]['accumulated_throughput'][app][i] = 0
-
-	for row in lines_list:
-		iface_name = row[1]
-		if iface_name not in ['total', 'lo', 'eth0', 'enp0s3', 'enp0s8', 'docker0']:
-			if switch == '3[0-9][0-9][0-9]':
-				if sw.match(iface_name):
-					if int(iface_name[-1]) > args.k / 2:   # Choose down-going interfaces only.
-						if (int(row[0]) - first_second) <= args.duration:   # Take the good values only.
-							throughput[traffic]['realtime_bisection_bw'][app][int(row[0]) - first_second] += float(row[column_bytes_out_rate]) * 8.0 / (10 ** 6)   # Mbit/s
-							throughput[traffic]['realtime_throughput'][app][int(row[0]) - first_second] += float(row[column_bytes_out]) * 8.0 / (10 ** 6)   # Mbit
-			elif switch == '1001':   # Choose all the interfaces. (For NonBlocking Topo only)
-				if sw.match(iface_name):
-					if (int(row[0]) - first_second) <= args.duration:
-						throughput[traffic]['realtime_bisection_bw'][app][int(row[0]) - first_second] += float(row[column_bytes_out_rate]) * 8.0 / (10 ** 6)   # Mbit/s
-						throughput[traffic]['realtime_throughput'][app][int(row[0]) - first_second] += float(row[column_bytes_out]) * 8.0 / (10 ** 6)   # Mbit
-			else:
-				pass
-
-	for i in xrange(args.duration + 1):
-		for j in xrange(i+1):
-			throughput[traffic]['accumulated_throughput'][app][i] += throughput[traffic]['realtime_throughput'][app][j]   # Mbit
+	def is_selected(iface_name):
+		if iface_name in ['total', 'lo', 'eth0', 'enp0s3', 'enp0s8', 'docker0'] or not sw.match(iface_name):
+			return False
+		if switch == '3[0-9][0-9][0-9]':
+			return int(iface_name[-1]) > args.k / 2   # Choose down-going interfaces only.
+		return True   # Choose all the interfaces. (For NonBlocking Topo only)
+
+	mask = bwmng_reader.get_iface_mask(run, is_selected) & (second <= args.duration)   # Take the good values only.
+	realtime_bisection_bw = np.bincount(second[mask], weights=run['bytes_out_rate'][mask] * 8.0 / (10 ** 6), minlength=args.duration + 1)   # Mbit/s
+	realtime_throughput = np.bincount(second[mask], weights=run['bytes_out'][mask] * 8.0 / (10 ** 6), minlength=args.duration + 1)   # Mbit
+	throughput[traffic]['realtime_bisection_bw'][app] = realtime_bisection_bw
+	throughput[traffic]['realtime_throughput'][app] = realtime_throughput
+	throughput[traffic]['accumulated_throughput'][app] = np.cumsum(realtime_throughput)   # Mbit
 
 	throughput[traffic]['normalized_total_throughput'][app] = throughput[traffic]['accumulated_throughput'][app][args.duration] / (full_bisection_bw * args.duration)   # percentage
 
@@ -168,10 +126,7 @@ def get_value_list_1(throughput, traffic, item, app):
 	"""
 		Get the values from the "throughput" data structure.
 	"""
-	value_list = []
-	for i in xrange(args.duration + 1):
-		value_list.append(throughput[traffic][item][app][i])
-	return value_list
+	return throughput[traffic][item][app][:args.duration + 1]
 
 def get_average_bisection_bw(throughput, traffics, app, num, num_groups):
 	value_list = []
@@ -188,51 +143,45 @@ def get_value_list_2(value_dict, traffics, item, app, num, num_groups):
 		value_list.append(value_dict[traffic][item][app])
 	return value_list
 
-def get_utilization(utilization, traffic, app, input_file):
+def get_utilization(utilization, traffic, app, run):
 	"""
 		Get link utilization and link bandwidth utilization.
 	"""
-	lines_list = read_file_1(input_file)
-	first_second = int(lines_list[0][0])
-	column_packets_out = 11   # packets_out
-	column_packets_in = 10   # packets_in
-	column_bytes_out = 6   # bytes_out
-	column_bytes_in = 5   # bytes_in
+	second = run['time'] - run['time'][0]
 
 	if not utilization.has_key(traffic):
 		utilization[traffic] = {}
 	if not utilization[traffic].has_key(app):
 		utilization[traffic][app] = {}
 
-	for row in lines_list:
-		iface_name = row[1]
+	def is_selected(iface_name):
 		if iface_name.startswith('1'):
-			if (int(row[0]) - first_second) <= args.duration:   # Take the good values only.
-				if not utilization[traffic][app].has_key(iface_name):
-					utilization[traffic][app][iface_name] = {'LU_out':0, 'LU_in':0, 'LBU_out':0, 'LBU_in':0}
-				# if int(row[11]) > 2:
-				if row[6] not in ['0', '60']:
-					utilization[traffic][app][iface_name]['LU_out'] = 1
-				# if int(row[10]) > 2:
-				if row[5] not in ['0', '60']:
-					utilization[traffic][app][iface_name]['LU_in'] = 1
-				utilization[traffic][app][iface_name]['LBU_out'] += int(row[6])
-				utilization[traffic][app][iface_name]['LBU_in'] += int(row[5])
+			return True
 		elif iface_name.startswith('2'):
-			if int(iface_name[-1]) > args.k / 2:   # Choose down-going interfaces only.
-				if (int(row[0]) - first_second) <= args.duration:   # Take the good values only.
-					if not utilization[traffic][app].has_key(iface_name):
-						utilization[traffic][app][iface_name] = {'LU_out':0, 'LU_in':0, 'LBU_out':0, 'LBU_in':0}
-					# if int(row[11]) > 2:
-					if row[6] not in ['0', '60']:
-						utilization[traffic][app][iface_name]['LU_out'] = 1
-					# if int(row[10]) > 2:
-					if row[5] not in['0', '60']:
-						utilization[traffic][app][iface_name]['LU_in'] = 1
-					utilization[traffic][app][iface_name]['LBU_out'] += int(row[6])
-					utilization[traffic][app][iface_name]['LBU_in'] += int(row[5])
+			return int(iface_name[-1]) > args.k / 2   # Choose down-going interfaces only.
 		else:
-			pass
+			return False
+
+	mask = bwmng_reader.get_iface_mask(run, is_selected) & (second <= args.duration)   # Take the good values only.
+	iface = run['iface'][mask]
+	bytes_out = run['bytes_out'][mask]
+	bytes_in = run['bytes_in'][mask]
+	num = len(run['ifaces'])
+	rows = np.bincount(iface, minlength=num)
+	used_out = np.bincount(iface, weights=(bytes_out != 0) & (bytes_out != 60), minlength=num)
+	used_in = np.bincount(iface, weights=(bytes_in != 0) & (bytes_in != 60), minlength=num)
+	sum_out = np.bincount(iface, weights=bytes_out, minlength=num)
+	sum_in = np.bincount(iface, weights=bytes_in, minlength=num)
+	for i in np.nonzero(rows)[0]:
+		iface_name = run['ifaces'][i]
+		if not utilization[traffic][app].has_key(iface_name):
+			utilization[traffic][app][iface_name] = {'LU_out':0, 'LU_in':0, 'LBU_out':0, 'LBU_in':0}
+		if used_out[i]:
+			utilization[traffic][app][iface_name]['LU_out'] = 1
+		if used_in[i]:
+			utilization[traffic][app][iface_name]['LU_in'] = 1
+		utilization[traffic][app][iface_name]['LBU_out'] += int(sum_out[i])
+		utilization[traffic][app][iface_name]['LBU_in'] += int(sum_in[i])
 
 	return utilization
 
@@ -256,74 +205,34 @@ def get_value_list_3(utilization, traffic, app):
 	"""
 		Get link bandwidth utilization ratio.
 	"""
-	value_list = []
-	link_bandwidth_utilization = {}
 	utilization_list = []
-	for i in np.linspace(0, 1, 101):
-		link_bandwidth_utilization[i] = 0
-
 	for interface in utilization[traffic][app].keys():
-		ratio_out = float(utilization[traffic][app][interface]['LBU_out'] * 8) / (10 * (10 ** 6) * args.duration)
-		ratio_in = float(utilization[traffic][app][interface]['LBU_in'] * 8) / (10 * (10 ** 6) * args.duration)
-		utilization_list.append(ratio_out)
-		utilization_list.append(ratio_in)
-
-	for ratio in utilization_list:
-		for seq in link_bandwidth_utilization.keys():
-			if ratio <= seq:
-				link_bandwidth_utilization[seq] += 1
+		utilization_list.append(utilization[traffic][app][interface]['LBU_out'])
+		utilization_list.append(utilization[traffic][app][interface]['LBU_in'])
+	ratios = np.sort(np.array(utilization_list, dtype=np.float64) * 8 / (10 * (10 ** 6) * args.duration))
 
-	for seq in link_bandwidth_utilization.keys():
-		link_bandwidth_utilization[seq] = float(link_bandwidth_utilization[seq]) / len(utilization_list)
-
-	for seq in sorted(link_bandwidth_utilization.keys()):
-		value_list.append(link_bandwidth_utilization[seq])
+	# CDF: the fraction of ratios which are not greater than every seq.
+	seqs = np.linspace(0, 1, 101)
+	value_list = np.searchsorted(ratios, seqs, side='right') / float(len(ratios))
 
 	return value_list
 
-def plot_results():
+def aggregate_run(cell):
 	"""
-		Plot the results:
-		1. Plot realtime bisection bandwidth
-		2. Plot average bisection bandwidth
-		3. Plot accumulated throughput
-		4. Plot normalized total throughput
+		Get the throughput and utilization of a run, in a worker process.
+		cell = (traffic, app)
+	"""
+	traffic, app = cell
+	bwmng_file = args.out_dir + '/%s/%s/%s/bwmng.txt' % (args.flows_num_per_host, traffic, app)
+	run = bwmng_reader.load_run(bwmng_file, use_cache=not args.no_cache)
+	return (traffic, app, get_throughput({}, traffic, app, run), get_utilization({}, traffic, app, run))
 
-		throughput = {
-						'stag_0.5_0.3':
-						{
-							'realtime_bisection_bw': {'BFlows':{0:x, 1:x, ..}, 'ECMP':{0:x, 1:x, ..}, ...},
-							'realtime_throughput': {'BFlows':{0:x, 1:x, ..}, 'ECMP':{0:x, 1:x, ..}, ...},
-							'accumulated_throughput': {'BFlows':{0:x, 1:x, ..}, 'ECMP':{0:x, 1:x, ..}, ...},
-							'normalized_total_throughput': {'BFlows':x%, 'ECMP':x%, ...}
-						},
-						'stag_0.6_0.2':
-						{
-							'realtime_bisection_bw': {'BFlows':{0:x, 1:x, ..}, 'ECMP':{0:x, 1:x, ..}, ...},
-							'realtime_throughput': {'BFlows':{0:x, 1:x, ..}, 'ECMP':{0:x, 1:x, ..}, ...},
-							'accumulated_throughput': {'BFlows':{0:x, 1:x, ..}, 'ECMP':{0:x, 1:x, ..}, ...},
-							'normalized_total_throughput': {'BFlows':x%, 'ECMP':x%, ...}
-						},
-						...
-					}
+def plot_realtime_throughput(throughput, utilization, traffics, apps):
+	"""
+		Plot realtime throughput.
 	"""
 	full_bisection_bw = 10.0 * (args.k ** 3 / 4)   # (unit: Mbit/s)
-	utmost_throughput = full_bisection_bw * args.duration
-	# _traffics = "random stag_0.2_0.3 stag_0.3_0.3 stag_0.4_0.3 stag_0.5_0.3 stag_0.6_0.2 stag_0.7_0.2 stag_0.8_0.1"
-	# _traffics = "random1 random2 stag1_0.2_0.3 stag2_0.2_0.3 stag1_0.3_0.3 stag2_0.3_0.3 stag1_0.4_0.3 stag2_0.4_0.3 stag1_0.5_0.3 stag2_0.5_0.3 stag1_0.6_0.2 stag2_0.6_0.2 stag1_0.7_0.2 stag2_0.7_0.2 stag1_0.8_0.1 stag2_0.8_0.1"
-	_traffics = "random1 random2 random3 stag1_0.1_0.2 stag2_0.1_0.2 stag3_0.1_0.2 stag1_0.2_0.3 stag2_0.2_0.3 stag3_0.2_0.3 stag1_0.3_0.3 stag2_0.3_0.3 stag3_0.3_0.3 stag1_0.4_0.3 stag2_0.4_0.3 stag3_0.4_0.3 stag1_0.5_0.3 stag2_0.5_0.3 stag3_0.5_0.3 stag1_0.6_0.2 stag2_0.6_0.2 stag3_0.6_0.2 stag1_0.7_0.2 stag2_0.7_0.2 stag3_0.7_0.2 stag1_0.8_0.1 stag2_0.8_0.1 stag3_0.8_0.1"
-	traffics = _traffics.split(' ')
-	apps = ['BFlows', 'ECMP', 'PureSDN', 'Hedera', 'NonBlocking']
-	throughput = {}
-	utilization = {}
-
-	for traffic in traffics:
-		for app in apps:
-			bwmng_file = args.out_dir + '/%s/%s/%s/bwmng.txt' % (args.flows_num_per_host, traffic, app)
-			throughput = get_throughput(throughput, traffic, app, bwmng_file)
-			utilization = get_utilization(utilization, traffic, app, bwmng_file)
 
-	# 1. Plot realtime throughput.
 	item = 'realtime_bisection_bw'
 	fig = plt.figure()
 	fig.set_size_inches(20, 34)
@@ -356,8 +265,14 @@ def plot_results():
 		NO_subplot += 1
 	plt.subplots_adjust(top=0.98, bottom=0.02, left=0.1, right=0.95, hspace=0.3, wspace=0.35)
 	plt.savefig(args.out_dir + '/%s-1.realtime_throughput.png' % args.flows_num_per_host)
+	plt.close(fig)
+
+def plot_average_throughput(throughput, utilization, traffics, apps):
+	"""
+		Plot average throughput.
+	"""
+	full_bisection_bw = 10.0 * (args.k ** 3 / 4)   # (unit: Mbit/s)
 
-	# 2. Plot average throughput.
 	fig = plt.figure()
 	fig.set_size_inches(12, 15)
 	num_subplot = 3
@@ -390,8 +305,15 @@ def plot_results():
 		NO_subplot += 1
 	plt.subplots_adjust(top=0.95, bottom=0.05, left=0.1, right=0.95, hspace=0.15, wspace=0.35)
 	plt.savefig(args.out_dir + '/%s-2.average_throughput.png' % args.flows_num_per_host)
+	plt.close(fig)
+
+def plot_accumulated_throughput(throughput, utilization, traffics, apps):
+	"""
+		Plot accumulated throughput.
+	"""
+	full_bisection_bw = 10.0 * (args.k ** 3 / 4)   # (unit: Mbit/s)
+	utmost_throughput = full_bisection_bw * args.duration
 
-	# 3. Plot accumulated throughput.
 	item = 'accumulated_throughput'
 	fig = plt.figure()
 	fig.set_size_inches(20, 34)
@@ -424,8 +346,12 @@ def plot_results():
 		NO_subplot += 1
 	plt.subplots_adjust(top=0.98, bottom=0.02, left=0.1, right=0.95, hspace=0.3, wspace=0.35)
 	plt.savefig(args.out_dir + '/%s-3.accumulated_throughput.png' % args.flows_num_per_host)
+	plt.close(fig)
 
-	# 4. Plot normalized total throughput.
+def plot_normalized_total_throughput(throughput, utilization, traffics, apps):
+	"""
+		Plot normalized total throughput.
+	"""
 	item = 'normalized_total_throughput'
 	fig = plt.figure()
 	fig.set_size_inches(12, 15)
@@ -459,8 +385,12 @@ def plot_results():
 		NO_subplot += 1
 	plt.subplots_adjust(top=0.95, bottom=0.05, left=0.1, right=0.95, hspace=0.15, wspace=0.35)
 	plt.savefig(args.out_dir + '/%s-4.normalized_total_throughput.png' % args.flows_num_per_host)
+	plt.close(fig)
 
-	# 5. Plot link utilization ratio.
+def plot_link_utilization_ratio(throughput, utilization, traffics, apps):
+	"""
+		Plot link utilization ratio.
+	"""
 	fig = plt.figure()
 	fig.set_size_inches(12, 15)
 	num_subplot = 3
@@ -491,8 +421,12 @@ def plot_results():
 		NO_subplot += 1
 	plt.subplots_adjust(top=0.95, bottom=0.05, left=0.1, right=0.95, hspace=0.15, wspace=0.35)
 	plt.savefig(args.out_dir + '/%s-5.link_utilization_ratio.png' % args.flows_num_per_host)
+	plt.close(fig)
 
-	# 6. Plot link bandwidth utilization ratio.
+def plot_link_bandwidth_utilization_ratio(throughput, utilization, traffics, apps):
+	"""
+		Plot link bandwidth utilization ratio.
+	"""
 	fig = plt.figure()
 	fig.set_size_inches(20, 34)
 	num_subplot = len(traffics)
@@ -526,6 +460,69 @@ def plot_results():
 		NO_subplot += 1
 	plt.subplots_adjust(top=0.98, bottom=0.02, left=0.1, right=0.95, hspace=0.3, wspace=0.35)
 	plt.savefig(args.out_dir + '/%s-6.link_bandwidth_utilization_ratio.png' % args.flows_num_per_host)
+	plt.close(fig)
+
+def plot_results():
+	"""
+		Plot the results:
+		1. Plot realtime bisection bandwidth
+		2. Plot average bisection bandwidth
+		3. Plot accumulated throughput
+		4. Plot normalized total throughput
+
+		throughput = {
+						'stag_0.5_0.3':
+						{
+							'realtime_bisection_bw': {'BFlows':array([x, x, ..]), 'ECMP':array([x, x, ..]), ...},
+							'realtime_throughput': {'BFlows':array([x, x, ..]), 'ECMP':array([x, x, ..]), ...},
+							'accumulated_throughput': {'BFlows':array([x, x, ..]), 'ECMP':array([x, x, ..]), ...},
+							'normalized_total_throughput': {'BFlows':x%, 'ECMP':x%, ...}
+						},
+						'stag_0.6_0.2':
+						{
+							'realtime_bisection_bw': {'BFlows':array([x, x, ..]), 'ECMP':array([x, x, ..]), ...},
+							'realtime_throughput': {'BFlows':array([x, x, ..]), 'ECMP':array([x, x, ..]), ...},
+							'accumulated_throughput': {'BFlows':array([x, x, ..]), 'ECMP':array([x, x, ..]), ...},
+							'normalized_total_throughput': {'BFlows':x%, 'ECMP':x%, ...}
+						},
+						...
+					}
+	"""
+	# _traffics = "random stag_0.2_0.3 stag_0.3_0.3 stag_0.4_0.3 stag_0.5_0.3 stag_0.6_0.2 stag_0.7_0.2 stag_0.8_0.1"
+	# _traffics = "random1 random2 stag1_0.2_0.3 stag2_0.2_0.3 stag1_0.3_0.3 stag2_0.3_0.3 stag1_0.4_0.3 stag2_0.4_0.3 stag1_0.5_0.3 stag2_0.5_0.3 stag1_0.6_0.2 stag2_0.6_0.2 stag1_0.7_0.2 stag2_0.7_0.2 stag1_0.8_0.1 stag2_0.8_0.1"
+	_traffics = "random1 random2 random3 stag1_0.1_0.2 stag2_0.1_0.2 stag3_0.1_0.2 stag1_0.2_0.3 stag2_0.2_0.3 stag3_0.2_0.3 stag1_0.3_0.3 stag2_0.3_0.3 stag3_0.3_0.3 stag1_0.4_0.3 stag2_0.4_0.3 stag3_0.4_0.3 stag1_0.5_0.3 stag2_0.5_0.3 stag3_0.5_0.3 stag1_0.6_0.2 stag2_0.6_0.2 stag3_0.6_0.2 stag1_0.7_0.2 stag2_0.7_0.2 stag3_0.7_0.2 stag1_0.8_0.1 stag2_0.8_0.1 stag3_0.8_0.1"
+	traffics = _traffics.split(' ')
+	apps = ['BFlows', 'ECMP', 'PureSDN', 'Hedera', 'NonBlocking']
+	throughput = {}
+	utilization = {}
+
+	pool = None
+	if args.processes > 1:
+		pool = multiprocessing.Pool(args.processes)
+
+	# Aggregate the runs.
+	cells = [(traffic, app) for traffic in traffics for app in apps]
+	if pool:
+		results = pool.map(aggregate_run, cells)
+	else:
+		results = map(aggregate_run, cells)
+	for traffic, app, _throughput, _utilization in results:
+		for item in _throughput[traffic].keys():
+			throughput.setdefault(traffic, {}).setdefault(item, {})[app] = _throughput[traffic][item][app]
+		utilization.setdefault(traffic, {})[app] = _utilization[traffic][app]
+
+	# Plot the figures.
+	plots = [plot_realtime_throughput, plot_average_throughput, plot_accumulated_throughput,
+			 plot_normalized_total_throughput, plot_link_utilization_ratio, plot_link_bandwidth_utilization_ratio]
+	if pool:
+		tasks = [pool.apply_async(plot, (throughput, utilization, traffics, apps)) for plot in plots]
+		for task in tasks:
+			task.get()
+		pool.close()
+		pool.join()
+	else:
+		for plot in plots:
+			plot(throughput, utilization, traffics, apps)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,146 @@
+# Copyright (C) 2016 Huang MaChi at Chongqing University
+# of Posts and Telecommunications, Chongqing, China.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+import sys
+import threading
+import time
+
+import net_sampler
+
+
+# Logged by network_awareness.py every time it has computed the paths.
+TOPOLOGY_PATTERN = re.compile(r'\[TOPOLOGY READY\] switches=(\d+) links=(\d+) pairs=(\d+)')
+SWITCH_IFACE_PATTERN = net_sampler.SWITCH_IFACE_PATTERN
+
+
+def wait_until(predicate, timeout, interval=0.2):
+	"""
+		Poll predicate until it is true, but no longer than timeout seconds.
+		Return (ready, waited_seconds).
+	"""
+	start = time.time()
+	while True:
+		if predicate():
+			return (True, time.time() - start)
+		if time.time() - start >= timeout:
+			return (False, time.time() - start)
+		time.sleep(interval)
+
+
+def report(phase, ready, waited):
+	print "[%s] %s in %.1fs." % ('READY' if ready else 'TIMEOUT', phase, waited)
+
+
+class ControllerWatcher(object):
+	"""
+		Echo the output of the controller, and keep the latest
+		topology it has reported.
+		The controller must be started with stdout=PIPE and stderr=STDOUT.
+	"""
+	def __init__(self, proc):
+		self.proc = proc
+		self.topology = (0, 0, 0)   # (switches, links, pairs)
+		self.thread = threading.Thread(target=self._read)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def _read(self):
+		for line in iter(self.proc.stdout.readline, ''):
+			sys.stdout.write(line)
+			match = TOPOLOGY_PATTERN.search(line)
+			if match:
+				self.topology = tuple([int(n) for n in match.groups()])
+
+	def wait_topology(self, switches, links, timeout):
+		"""
+			Wait until the controller has discovered all the switches and
+			directed links, and has got the paths of all the switch pairs.
+		"""
+		expected = (switches, links, switches * (switches - 1))
+		ready, waited = wait_until(
+			lambda: all([got >= want for got, want in zip(self.topology, expected)]),
+			timeout, interval=0.5)
+		report("Topology %s of %s" % (self.topology, expected), ready, waited)
+		return ready
+
+
+def get_switch_links(topo):
+	"""
+		Get the number of directed links between switches of a Mininet Topo,
+		which is the number of links the controller should discover.
+	"""
+	return 2 * len([link for link in topo.links() if topo.isSwitch(link[0]) and topo.isSwitch(link[1])])
+
+
+def is_listening(host, port=5001):
+	return re.search(r':%d\s' % port, host.cmd("ss -ltn")) is not None
+
+
+def wait_servers(hosts, port=5001, timeout=3):
+	"""
+		Wait until the iperf servers on hosts are listening.
+	"""
+	pending = list(hosts)
+	def _ready():
+		pending[:] = [host for host in pending if not is_listening(host, port)]
+		return not pending
+	ready, waited = wait_until(_ready, timeout)
+	report("%d servers listening" % len(hosts), ready, waited)
+	return ready
+
+
+def wait_connected(client, server_ip, connections=1, port=5001, timeout=2):
+	"""
+		Wait until client has got 'connections' established connections
+		to the iperf server at server_ip.
+	"""
+	peer = re.compile(r'\s%s:%d(?=\s|$)' % (re.escape(server_ip), port), re.M)
+	ready, waited = wait_until(
+		lambda: len(peer.findall(client.cmd("ss -tn state established"))) >= connections,
+		timeout, interval=0.05)
+	if not ready:
+		report("%s connecting to %s" % (client.name, server_ip), ready, waited)
+	return ready
+
+
+def read_tx_bytes(pattern=SWITCH_IFACE_PATTERN):
+	"""
+		Get the total transmitted bytes of the interfaces matching pattern
+		from /proc/net/dev.
+	"""
+	return sum([counters[1] for counters in net_sampler.read_counters(pattern).values()])
+
+
+def wait_rates_stable(timeout=10, interval=1.0, samples=3, tolerance=0.05, pattern=SWITCH_IFACE_PATTERN):
+	"""
+		Wait until the total transmitting rate of switches has become stable,
+		i.e. the last 'samples' rates differ by no more than 'tolerance'.
+	"""
+	rates = []
+	last = [time.time(), read_tx_bytes(pattern)]
+	def _stable():
+		now, tx_bytes = time.time(), read_tx_bytes(pattern)
+		if now > last[0]:
+			rates.append((tx_bytes - last[1]) / (now - last[0]))
+		last[:] = [now, tx_bytes]
+		recent = rates[-samples:]
+		return len(recent) == samples and min(recent) > 0 and \
+			max(recent) - min(recent) <= tolerance * max(recent)
+	time.sleep(interval)
+	ready, waited = wait_until(_stable, timeout - interval, interval=interval)
+	report("Rates stable", ready, waited + interval)
+	return ready
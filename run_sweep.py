@@ -0,0 +1,262 @@
+# Copyright (C) 2016 Huang MaChi at Chongqing University
+# of Posts and Telecommunications, Chongqing, China.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import subprocess
+import time
+
+
+TRAFFICS = "random1 random2 random3 stag1_0.1_0.2 stag2_0.1_0.2 stag3_0.1_0.2 stag1_0.2_0.3 stag2_0.2_0.3 stag3_0.2_0.3 stag1_0.3_0.3 stag2_0.3_0.3 stag3_0.3_0.3 stag1_0.4_0.3 stag2_0.4_0.3 stag3_0.4_0.3 stag1_0.5_0.3 stag2_0.5_0.3 stag3_0.5_0.3 stag1_0.6_0.2 stag2_0.6_0.2 stag3_0.6_0.2 stag1_0.7_0.2 stag2_0.7_0.2 stag3_0.7_0.2 stag1_0.8_0.1 stag2_0.8_0.1 stag3_0.8_0.1"
+APPS = "BFlows ECMP PureSDN Hedera NonBlocking"
+APP_SCRIPTS = {'BFlows': './BFlows/fattree.py',
+			   'ECMP': './ECMP/fattree.py',
+			   'PureSDN': './PureSDN/fattree.py',
+			   'Hedera': './Hedera/fattree.py',
+			   'NonBlocking': './NonBlocking/NonBlocking.py'}
+
+parser = argparse.ArgumentParser(description="Run BFlows experiments in parallel")
+parser.add_argument('--k', dest='k', type=int, default=4, choices=[4, 8], help="Switch fanout number")
+parser.add_argument('--cpu', dest='cpu', type=float, default=1.0, help='Total CPU to allocate to hosts of an experiment')
+parser.add_argument('--fnum', dest='flows_num_per_host', type=int, default=1, help="Run the trials of 1 to fnum iperf flows per host")
+parser.add_argument('--duration', dest='duration', type=int, default=60, help="Duration (sec) for each iperf traffic generation")
+parser.add_argument('--dir', dest='out_dir', default='./results', help="Directory to store outputs")
+parser.add_argument('--traffics', dest='traffics', default=TRAFFICS, help="Traffic patterns to run, separated by spaces")
+parser.add_argument('--apps', dest='apps', default=APPS, help="Applications to run, separated by spaces")
+parser.add_argument('--jobs', dest='jobs', type=int, default=0, help="Number of concurrent experiments, 0 means according to the CPUs")
+parser.add_argument('--port', dest='port', type=int, default=6653, help="OpenFlow port of the controller of the first job")
+parser.add_argument('--shard', dest='shard', default='1/1', help="Run the i-th of n shards of the cells, as 'i/n'")
+parser.add_argument('--force', dest='force', action='store_true', default=False, help="Run the cells completed by earlier sweeps again")
+parser.add_argument('--ovs_ctl', dest='ovs_ctl', default='/usr/share/openvswitch/scripts/ovs-ctl', help="Path of the ovs-ctl script")
+args = parser.parse_args()
+
+MANIFEST = 'manifest.json'
+OUTPUTS = ['bwmng.txt']   # Outputs of an experiment checked by the manifest.
+
+
+# Every experiment runs in its own network, mount and PID namespaces, with a
+# private Open vSwitch whose database and sockets live on tmpfs, so that the
+# bridges, interfaces and processes of concurrent experiments never collide.
+NAMESPACE_SCRIPT = """
+set -e
+ip link set lo up
+for dir in /var/run/openvswitch /etc/openvswitch /var/log/openvswitch; do
+	mkdir -p $dir
+	mount -t tmpfs tmpfs $dir
+done
+%(ovs_ctl)s start --system-id=random > /dev/null
+set +e
+%(cmd)s
+code=$?
+%(ovs_ctl)s stop > /dev/null
+exit $code
+"""
+
+
+def get_jobs():
+	"""
+		Get the number of concurrent experiments. Every experiment needs
+		its hosts' CPU and about one more CPU for the controller and switches.
+	"""
+	if args.jobs > 0:
+		return args.jobs
+	return max(1, int(multiprocessing.cpu_count() / (args.cpu + 1)))
+
+def get_shard():
+	"""
+		Parse --shard 'i/n' into (i, n), 1 <= i <= n.
+	"""
+	try:
+		index, count = [int(n) for n in args.shard.split('/')]
+	except ValueError:
+		parser.error("--shard should be like '1/3'")
+	if not 1 <= index <= count:
+		parser.error("--shard should be like '1/3'")
+	return (index, count)
+
+def create_cells():
+	"""
+		Create the cells of the sweep, in the order of run_experiment.sh.
+		Only the cells of our shard are kept. Shards are taken from
+		the whole sweep, so they stay disjoint however much is done.
+		cells = [(fnum, traffic, app),]
+	"""
+	cells = []
+	for fnum in xrange(1, args.flows_num_per_host + 1):
+		for traffic in args.traffics.split():
+			for app in args.apps.split():
+				cells.append((fnum, traffic, app))
+	index, count = get_shard()
+	return cells[index - 1::count]
+
+def get_out_dir(cell):
+	fnum, traffic, app = cell
+	return os.path.join(args.out_dir, str(fnum), traffic, app)
+
+def get_params():
+	"""
+		Parameters which the outputs of a cell depend on,
+		besides the cell itself.
+	"""
+	return {'k': args.k, 'cpu': args.cpu, 'duration': args.duration}
+
+def get_checksum(file_name):
+	sha1 = hashlib.sha1()
+	with open(file_name, 'rb') as f:
+		for chunk in iter(lambda: f.read(1 << 20), ''):
+			sha1.update(chunk)
+	return sha1.hexdigest()
+
+def load_manifest():
+	"""
+		Load the cells completed by earlier sweeps.
+		Every line of the manifest records a completed cell:
+		{"cell": [fnum, traffic, app], "params": {...}, "outputs": {file_name:sha1,}, "seconds": ...}
+		manifest = {(fnum, traffic, app):record,}
+	"""
+	manifest = {}
+	manifest_file = os.path.join(args.out_dir, MANIFEST)
+	if not os.path.exists(manifest_file):
+		return manifest
+	with open(manifest_file, 'r') as f:
+		for line in f:
+			try:
+				record = json.loads(line)
+			except ValueError:
+				continue   # The last line may be broken off by a crash.
+			manifest[tuple(record['cell'])] = record
+	return manifest
+
+def is_completed(cell, manifest):
+	"""
+		A cell is completed if it's recorded with the same parameters,
+		and its outputs are still there with the recorded checksums.
+	"""
+	record = manifest.get(cell)
+	if record is None or record['params'] != get_params():
+		return False
+	out_dir = get_out_dir(cell)
+	for name, checksum in record['outputs'].items():
+		file_name = os.path.join(out_dir, name)
+		if not os.path.exists(file_name) or get_checksum(file_name) != checksum:
+			return False
+	return True
+
+def record_completed(cell, seconds):
+	"""
+		Append the completed cell to the manifest, if all its outputs are there.
+		Every record is a single line, appended and flushed at once,
+		so that concurrent shards can share the manifest.
+	"""
+	out_dir = get_out_dir(cell)
+	outputs = {}
+	for name in OUTPUTS:
+		file_name = os.path.join(out_dir, name)
+		if not os.path.exists(file_name) or not os.path.getsize(file_name):
+			return False
+		outputs[name] = get_checksum(file_name)
+	record = {'cell': list(cell), 'params': get_params(), 'outputs': outputs, 'seconds': round(seconds, 1)}
+	with open(os.path.join(args.out_dir, MANIFEST), 'a') as f:
+		f.write(json.dumps(record, sort_keys=True) + '\n')
+	return True
+
+def get_peers_file(fnum, traffic):
+	"""
+		All the applications of a traffic share the same iperf peers.
+	"""
+	return os.path.join(args.out_dir, str(fnum), traffic, 'iperf_peers.py')
+
+def create_peers(fnum, traffic):
+	peers_file = get_peers_file(fnum, traffic)
+	if not os.path.exists(peers_file):
+		if not os.path.exists(os.path.dirname(peers_file)):
+			os.makedirs(os.path.dirname(peers_file))
+		subprocess.check_call(['python', './create_peers.py', '--k', str(args.k), '--traffic', traffic,
+							   '--fnum', str(fnum), '--out', peers_file])
+	return peers_file
+
+def start_experiment(cell, port):
+	"""
+		Start an experiment in new namespaces, its output goes to experiment.log.
+	"""
+	fnum, traffic, app = cell
+	peers_file = create_peers(fnum, traffic)
+	out_dir = get_out_dir(cell)
+	if not os.path.exists(out_dir):
+		os.makedirs(out_dir)
+	cmd = "python %s --k %d --duration %d --dir %s --cpu %s --ip 127.0.0.1 --port %d --peers %s" % (
+		APP_SCRIPTS[app], args.k, args.duration, out_dir, args.cpu, port, peers_file)
+	log = open(os.path.join(out_dir, 'experiment.log'), 'w')
+	proc = subprocess.Popen(['unshare', '--net', '--mount', '--pid', '--fork', '--mount-proc',
+							 'sh', '-c', NAMESPACE_SCRIPT % {'ovs_ctl': args.ovs_ctl, 'cmd': cmd}],
+							stdout=log, stderr=subprocess.STDOUT, preexec_fn=os.setsid)
+	log.close()
+	return proc
+
+def run_sweep():
+	"""
+		Run the cells with at most 'jobs' experiments at the same time.
+		Every running experiment owns a distinct controller port.
+		Cells completed by earlier sweeps are skipped, unless --force is given.
+	"""
+	cells = create_cells()
+	if not os.path.exists(args.out_dir):
+		os.makedirs(args.out_dir)
+	if not args.force:
+		manifest = load_manifest()
+		completed = [cell for cell in cells if is_completed(cell, manifest)]
+		cells = [cell for cell in cells if cell not in completed]
+		print "Skipping %d completed experiments." % len(completed)
+	jobs = get_jobs()
+	free_ports = [args.port + i for i in xrange(jobs)]
+	running = {}   # {Popen:(cell, port, start_time),}
+	failed = []
+	start = time.time()
+	print "Running %d experiments of shard %s, %d at a time." % (len(cells), args.shard, jobs)
+	try:
+		while cells or running:
+			while cells and free_ports:
+				cell = cells.pop(0)
+				port = free_ports.pop(0)
+				running[start_experiment(cell, port)] = (cell, port, time.time())
+				print "[START] %s/%s/%s on port %d" % (cell + (port,))
+			time.sleep(1)
+			for proc in running.keys():
+				if proc.poll() is None:
+					continue
+				cell, port, started = running.pop(proc)
+				free_ports.append(port)
+				done = not proc.returncode and record_completed(cell, time.time() - started)
+				if not done:
+					failed.append(cell)
+				print "[%s] %s/%s/%s in %.0fs" % (('DONE' if done else 'FAIL',) + cell + (time.time() - started,))
+	finally:
+		# Killing the first process of a PID namespace kills all the others.
+		for proc in running.keys():
+			os.killpg(proc.pid, signal.SIGKILL)
+	print "Finished in %.0fs, %d failed: %s" % (time.time() - start, len(failed), failed)
+
+
+if __name__ == '__main__':
+	if os.getuid() != 0:
+		logging.warning("You are NOT root!")
+	else:
+		run_sweep()